@@ -8,42 +8,587 @@
 # boots ./bootstrap.yml --simulate ./simulated_disk.img --sim_size 10G -osim partition
 # boots ./bootstrap.yml --set usb_multiboot mount
 
+from __future__ import annotations
+import time
+# Reported with '--profile_startup'
+module_load_start_time: float = time.perf_counter()
+
+import contextvars
 from io import TextIOWrapper
-import json
 import os
 import stat
-from string import Formatter
+import struct
 import sys
-import time
+import threading
 from typing import Any, TypedDict
 import shutil
 import atexit
 
+# Deferred until needed to keep startup fast (see '--profile_startup'):
+# json, subprocess, string.Formatter, yaml, requests
+
 # ------------------------ Common functions -------------------------
 
 
-def load_yml_config(source_path: str) -> dict[str, Any]:
+def get_cache_dir() -> str:
+    cache_home: str = os.environ.get('XDG_CACHE_HOME', None) or os.path.expanduser('~/.cache')
+    return os.path.join(cache_home, 'bootstrap_system_disk')
+
+
+def parse_yml_text(yml_text: str) -> dict[str, Any]:
     import yaml
+    # libyaml based loader is much faster on large configs, pure python loader as fallback
+    safe_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(yml_text, Loader=safe_loader)
+
+
+def load_cached_yml_config(
+    source_path: str,
+    cache_dir: str,
+) -> dict[str, Any]:
+    """
+    Parsed configs are pickled to '<cache_dir>/<hash of path>.pickle' together with mtime, size and content hash.
+    Unchanged mtime + size -> the file is not even read, changed mtime but same content -> not parsed again.
+    """
+    import hashlib
+    import pickle
+
+    real_source_path: str = os.path.realpath(source_path)
+    cache_path: str = os.path.join(cache_dir, hashlib.sha256(real_source_path.encode()).hexdigest()[:32] + '.pickle')
+    source_stat: os.stat_result = os.stat(real_source_path)
+
+    cached_entry: dict[str, Any] | None = None
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as cache_fd:
+                cached_entry = pickle.load(cache_fd)
+        except Exception as e:
+            print(f"Ignoring unreadable config cache {cache_path}: {e}")
+
+    if cached_entry and cached_entry['mtime_ns'] == source_stat.st_mtime_ns and cached_entry['size'] == source_stat.st_size:
+        return cached_entry['config']
+
+    with open(real_source_path, 'rb') as file:
+        source_bytes: bytes = file.read()
+    content_hash: str = hashlib.sha256(source_bytes).hexdigest()
+
+    if cached_entry and cached_entry['sha256'] == content_hash:
+        parsed_config: dict[str, Any] = cached_entry['config']
+    else:
+        parsed_config = parse_yml_text(source_bytes.decode())
+
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_cache_path: str = f"{cache_path}.{os.getpid()}.partial"
+    with open(temp_cache_path, 'wb') as cache_fd:
+        pickle.dump({
+            'mtime_ns': source_stat.st_mtime_ns,
+            'size': source_stat.st_size,
+            'sha256': content_hash,
+            'config': parsed_config,
+        }, cache_fd, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_cache_path, cache_path)
+
+    return parsed_config
+
+
+def load_yml_config(
+    source_path: str,
+    cache_dir: str | None = None,
+) -> dict[str, Any]:
     try:
+        if cache_dir:
+            return load_cached_yml_config(source_path, cache_dir)
+
         with open(source_path, 'r') as file:
-            return yaml.safe_load(file)
+            return parse_yml_text(file.read())
     except Exception as e:
         print(f"Error loading YAML file {source_path}: {e}")
         sys.exit(1)
 
 
+# ------------------------ Executing commands -------------------------
+
+
+class CommandResult(TypedDict):
+    cmd: str
+    returncode: int
+    stdout: str
+    stderr: str
+    duration: float
+    stage: str
+    timed_out: bool
+
+
+# Stage the executing thread is working for -> used for grouping command timings
+current_stage_key: contextvars.ContextVar[str] = contextvars.ContextVar('current_stage_key', default='-')
+command_results: list[CommandResult] = []
+command_results_lock = threading.Lock()
+
+
+def exec_cmd(
+    cmd: str | list[str],
+    capture: bool = True,
+    timeout: float | None = None,
+    check: bool = False,
+    input_text: str | None = None,
+) -> CommandResult:
+    """
+    Run a command through subprocess and return its exit code, output and wall time.
+    argv lists are executed directly, strings through the shell (pipes, redirects, '||').
+    """
+    import subprocess
+    cmd_str: str = cmd if isinstance(cmd, str) else ' '.join(cmd)
+
+    # Non captured commands are actions (run_cmd, cleanup) -> only recorded while planning
+    if active_plan and not capture:
+        active_plan.record(cmd_str)
+        return {'cmd': cmd_str, 'returncode': 0, 'stdout': '', 'stderr': '', 'duration': 0.0, 'stage': current_stage_key.get(), 'timed_out': False}
+
+    start_time: float = time.monotonic()
+    timed_out: bool = False
+    try:
+        completed = subprocess.run(
+            cmd,
+            shell=isinstance(cmd, str),
+            capture_output=capture,
+            text=True,
+            timeout=timeout,
+            input=input_text
+        )
+        returncode: int = completed.returncode
+        stdout: str = completed.stdout or ''
+        stderr: str = completed.stderr or ''
+    except subprocess.TimeoutExpired as e:
+        timed_out = True
+        returncode = -1
+        stdout = e.stdout.decode() if isinstance(e.stdout, bytes) else (e.stdout or '')
+        stderr = e.stderr.decode() if isinstance(e.stderr, bytes) else (e.stderr or '')
+    except FileNotFoundError as e:
+        returncode = 127
+        stdout = ''
+        stderr = str(e)
+
+    result: CommandResult = {
+        'cmd': cmd_str,
+        'returncode': returncode,
+        'stdout': stdout,
+        'stderr': stderr,
+        'duration': time.monotonic() - start_time,
+        'stage': current_stage_key.get(),
+        'timed_out': timed_out,
+    }
+    with command_results_lock:
+        command_results.append(result)
+
+    if changes_block_topology(cmd_str):
+        invalidate_block_topology()
+
+    if check and returncode != 0:
+        reason: str = f"timed out after {timeout}s" if timed_out else f"exited with code {returncode}"
+        raise ValueError(f"Command '{cmd_str}' {reason}: {stderr.strip()} -> exiting")
+
+    return result
+
+
+def exec_output(
+    cmd: str | list[str],
+    timeout: float | None = None,
+) -> str:
+    return exec_cmd(cmd, timeout=timeout)['stdout'].strip()
+
+
+def exec_cmds_concurrently(
+    cmds: list[str | list[str]],
+    max_workers: int | None = None,
+    capture: bool = True,
+    timeout: float | None = None,
+) -> list[CommandResult]:
+    """
+    Run independent commands concurrently, results are returned in the order of 'cmds'.
+    """
+    if not cmds:
+        return []
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max_workers or len(cmds), thread_name_prefix='cmd') as executor:
+        cmd_futures = [
+            executor.submit(contextvars.copy_context().run, exec_cmd, cmd, capture=capture, timeout=timeout)
+            for cmd in cmds
+        ]
+        return [future.result() for future in cmd_futures]
+
+
+def print_command_timing_summary(
+    stage_durations: dict[str, float] = {},
+) -> None:
+    with command_results_lock:
+        results: list[CommandResult] = list(command_results)
+
+    if not results and not stage_durations:
+        return
+
+    stage_summaries: dict[str, dict[str, Any]] = {}
+    for stage_key, duration in stage_durations.items():
+        stage_summaries[stage_key] = {'wall': duration, 'commands': 0, 'failed': 0, 'cmd_time': 0.0, 'slowest': None}
+
+    for result in results:
+        summary = stage_summaries.setdefault(result['stage'], {'wall': None, 'commands': 0, 'failed': 0, 'cmd_time': 0.0, 'slowest': None})
+        summary['commands'] += 1
+        summary['cmd_time'] += result['duration']
+        if result['returncode'] != 0:
+            summary['failed'] += 1
+        if not summary['slowest'] or result['duration'] > summary['slowest']['duration']:
+            summary['slowest'] = result
+
+    print("---------------------- Timing summary ----------------------")
+    for stage_key, summary in stage_summaries.items():
+        wall_str: str = f"{summary['wall']:.2f}s" if summary['wall'] is not None else '-'
+        print(f"Stage '{stage_key}': wall {wall_str}, {summary['commands']} commands ({summary['failed']} failed) in {summary['cmd_time']:.2f}s")
+        if summary['slowest']:
+            print(f"    slowest: {summary['slowest']['duration']:.2f}s -> {summary['slowest']['cmd'][:120]}")
+    print("------------------------------------------------------------")
+
+
+# ------------------------ Planning (dry-run) -------------------------
+# With '--plan <script>' every stage runs against a modelled device: state changing commands are only
+# recorded (in memory, with estimated duration and bytes written), read-only queries are answered
+# by the real system or the device model (see 'plan_partition_model'). The plan is written once at the end
+# as executable script + '<script>.json'. Estimates are rough and meant for scheduling, not for accuracy
+
+plan_fixed_seconds: dict[str, float] = {
+    'sfdisk': 1.0,
+    'partprobe': 0.5,
+    'luksFormat': 3.0,
+    'luksOpen': 2.0,
+    'luksClose': 0.2,
+    'losetup': 0.1,
+    'umount': 0.1,
+    'mount': 0.05,
+    'btrfs subvolume': 0.05,
+    'btrfs property': 0.02,
+    'chattr': 0.01,
+    'fallocate': 0.05,
+    'mkswap': 0.2,
+}
+# (seconds per GiB of device size, fraction of device size written as metadata)
+plan_mkfs_costs: dict[str, tuple[float, float]] = {
+    'mkfs.ext4': (0.4, 0.002),
+    'mkfs.btrfs': (0.02, 0.0001),
+    'mkfs.vfat': (0.3, 0.001),
+    'mkfs.ntfs': (0.2, 0.001),
+}
+plan_install_download_bytes: dict[str, int] = {
+    'pacstrap': 600 * 1024 ** 2,
+    'debootstrap': 300 * 1024 ** 2,
+}
+
+
+class CommandPlan:
+
+    def __init__(self, plan_path: str, bandwidth_mb_s: float = 10.0):
+        self.plan_path: str = os.path.realpath(plan_path)
+        self.bandwidth_mb_s: float = bandwidth_mb_s
+        self.entries: list[dict[str, Any]] = []
+        self.topology: BlockTopology | None = None
+        self.device_sizes: dict[str, int] = {}
+        self.subvolumes: dict[str, list[str]] = {}
+        self.lock = threading.Lock()
+
+    def record(
+        self,
+        line: str,
+        kind: str = 'cmd',
+        estimate: dict[str, float] | None = None,
+    ) -> None:
+        entry: dict[str, Any] = {'kind': kind, 'line': line, 'stage': current_stage_key.get()}
+        if kind == 'cmd':
+            entry.update(estimate or self.estimate(line))
+        with self.lock:
+            self.entries.append(entry)
+
+    def get_device_size(self, cmd: str) -> int:
+        for device_path, size_bytes in self.device_sizes.items():
+            if device_path in cmd:
+                return size_bytes
+        return 0
+
+    def estimate(self, cmd: str) -> dict[str, float]:
+        for mkfs_program, (seconds_per_gib, metadata_fraction) in plan_mkfs_costs.items():
+            if mkfs_program in cmd:
+                size_bytes: int = self.get_device_size(cmd)
+                return {
+                    'estimated_seconds': 0.5 + seconds_per_gib * size_bytes / 1024 ** 3,
+                    'estimated_bytes': int(metadata_fraction * size_bytes),
+                }
+
+        for program, seconds in plan_fixed_seconds.items():
+            if program in cmd:
+                # luks2 header + keyslot area
+                written_bytes: int = 16 * 1024 ** 2 if program == 'luksFormat' else 0
+                return {'estimated_seconds': seconds, 'estimated_bytes': written_bytes}
+
+        return {'estimated_seconds': 0.01, 'estimated_bytes': 0}
+
+    def estimate_download(self, download_bytes: int) -> dict[str, float]:
+        return {
+            'estimated_seconds': download_bytes / (self.bandwidth_mb_s * 1024 ** 2) * 1.5,
+            'estimated_bytes': download_bytes * 3,
+            'download_bytes': download_bytes,
+        }
+
+    def flush(self) -> None:
+        import json
+
+        with self.lock:
+            entries: list[dict[str, Any]] = list(self.entries)
+
+        script_lines: list[str] = [
+            "#! /bin/bash",
+            "# This script was generated by the bootstrap_system_disk.py script (--plan)",
+            "# It contains commands to bootstrap the system disk as defined in the configuration file",
+            "",
+        ]
+        stage_totals: dict[str, dict[str, float]] = {}
+        previous_stage: str | None = None
+        for entry in entries:
+            # Messages outside of stages ('-') stay with the previous section
+            if entry['stage'] != previous_stage and entry['stage'] != '-':
+                script_lines.append(f"\n# ---------------- Stage '{entry['stage']}' ----------------")
+                previous_stage = entry['stage']
+            if entry['kind'] == 'comment':
+                script_lines.append(f"# {entry['line']}")
+                continue
+
+            script_lines.append(entry['line'])
+            if entry['kind'] == 'cmd':
+                stage_total = stage_totals.setdefault(entry['stage'], {'estimated_seconds': 0.0, 'estimated_bytes': 0})
+                stage_total['estimated_seconds'] += entry['estimated_seconds']
+                stage_total['estimated_bytes'] += entry['estimated_bytes']
+
+        with open(self.plan_path, 'w') as plan_fd:
+            plan_fd.write('\n'.join(script_lines) + '\n')
+        os.chmod(self.plan_path, 0o755)
+
+        commands: list[dict[str, Any]] = [entry for entry in entries if entry['kind'] == 'cmd']
+        json_plan: dict[str, Any] = {
+            'script': self.plan_path,
+            'estimated_seconds': sum(entry['estimated_seconds'] for entry in commands),
+            'estimated_bytes': sum(entry['estimated_bytes'] for entry in commands),
+            'stages': stage_totals,
+            'commands': [{'index': index, **entry} for index, entry in enumerate(commands)],
+        }
+        json_plan_path: str = os.path.splitext(self.plan_path)[0] + '.json'
+        with open(json_plan_path, 'w') as json_fd:
+            json.dump(json_plan, json_fd, indent=2)
+
+        print(f"Wrote plan with {len(commands)} commands to {self.plan_path} and {json_plan_path}")
+        for stage_key, stage_total in stage_totals.items():
+            print(f"Stage '{stage_key}': ~{stage_total['estimated_seconds']:.1f}s, ~{stage_total['estimated_bytes'] / 1024 ** 2:.1f} MiB written")
+        print(f"Total: ~{json_plan['estimated_seconds']:.1f}s, ~{json_plan['estimated_bytes'] / 1024 ** 2:.1f} MiB written")
+
+
+active_plan: CommandPlan | None = None
+plan_luks_passphrase: str = '${LUKS_PASSPHRASE:?}'
+
+
+def is_planning() -> bool:
+    return active_plan is not None
+
+
+def get_partition_device_path(
+    device_path: str,
+    number: int,
+) -> str:
+    # nvme0n1 -> nvme0n1p1, loop0 -> loop0p1, sda -> sda1
+    separator: str = 'p' if device_path[-1].isdigit() else ''
+    return f"{device_path}{separator}{number}"
+
+
+def get_device_size_bytes(
+    device_path: str,
+    default: int = 0,
+) -> int:
+    device_name: str = os.path.basename(os.path.realpath(device_path))
+    sys_size_path: str = f"/sys/class/block/{device_name}/size"
+    if os.path.exists(sys_size_path):
+        with open(sys_size_path, 'r') as fd:
+            return int(fd.read().strip()) * 512
+    if os.path.isfile(device_path):
+        return os.path.getsize(device_path)
+    return default
+
+
+def plan_partition_model(
+    target_device: str,
+    part_definitions: dict[str, Any],
+    variables: dict[str, Any] = {},
+    config: dict[str, Any] = {},
+) -> list[str]:
+    """
+    Model the state of 'target_device' after the partitions stage -> later planned stages
+    (formatting, chroot mounting) see partitions, filesystems, LUKS mappings and subvolumes.
+    """
+    sector_size: int = int(variables.get('sector_size', None) or get_device_sector_size(target_device))
+    default_size: int = parse_sector_count(config.get('sim_size', None) or '10G', 1)
+    total_sectors: int = get_device_size_bytes(target_device, default=default_size) // sector_size
+    layout: list[dict[str, Any]] = build_gpt_layout(part_definitions, total_sectors, sector_size=sector_size)
+
+    device_name: str = os.path.basename(target_device)
+    part_devices: list[str] = []
+    children: list[dict[str, Any]] = []
+    for number, part_entry in enumerate(layout, start=1):
+        part_info: dict[str, Any] = part_definitions[part_entry['key']]
+        part_device: str = get_partition_device_path(target_device, number)
+        part_size: int = (part_entry['end'] - part_entry['start'] + 1) * sector_size
+        part_filesystem: str | None = get_first_defined_key(part_info, ['filesystem', 'fs'], None)
+        fs_type: str | None = expected_fs_types.get(part_filesystem, part_filesystem) if part_filesystem else None
+
+        part_node: dict[str, Any] = {
+            'name': os.path.basename(part_device),
+            'kname': os.path.basename(part_device),
+            'type': 'part',
+            'fstype': fs_type,
+            'label': part_info.get('name', None),
+            'partlabel': part_info.get('name', None),
+            'mountpoints': [],
+        }
+        active_plan.device_sizes[part_device] = part_size
+
+        fs_device: str = part_device
+        luks_info: dict[str, Any] | None = part_info.get('luks', None)
+        if luks_info:
+            luks_device_name: str = get_luks_device_name(luks_info)
+            part_node['fstype'] = 'crypto_LUKS'
+            part_node['label'] = None
+            part_node['children'] = [{
+                'name': luks_device_name,
+                'kname': luks_device_name,
+                'type': 'crypt',
+                'fstype': fs_type,
+                'label': part_info.get('name', None),
+                'mountpoints': [],
+            }]
+            fs_device = f"/dev/mapper/{luks_device_name}"
+            active_plan.device_sizes[fs_device] = part_size - 16 * 1024 ** 2
+
+        subvolumes_info: dict[str, Any] = part_info.get('subvolumes', None) or {}
+        active_plan.subvolumes[fs_device] = [subvol_info.get('name', subvol_key) for subvol_key, subvol_info in subvolumes_info.items()]
+
+        children.append(part_node)
+        part_devices.append(part_device)
+
+    active_plan.topology = BlockTopology([{
+        'name': device_name,
+        'kname': device_name,
+        'type': 'disk',
+        'fstype': None,
+        'mountpoints': [],
+        'children': children,
+    }])
+    return part_devices
+
+
+def estimate_install_download_bytes(
+    program_binary: str,
+    packages: str | list[str] | None = None,
+) -> int:
+    program_name: str = os.path.basename(program_binary)
+    if program_name == 'pacstrap' and packages and shutil.which('pacman'):
+        package_list: list[str] = packages.split() if isinstance(packages, str) else list(packages)
+        # download sizes of the packages and their dependencies from the local sync database
+        sizes_output: str = exec_output(['pacman', '-Sp', '--print-format', '%s', *package_list])
+        package_sizes: list[int] = [int(line) for line in sizes_output.splitlines() if line.strip().isdigit()]
+        if package_sizes:
+            return sum(package_sizes)
+
+    return plan_install_download_bytes.get(program_name, 500 * 1024 ** 2)
+
+
+# ------------------------ Session output -------------------------
+# One buffered handle per output script/log for the whole session instead of open -> write -> close per line
+# (expensive on sshfs mounted log directories). Flushed at stage boundaries and on exit
+
+
+class SessionWriter:
+
+    def __init__(self, buffer_size: int = 64 * 1024):
+        self.buffer_size: int = buffer_size
+        self.handles: dict[str, TextIOWrapper] = {}
+        self.records_path: str | None = None
+        self.lock = threading.Lock()
+
+    def get_handle(self, fd_path: str, fd_mode: str = 'a+') -> TextIOWrapper:
+        fd_path = os.path.abspath(fd_path)
+        fd: TextIOWrapper | None = self.handles.get(fd_path, None)
+        # Truncating modes ('w', 'w+') restart the file, later writes append to the same handle
+        if fd and fd_mode.startswith('w'):
+            fd.close()
+            fd = None
+        if not fd:
+            fd = open(fd_path, fd_mode, buffering=self.buffer_size)
+            self.handles[fd_path] = fd
+        return fd
+
+    def write(self, fd_path: str, line: str, fd_mode: str = 'a+') -> None:
+        with self.lock:
+            self.get_handle(fd_path, fd_mode).write(f"{line}\n")
+
+    def set_records_path(self, records_path: str | None) -> None:
+        with self.lock:
+            self.records_path = os.path.abspath(records_path) if records_path else None
+
+    def write_record(self, kind: str, **fields: Any) -> None:
+        if not self.records_path:
+            return
+
+        import json
+        record: dict[str, Any] = {'time': time.time(), 'stage': current_stage_key.get(), 'kind': kind, **fields}
+        with self.lock:
+            self.get_handle(self.records_path).write(json.dumps(record) + '\n')
+
+    def flush(self) -> None:
+        with self.lock:
+            for fd in self.handles.values():
+                fd.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            for fd in self.handles.values():
+                fd.close()
+            self.handles.clear()
+
+
+session_writer = SessionWriter()
+# Registered first -> runs after all other exit hooks (LIFO), which may still write messages
+atexit.register(session_writer.close)
+
+
 def run_cmd(
     cmd: str,
     fd_path: str = None,
-    fd_mode: str = 'a+'
-) -> None:
+    fd_mode: str = 'a+',
+    check: bool = False,
+    timeout: float | None = None,
+    estimate: dict[str, float] | None = None,
+) -> CommandResult | None:
+    if active_plan:
+        active_plan.record(cmd, estimate=estimate)
+        return None
+
     if not fd_path:
         print(cmd)
-        os.system(cmd)
-        return
+        try:
+            result: CommandResult = exec_cmd(cmd, capture=False, check=check, timeout=timeout)
+        except ValueError as e:
+            session_writer.write_record('cmd', cmd=cmd, error=str(e))
+            raise
+        session_writer.write_record('cmd', cmd=cmd, returncode=result['returncode'], duration=result['duration'], timed_out=result['timed_out'])
+        if result['returncode'] != 0:
+            print(f"Warning: command exited with code {result['returncode']} after {result['duration']:.2f}s")
+        return result
 
-    with open(fd_path, fd_mode) as fd:
-        fd.write(f"{cmd}\n")
+    session_writer.write(fd_path, cmd, fd_mode)
+    session_writer.write_record('cmd', cmd=cmd, output=fd_path)
 
 
 def print_write(
@@ -53,11 +598,15 @@ def print_write(
 ) -> None:
     print(message)
 
+    if active_plan:
+        active_plan.record(message, kind='comment')
+        return
+
+    session_writer.write_record('message', message=message)
     if not fd_path:
         return
 
-    with open(fd_path, fd_mode) as fd:
-        fd.write(f"# {message}\n")
+    session_writer.write(fd_path, f"# {message}", fd_mode)
 
 
 def append_cmd(
@@ -65,14 +614,30 @@ def append_cmd(
     fd_path: str = None,
     fd_mode: str = 'a+'
 ) -> None:
+    if active_plan:
+        active_plan.record(cmd, kind='guard')
+        return
+
     if not fd_path:
         return
 
-    with open(fd_path, fd_mode) as file_fd:
-        file_fd.write(f"{cmd}\n")
+    session_writer.write(fd_path, cmd, fd_mode)
+
+
+host_system_type: str | None = None
 
 
 def identify_system() -> str:
+    # Only detected once per run, the host package manager does not change
+    global host_system_type
+    if host_system_type:
+        return host_system_type
+
+    host_system_type = detect_host_system()
+    return host_system_type
+
+
+def detect_host_system() -> str:
     import platform
     system = platform.system()
     if system != 'Linux':
@@ -191,7 +756,10 @@ def format_if_set(
     variables: dict[str, Any],
     default: str = ''
 ) -> str:
+    from string import Formatter
     formatter_parsed_keys = [i[1] for i in Formatter().parse(template) if i[1] is not None]
+    if not formatter_parsed_keys:
+        return template
     contained_key = formatter_parsed_keys[0]
     if contained_key in variables and variables[contained_key] is not None:
         return template.format(**variables)
@@ -237,20 +805,6 @@ def inflate_command_set_item(
     return command_template.format(**variables)
 
 
-def install_argparse_if_missing() -> None:
-    try:
-        import argparse
-    except ImportError:
-        print("argparse module is not installed. Installing it now...")
-        run_cmd("pip install argparse")
-        print("argparse module installed successfully.")
-
-        print("Please rerun the script after the installation has finished.")
-
-
-install_argparse_if_missing()
-
-
 # ------------------------ Run commands and installing packages -------------------------
 
 
@@ -297,7 +851,7 @@ def ensure_requirements(
         return
 
     if not shutil.which(binary_alias):
-        print_write(f"{binary_alias} is not installed on the system and required for {required_for}, installing it now...", output_script=output_script)
+        print_write(f"{binary_alias} is not installed on the system and required for {required_for}, installing it now...", fd_path=output_script)
         platform_system_install(packages, output_script=output_script)
 
     if not output_script and not shutil.which(binary_alias):
@@ -321,9 +875,9 @@ def append_script_file_guard(
 
 
 def produces_output(
-    command: str
+    command: str | list[str]
 ) -> bool:
-    command_output = os.popen(command).read().strip()
+    command_output = exec_output(command)
     return bool(command_output)
 
 
@@ -333,7 +887,7 @@ def command_produces_output_guard(
 ) -> None:
 
     if not fd_path:
-        command_output = os.popen(command).read().strip()
+        command_output = exec_output(command)
         if not command_output:
             raise ValueError(f"Command guard '{command}' did not produce any output -> exiting")
         return
@@ -351,7 +905,7 @@ def command_produces_output_guard(
 
 def init_output_script(config: dict[str, Any] = {}) -> TextIOWrapper | None:
     output_script: str = config.get('output', None)
-    if not output_script:
+    if not output_script or is_planning():
         return None
 
     if not os.path.isabs(output_script):
@@ -359,22 +913,23 @@ def init_output_script(config: dict[str, Any] = {}) -> TextIOWrapper | None:
         config['output'] = output_script
 
     output_script = os.path.abspath(output_script)
-    with open(output_script, 'w+') as fd:
-        fd.write("#! /bin/bash\n")
-        fd.write("# This script was generated by the bootstrap_system_disk.py script\n")
-        fd.write("# It contains commands to bootstrap the system disk as defined in the configuration file\n")
-        fd.write("\n")
+    session_writer.write(output_script, "#! /bin/bash", fd_mode='w+')
+    session_writer.write(output_script, "# This script was generated by the bootstrap_system_disk.py script")
+    session_writer.write(output_script, "# It contains commands to bootstrap the system disk as defined in the configuration file")
+    session_writer.write(output_script, "")
 
 
-def prepare_install_env(config: dict[str, Any] = {}) -> str:
+def prepare_install_env(config: dict[str, Any] = {}) -> str | None:
     system_type: str = config.get('system', None)
-    if not system_type:
-        system_type = identify_system()
-        config['system'] = system_type
 
     output_script: str = config.get('output', None)
     bt_dependencies: list[str] = config.get('dependencies', None)
     if bt_dependencies and bt_dependencies.get('prepare', None):
+        # Host system is only detected when there is something to prepare for it
+        if not system_type:
+            system_type = identify_system()
+            config['system'] = system_type
+
         prep_deps: dict[str, str] = bt_dependencies.get('prepare', {})
         if prep_deps.get(system_type, None):
             prep_cmd: str = prep_deps.get(system_type, {})
@@ -384,110 +939,508 @@ def prepare_install_env(config: dict[str, Any] = {}) -> str:
 # ------------------------ Cleanup resources -------------------------
 
 
-def umount_luks_device(
-    crypto_device: dict[str, Any]
-) -> None:
-    if not crypto_device:
-        print("No crypto device provided -> skipping LUKS unmount")
-        return
+# Teardown is planned from /proc/self/mountinfo and /sys/class/block (partitions + holders like dm-crypt):
+# mounts are unmounted leaves first (independent ones concurrently), busy mounts are retried with backoff
+# and their holding processes reported, then mappings are closed bottom up and finally the loop device detached
 
-    # Close LUKS device
-    luks_name: str = crypto_device.get('name', None)
+busy_umount_retries: int = 5
+busy_umount_backoff: float = 0.2
 
-    crypto_children: list[str] = crypto_device.get('children', [])
-    if crypto_children:
-        for child in crypto_children:
-            umount_luks_device(child)
 
-    if not luks_name:
-        print("No LUKS name provided in the crypto device -> skipping LUKS unmount")
-        return
+def get_block_dependents(kname: str) -> dict[str, list[str]]:
+    """
+    {kname: [partitions and holders which have to be torn down before it]} for 'kname' and everything stacked on it.
+    """
+    dependents: dict[str, list[str]] = {}
+    pending_knames: list[str] = [kname]
+    while pending_knames:
+        current_kname: str = pending_knames.pop()
+        if current_kname in dependents:
+            continue
 
-    if os.path.exists(f"/dev/mapper/{luks_name}"):
-        print(f"Closing LUKS device at \"/dev/mapper/{luks_name}\"")
-        os.system(f"sudo cryptsetup luksClose \"/dev/mapper/{luks_name}\"")
+        sys_block_path: str = f"/sys/class/block/{current_kname}"
+        current_dependents: list[str] = []
+        if os.path.isdir(sys_block_path):
+            current_dependents.extend(
+                entry for entry in os.listdir(sys_block_path)
+                if os.path.exists(os.path.join(sys_block_path, entry, 'partition'))
+            )
+            holders_path: str = os.path.join(sys_block_path, 'holders')
+            if os.path.isdir(holders_path):
+                current_dependents.extend(os.listdir(holders_path))
 
-        # print(f"Unmounting LUKS device {luks_name}")
-        # os.system(f"sudo umount -l \"/dev/mapper/{luks_name}\""
+        dependents[current_kname] = current_dependents
+        pending_knames.extend(current_dependents)
 
+    return dependents
 
-def recursive_umount_close(
-    selected_device: dict[str, Any],
-) -> None:
-    if not selected_device:
-        return
 
-    children: list[str] = selected_device.get('children', None)
+def read_sys_block_attribute(kname: str, attribute: str) -> str | None:
+    attribute_path: str = f"/sys/class/block/{kname}/{attribute}"
+    if not os.path.exists(attribute_path):
+        return None
+    with open(attribute_path, 'r') as attribute_fd:
+        return attribute_fd.read().strip()
+
 
-    if children:
-        for child in children:
-            recursive_umount_close(
-                selected_device=child
-            )
+def find_mount_holders(mount_point: str) -> list[tuple[int, str]]:
+    """
+    Processes with an open file, working directory or root below 'mount_point' (scan of /proc/*/{fd,cwd,root}).
+    """
+    mount_prefix: str = mount_point.rstrip('/') + '/'
+    holders: list[tuple[int, str]] = []
+    for pid_entry in os.listdir('/proc'):
+        if not pid_entry.isdigit():
+            continue
 
-    # Is leaf node
-    mountpoints: list[str] = [mountpoint for mountpoint in selected_device.get('mountpoints', []) if mountpoint]
-    if mountpoints:
-        for mountpoint in mountpoints:
-            print(f"Unmounting {mountpoint} from {selected_device['name']}")
-            os.system(f"sudo umount \"{mountpoint}\"")
-            # os.system(f"sudo umount -l \"{mountpoint}\"")
+        proc_path: str = f"/proc/{pid_entry}"
+        try:
+            link_paths: list[str] = [f"{proc_path}/cwd", f"{proc_path}/root"]
+            link_paths.extend(os.path.join(f"{proc_path}/fd", fd_entry) for fd_entry in os.listdir(f"{proc_path}/fd"))
+            for link_path in link_paths:
+                try:
+                    target_path: str = os.readlink(link_path)
+                except OSError:
+                    continue
+                if target_path == mount_point or target_path.startswith(mount_prefix):
+                    with open(f"{proc_path}/comm", 'r') as comm_fd:
+                        holders.append((int(pid_entry), comm_fd.read().strip()))
+                    break
+        except OSError:
+            # Process exited or is not accessible
+            continue
 
-    fs_type: str = selected_device.get('fstype', None)
-    if not fs_type:
-        return
+    return holders
 
-    if 'crypto' in fs_type:
-        umount_luks_device(
-            crypto_device=selected_device
-        )
+
+def run_teardown_cmd(cmd: list[str]) -> bool:
+    if is_planning():
+        run_cmd(' '.join(cmd))
+        return True
+
+    print(' '.join(cmd))
+    result: CommandResult = exec_cmd(cmd)
+    return result['returncode'] == 0
+
+
+def umount_with_retry(
+    mount_point: str,
+    retries: int = busy_umount_retries,
+    backoff: float = busy_umount_backoff,
+) -> bool:
+    import errno
+
+    # Only a busy mount can resolve itself -> every other failure is final and must not add backoff sleeps
+    for attempt in range(retries + 1):
+        if kernel_mount_enabled:
+            try:
+                kernel_umount(mount_point)
+                return True
+            except OSError as e:
+                # EINVAL/ENOENT -> not a mount point (anymore)
+                if e.errno in (errno.EINVAL, errno.ENOENT):
+                    return True
+                if e.errno != errno.EBUSY:
+                    print(f"Failed to unmount {mount_point}: {e}")
+                    return False
+        elif is_planning():
+            return run_teardown_cmd(['sudo', 'umount', mount_point])
+        else:
+            print(f"sudo umount {mount_point}")
+            result: CommandResult = exec_cmd(['sudo', 'umount', mount_point])
+            if result['returncode'] == 0:
+                return True
+            error: str = result['stderr'].strip()
+            if 'not mounted' in error or 'no mount point specified' in error:
+                return True
+            if 'target is busy' not in error:
+                print(f"Failed to unmount {mount_point}: {error}")
+                return False
+
+        if attempt < retries:
+            time.sleep(backoff * (2 ** attempt))
+
+    holders: list[tuple[int, str]] = find_mount_holders(mount_point)
+    holders_str: str = ', '.join(f"{pid} ({comm})" for pid, comm in holders) or 'no process found (nested mount, swap or kernel user?)'
+    print(f"Mount {mount_point} is still busy after {retries} retries -> held by {holders_str}")
+    return False
+
+
+def close_block_device(kname: str) -> str | None:
+    """
+    Close device mapper targets (LUKS, others) and detach loop devices -> returns the action taken.
+    """
+    dm_name: str | None = read_sys_block_attribute(kname, 'dm/name')
+    if dm_name:
+        dm_uuid: str = read_sys_block_attribute(kname, 'dm/uuid') or ''
+        if dm_uuid.startswith('CRYPT-'):
+            print(f"Closing LUKS device at \"/dev/mapper/{dm_name}\"")
+            return 'luksClose' if run_teardown_cmd(['sudo', 'cryptsetup', 'luksClose', dm_name]) else None
+        return 'dmsetup remove' if run_teardown_cmd(['sudo', 'dmsetup', 'remove', dm_name]) else None
+
+    # Replaces 'losetup -l' -> attached loop devices have a backing file
+    if read_sys_block_attribute(kname, 'loop/backing_file'):
+        return 'detach' if run_teardown_cmd(['sudo', 'losetup', '--detach', f"/dev/{kname}"]) else None
+
+    return None
+
+
+def run_teardown_waves(
+    pending_keys: list[str],
+    blocked_by: Any,
+    teardown_fn: Any,
+    max_workers: int = 4,
+) -> dict[str, Any]:
+    """
+    Repeatedly run 'teardown_fn' concurrently on every pending key which is not blocked by another pending key.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    results: dict[str, Any] = {}
+    pending_keys = list(pending_keys)
+    if max_workers <= 1:
+        # Sequential, e.g. from atexit hooks, where executors do not accept new work anymore
+        while pending_keys:
+            wave = [key for key in pending_keys if not blocked_by(key, pending_keys)] or pending_keys[:1]
+            for key in wave:
+                results[key] = teardown_fn(key)
+            pending_keys = [key for key in pending_keys if key not in wave]
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='teardown') as executor:
+        while pending_keys:
+            wave: list[str] = [key for key in pending_keys if not blocked_by(key, pending_keys)]
+            if not wave:
+                # Cycle (should not happen) -> tear down the rest one by one
+                wave = pending_keys[:1]
+            wave_futures = {key: executor.submit(contextvars.copy_context().run, teardown_fn, key) for key in wave}
+            for key, future in wave_futures.items():
+                results[key] = future.result()
+            pending_keys = [key for key in pending_keys if key not in wave]
+    return results
 
 
 def cleanup_device_resources(
-    device_path: str
-) -> None:
+    device_path: str,
+    max_workers: int = 4,
+) -> dict[str, Any]:
+    summary: dict[str, Any] = {'device': device_path, 'unmounted': [], 'busy': [], 'closed': [], 'failed': []}
 
     if not os.path.exists(device_path):
         print(f"Target device {device_path} does not exist -> skipping cleanup")
-        return
+        return summary
+
+    device_kname: str = os.path.basename(os.path.realpath(device_path))
+    dependents: dict[str, list[str]] = get_block_dependents(device_kname)
+    device_numbers: dict[str, str] = {read_sys_block_attribute(kname, 'dev'): kname for kname in dependents}
+
+    # Mounts of the devices + everything mounted below them (e.g. /proc, /dev binds in a chroot)
+    mounts: list[dict[str, Any]] = read_mountinfo()
+    # btrfs reports anonymous device numbers in mountinfo -> also match by source device
+    device_mount_points: set[str] = {
+        mount['mount_point'] for mount in mounts
+        if mount['device_number'] in device_numbers
+        or (mount['source'].startswith('/dev/') and os.path.basename(os.path.realpath(mount['source'])) in dependents)
+    }
+    mount_points: list[str] = sorted({
+        mount['mount_point'] for mount in mounts
+        if mount['mount_point'] in device_mount_points
+        or any(mount['mount_point'].startswith(mount_point.rstrip('/') + '/') for mount_point in device_mount_points)
+    })
+    stacked_counts: dict[str, int] = {mount_point: 0 for mount_point in mount_points}
+    for mount in mounts:
+        if mount['mount_point'] in stacked_counts:
+            stacked_counts[mount['mount_point']] += 1
+
+    closable_knames: list[str] = [
+        kname for kname in dependents
+        if read_sys_block_attribute(kname, 'dm/name') or read_sys_block_attribute(kname, 'loop/backing_file')
+    ]
+    if not mount_points and not closable_knames:
+        print(f"device {device_path} is not mounted -> skipping cleanup")
+        return summary
+
+    # If cleanup was called before natural exit or termination -> resources do not need to be cleaned up anymore
+    unregister_device_cleanup(device_path)
+    print(f"Cleaning up device {device_path} resources -> umounting {len(mount_points)} mountpoints + closing {len(closable_knames)} devices")
+
+    def umount_stacked(mount_point: str) -> bool:
+        return all(umount_with_retry(mount_point) for _ in range(stacked_counts[mount_point]))
+
+    def is_mount_blocked(mount_point: str, pending_mount_points: list[str]) -> bool:
+        return any(other.startswith(mount_point.rstrip('/') + '/') for other in pending_mount_points if other != mount_point)
+
+    umount_results: dict[str, bool] = run_teardown_waves(mount_points, is_mount_blocked, umount_stacked, max_workers=max_workers)
+    summary['unmounted'] = [mount_point for mount_point, success in umount_results.items() if success]
+    summary['busy'] = [mount_point for mount_point, success in umount_results.items() if not success]
+
+    # Reverse topological: a device is closed after all partitions/holders stacked on it
+    def is_device_blocked(kname: str, pending_knames: list[str]) -> bool:
+        pending_below: list[str] = list(dependents.get(kname, []))
+        while pending_below:
+            dependent_kname: str = pending_below.pop()
+            if dependent_kname in pending_knames:
+                return True
+            pending_below.extend(dependents.get(dependent_kname, []))
+        return False
+
+    close_results: dict[str, str | None] = run_teardown_waves(closable_knames, is_device_blocked, close_block_device, max_workers=max_workers)
+    summary['closed'] = [f"{kname} ({action})" for kname, action in close_results.items() if action]
+    summary['failed'] = [kname for kname, action in close_results.items() if not action]
+
+    if summary['busy'] or summary['failed']:
+        print(f"Cleanup of {device_path} left stragglers -> busy mounts: {', '.join(summary['busy']) or '-'}, open devices: {', '.join(summary['failed']) or '-'}")
+
+    return summary
+
+
+# ------------------------ Block device topology -------------------------
+# One 'lsblk --json -O' snapshot indexed by name, path, label, uuid, partlabel and parent.
+# Reused for all lookups until a command changes the disks (see 'run_cmd' -> 'invalidate_block_topology')
+
+topology_changing_programs: tuple[str, ...] = (
+    'sfdisk', 'partprobe', 'wipefs', 'mkfs', 'mkswap', 'cryptsetup', 'mount', 'umount', 'losetup', 'btrfs'
+)
+
+
+class BlockTopology:
+
+    def __init__(self, block_devices: list[dict[str, Any]]):
+        self.block_devices: list[dict[str, Any]] = block_devices
+        self.by_kname: dict[str, dict[str, Any]] = {}
+        self.by_name: dict[str, dict[str, Any]] = {}
+        self.by_key: dict[str, dict[str, dict[str, Any]]] = {'label': {}, 'uuid': {}, 'partlabel': {}, 'partuuid': {}}
+        self.parents: dict[str, dict[str, Any]] = {}
+
+        pending_devices: list[tuple[dict[str, Any], dict[str, Any] | None]] = [(block_device, None) for block_device in block_devices]
+        while pending_devices:
+            block_device, parent_device = pending_devices.pop()
+            kname: str = block_device.get('kname') or block_device.get('name')
+            self.by_kname.setdefault(kname, block_device)
+            self.by_name.setdefault(block_device.get('name'), block_device)
+            for key, index in self.by_key.items():
+                if block_device.get(key):
+                    index.setdefault(block_device[key], block_device)
+            if parent_device:
+                self.parents.setdefault(kname, parent_device)
+
+            pending_devices.extend((child, block_device) for child in block_device.get('children', []))
+
+    @classmethod
+    def load(cls) -> 'BlockTopology':
+        output: str = exec_output(['lsblk', '--json', '-O'])
+        if not output:
+            raise ValueError("No output from lsblk command while reading block device topology -> exiting")
+
+        import json
+        lsblk_output: dict[str, Any] = json.loads(output) or {}
+        return cls(lsblk_output.get('blockdevices', None) or [])
+
+    def get(self, device: str) -> dict[str, Any] | None:
+        if not device:
+            return None
+
+        if device.startswith('/dev/'):
+            kname: str = os.path.basename(os.path.realpath(device))
+            if kname in self.by_kname:
+                return self.by_kname[kname]
+
+        device_name: str = os.path.basename(device)
+        return self.by_name.get(device_name, None) or self.by_kname.get(device_name, None)
+
+    def find(self, term: str) -> dict[str, Any] | None:
+        block_device: dict[str, Any] | None = self.get(term)
+        if block_device:
+            return block_device
+
+        for index in self.by_key.values():
+            if term in index:
+                return index[term]
+
+        # Same semantics as the former 'lsblk --list -o NAME,LABEL,UUID | grep' -> partial names, labels and uuids match too
+        pending_devices: list[dict[str, Any]] = list(reversed(self.block_devices))
+        while pending_devices:
+            block_device = pending_devices.pop()
+            if any(term in (block_device.get(key) or '') for key in ('name', 'label', 'uuid')):
+                return block_device
+            pending_devices.extend(reversed(block_device.get('children', [])))
+        return None
 
-    # if not produces_output(f"losetup -l {device_path} 2> /dev/null"):
-    #     print(f"Loop device {device_path} is not in use -> skipping cleanup")
-    #     return
+    def parent(self, device: str) -> dict[str, Any] | None:
+        block_device: dict[str, Any] | None = self.get(device)
+        if not block_device:
+            return None
+        return self.parents.get(block_device.get('kname') or block_device.get('name'), None)
 
-    block_devices = lsblk_json(device_path)
-    if not block_devices:
-        print(f"device {device_path} is not mounted -> skipping cleanup")
-        return
+    def children(self, device: str) -> list[dict[str, Any]]:
+        block_device: dict[str, Any] | None = self.get(device)
+        if not block_device:
+            return []
+        return block_device.get('children', [])
 
-    if block_devices:
+    def descendants(self, device: str) -> list[dict[str, Any]]:
+        descendant_devices: list[dict[str, Any]] = []
+        pending_devices: list[dict[str, Any]] = list(reversed(self.children(device)))
+        while pending_devices:
+            block_device = pending_devices.pop()
+            descendant_devices.append(block_device)
+            pending_devices.extend(reversed(block_device.get('children', [])))
+        return descendant_devices
 
-        # If cleanup was called before natural exit or termination -> resources do not need to be cleaned up anymore
-        atexit.unregister(cleanup_resources_at_exit)
 
-        selected_device = block_devices[0]
-        if selected_device:
-            print(f"Cleaning up device {device_path} resources -> umounting mountpoints + detaching luks containers")
-            recursive_umount_close(selected_device)
+block_topology: BlockTopology | None = None
+block_topology_lock = threading.RLock()
 
-    # mounts_output = os.popen(f"lsblk --noheadings -f \"{loop_device}\" --list -o MOUNTPOINTS").read().strip()
-    # if mounts_output:
-    #     mounts = mounts_output.split()
-    #     mounts = [m for m in mounts if m.strip()]  # Remove empty strings
 
-    #     if mounts:
-    #         for mount in mounts:
-    #             os.system(f"sudo umount -l \"{mount}\"")
+def get_block_topology(
+    refresh: bool = False,
+) -> BlockTopology:
+    global block_topology
+    if active_plan and active_plan.topology:
+        return active_plan.topology
 
-    # if not produces_output(f"losetup -l {loop_device} | grep -o '{image_path}'"):
-    #    return
+    with block_topology_lock:
+        if refresh or block_topology is None:
+            block_topology = BlockTopology.load()
+        return block_topology
 
-    if produces_output(f"losetup -l {device_path} 2> /dev/null"):
-        os.system(f"sudo losetup --detach {device_path}")
 
-    # if device_path.startswith('/dev/loop') and os.path.exists(device_path):
-    #     print(f"Detaching loop device at {device_path}")
-    #     os.system(f"sudo losetup --detach {device_path}")
+def invalidate_block_topology() -> None:
+    global block_topology
+    with block_topology_lock:
+        block_topology = None
+
+
+def changes_block_topology(
+    cmd: str,
+) -> bool:
+    return any(program in cmd for program in topology_changing_programs)
+
+
+# ------------------------ Waiting for device readiness -------------------------
+# Instead of fixed sleeps wait for kernel uevents (partition nodes added, udev updated fs signatures)
+# and re-check the expected state each time one arrives -> returns as soon as the devices are ready
+
+NETLINK_KOBJECT_UEVENT: int = 15
+
+
+def open_uevent_socket() -> Any | None:
+    import socket
+    if not hasattr(socket, 'AF_NETLINK'):
+        return None
+    try:
+        uevent_socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+        # group 1 -> kernel events, group 2 -> events re-broadcasted by udev after processing
+        uevent_socket.bind((0, 1 | 2))
+        uevent_socket.setblocking(False)
+        return uevent_socket
+    except OSError as e:
+        print(f"Could not listen on kernel uevent socket ({e}) -> polling /sys/class/block instead")
+        return None
+
+
+def wait_for_condition(
+    is_ready: Any,
+    timeout: float = 10.0,
+    poll_interval: float = 0.25,
+    description: str = 'devices',
+) -> bool:
+    if is_ready():
+        return True
+
+    import select
+    uevent_socket = open_uevent_socket()
+    deadline: float = time.monotonic() + timeout
+    try:
+        while True:
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"Timed out after {timeout}s waiting for {description}")
+                return False
+
+            wait_time: float = min(remaining, poll_interval)
+            if uevent_socket:
+                readable, _, _ = select.select([uevent_socket], [], [], wait_time)
+                # Drain queued events, only the wakeup matters -> state is re-read below
+                while readable:
+                    try:
+                        uevent_socket.recv(8192)
+                    except BlockingIOError:
+                        break
+            else:
+                time.sleep(wait_time)
+
+            if is_ready():
+                return True
+    finally:
+        if uevent_socket:
+            uevent_socket.close()
+
+
+def get_sys_block_partitions(
+    device_path: str,
+) -> list[str]:
+    return list(get_sys_partition_numbers(device_path).values())
+
+
+def get_sys_partition_numbers(
+    device_path: str,
+) -> dict[int, str]:
+    device_name: str = os.path.basename(os.path.realpath(device_path))
+    sys_device_path: str = f"/sys/class/block/{device_name}"
+    if not os.path.exists(sys_device_path):
+        return {}
+
+    part_numbers: dict[int, str] = {}
+    for entry in os.listdir(sys_device_path):
+        partition_file: str = os.path.join(sys_device_path, entry, 'partition')
+        if entry.startswith(device_name) and os.path.exists(partition_file):
+            with open(partition_file, 'r') as fd:
+                part_numbers[int(fd.read().strip())] = f"/dev/{entry}"
+    # sorted by partition number (name sorting would put p10 before p2)
+    return dict(sorted(part_numbers.items()))
+
+
+def wait_for_partition_nodes(
+    device_path: str,
+    expected_count: int,
+    timeout: float = 10.0,
+) -> list[str]:
+    def partitions_ready() -> bool:
+        part_devices: list[str] = get_sys_block_partitions(device_path)
+        return len(part_devices) >= expected_count and all(os.path.exists(part_device) for part_device in part_devices)
+
+    # Continuing with missing nodes only fails later in mkfs with an unrelated error (slow USB disks)
+    if not wait_for_condition(
+        partitions_ready,
+        timeout=timeout,
+        description=f"{expected_count} partition nodes on {device_path}"
+    ):
+        existing_parts: list[str] = [part_device for part_device in get_sys_block_partitions(device_path) if os.path.exists(part_device)]
+        raise ValueError(f"Partition nodes of {device_path} did not appear within {timeout}s ({len(existing_parts)} of {expected_count} exist) -> exiting")
+    return get_sys_block_partitions(device_path)
+
+
+def wait_for_fs_signatures(
+    part_devices: list[str],
+    timeout: float = 10.0,
+) -> dict[str, str | None]:
+    fs_types: dict[str, str | None] = {part_device: None for part_device in part_devices}
+
+    def signatures_ready() -> bool:
+        # One fresh topology snapshot per wakeup for all devices
+        get_block_topology(refresh=True)
+        for part_device in part_devices:
+            if not fs_types[part_device]:
+                fs_types[part_device] = check_fs_type(part_device, quiet=True)
+        return all(fs_types.values())
+
+    wait_for_condition(
+        signatures_ready,
+        timeout=timeout,
+        description=f"filesystem signatures on {', '.join(part_devices)}"
+    )
+    return fs_types
 
 
 # ------------------------ Partitioning devices -------------------------
@@ -524,11 +1477,10 @@ def validate_part_type_code(part_type: str, name="") -> str:
     #     raise ValueError(f"{name} Partition type '{part_type}' is not a valid partition type -> must be a number between 1 and 127")
 
     if ('-' in part_type):
-        part_type = part_type.replace('-', '')
-        if len(part_type) != 32:
+        if len(part_type.replace('-', '')) != 32:
             raise ValueError(f"{name} Partition type '{part_type}' is not a valid UUID format -> must be 32 characters long, excluding dashes")
 
-        return True
+        return part_type.upper()
 
     part_guid: str | None = part_alias_guids.get(part_type, None)
     if part_guid:
@@ -541,6 +1493,319 @@ def validate_part_type_code(part_type: str, name="") -> str:
     raise ValueError(f"{name} Partition type '{part_type}' is not a valid partition type -> must be a number between 1 and 127 or a valid UUID format")
 
 
+# ------------------------ Native GPT partition table -------------------------
+# Builds the same layout as the generated sfdisk script directly in python:
+# protective MBR + primary header/entries as one write at the start of the disk,
+# backup entries/header as one write at the end of the disk
+# https://uefi.org/specs/UEFI/2.10/05_GUID_Partition_Table_Format.html
+
+gpt_entry_count: int = 128
+gpt_entry_size: int = 128
+gpt_header_format: str = '<8sIIIIQQQQ16sQIII'
+gpt_entry_format: str = '<16s16sQQQ72s'
+size_unit_exponents: dict[str, int] = {'K': 1, 'M': 2, 'G': 3, 'T': 4, 'P': 5}
+
+
+def parse_sector_count(
+    value: str | int,
+    sector_size: int = 512,
+) -> int:
+    """
+    Parse sfdisk style sizes: plain numbers are sectors, K/M/G/T/P(iB) suffixes are powers of 1024 bytes.
+    """
+    value_str: str = str(value).strip().lstrip('+')
+    unit: str = value_str.rstrip('0123456789.').lstrip('0123456789.')
+    number_str: str = value_str[:len(value_str) - len(unit)]
+    if not number_str:
+        raise ValueError(f"Invalid size or position '{value}' -> expected <number>[K|M|G|T|P]")
+
+    unit = unit.upper().removesuffix('IB').removesuffix('B')
+    if not unit:
+        return int(number_str)
+    if unit not in size_unit_exponents:
+        raise ValueError(f"Invalid unit in size or position '{value}' -> expected <number>[K|M|G|T|P]")
+
+    size_bytes: int = int(float(number_str) * (1024 ** size_unit_exponents[unit]))
+    return -(-size_bytes // sector_size)
+
+
+def get_device_sector_size(
+    device_path: str,
+    default: int = 512,
+) -> int:
+    device_name: str = os.path.basename(os.path.realpath(device_path))
+    logical_block_size_path: str = f"/sys/class/block/{device_name}/queue/logical_block_size"
+    if not os.path.exists(logical_block_size_path):
+        return default
+    with open(logical_block_size_path, 'r') as fd:
+        return int(fd.read().strip() or default)
+
+
+def get_device_total_sectors(
+    device_path: str,
+    sector_size: int = 512,
+) -> int:
+    if os.access(device_path, os.R_OK):
+        device_fd: int = os.open(device_path, os.O_RDONLY)
+        try:
+            return os.lseek(device_fd, 0, os.SEEK_END) // sector_size
+        finally:
+            os.close(device_fd)
+
+    # Not readable (no root) -> sysfs reports the size in 512 byte sectors regardless of the logical block size
+    device_size: str | None = read_sys_block_attribute(os.path.basename(os.path.realpath(device_path)), 'size')
+    if not device_size:
+        raise ValueError(f"Size of '{device_path}' can not be determined without read access -> exiting")
+    return int(device_size) * 512 // sector_size
+
+
+def get_gpt_geometry(
+    total_sectors: int,
+    sector_size: int = 512,
+) -> dict[str, int]:
+    entries_sectors: int = -(-(gpt_entry_count * gpt_entry_size) // sector_size)
+    return {
+        'entries_sectors': entries_sectors,
+        'first_usable': 2 + entries_sectors,
+        'last_usable': total_sectors - 2 - entries_sectors,
+        'backup_entries': total_sectors - 1 - entries_sectors,
+        'backup_header': total_sectors - 1,
+    }
+
+
+def build_gpt_layout(
+    part_definitions: dict[str, Any],
+    total_sectors: int,
+    sector_size: int = 512,
+    alignment_bytes: int = 1024 * 1024,
+) -> list[dict[str, Any]]:
+    geometry: dict[str, int] = get_gpt_geometry(total_sectors, sector_size)
+    grain: int = max(1, alignment_bytes // sector_size)
+
+    layout: list[dict[str, Any]] = []
+    next_free: int = geometry['first_usable']
+    for part_key, part_info in part_definitions.items():
+        part_type: str = part_info.get('type', None)
+        if not part_type:
+            raise ValueError(f"Partition '{part_key}' is not configured with a type -> is required -> exiting")
+
+        start_value: str | int | None = part_info.get('start', None)
+        if start_value:
+            start_lba: int = parse_sector_count(start_value, sector_size)
+        else:
+            start_lba = -(-next_free // grain) * grain
+
+        size_value: str | int | None = part_info.get('size', None)
+        if size_value:
+            end_lba: int = start_lba + parse_sector_count(size_value, sector_size) - 1
+        else:
+            end_lba = geometry['last_usable']
+
+        if start_lba < next_free or end_lba > geometry['last_usable'] or end_lba < start_lba:
+            raise ValueError(f"Partition '{part_key}' ({start_lba}-{end_lba}) does not fit on the disk or overlaps the previous partition -> exiting")
+
+        layout.append({
+            'key': part_key,
+            'name': part_info.get('name', None) or '',
+            'type_guid': validate_part_type_code(part_type, name=part_key),
+            'start': start_lba,
+            'end': end_lba,
+        })
+        next_free = end_lba + 1
+
+    return layout
+
+
+def pack_gpt_header(
+    geometry: dict[str, int],
+    disk_guid: bytes,
+    entries_crc: int,
+    is_backup: bool = False,
+) -> bytes:
+    import zlib
+    current_lba: int = geometry['backup_header'] if is_backup else 1
+    other_lba: int = 1 if is_backup else geometry['backup_header']
+    entries_lba: int = geometry['backup_entries'] if is_backup else 2
+
+    header_fields: list[Any] = [
+        b'EFI PART', 0x00010000, 92, 0, 0,
+        current_lba, other_lba, geometry['first_usable'], geometry['last_usable'],
+        disk_guid, entries_lba, gpt_entry_count, gpt_entry_size, entries_crc
+    ]
+    header: bytes = struct.pack(gpt_header_format, *header_fields)
+    header_fields[3] = zlib.crc32(header)
+    return struct.pack(gpt_header_format, *header_fields)
+
+
+def pack_gpt_entries(
+    layout: list[dict[str, Any]],
+) -> bytes:
+    import uuid
+
+    entries: bytearray = bytearray(gpt_entry_count * gpt_entry_size)
+    for index, part_entry in enumerate(layout):
+        entry: bytes = struct.pack(
+            gpt_entry_format,
+            uuid.UUID(part_entry['type_guid']).bytes_le,
+            uuid.UUID(part_entry.get('part_guid', None) or str(uuid.uuid4())).bytes_le,
+            part_entry['start'],
+            part_entry['end'],
+            0,
+            part_entry['name'][:36].encode('utf-16-le')
+        )
+        entries[index * gpt_entry_size:(index + 1) * gpt_entry_size] = entry
+    return bytes(entries)
+
+
+def pack_protective_mbr(
+    total_sectors: int,
+    sector_size: int = 512,
+) -> bytes:
+    mbr: bytearray = bytearray(sector_size)
+    # status, CHS start, type 0xEE (GPT protective), CHS end, first LBA, sector count
+    mbr[446:462] = struct.pack('<B3sB3sII', 0, b'\x00\x02\x00', 0xEE, b'\xff\xff\xff', 1, min(total_sectors - 1, 0xFFFFFFFF))
+    mbr[510:512] = b'\x55\xaa'
+    return bytes(mbr)
+
+
+def write_gpt_table(
+    device_path: str,
+    layout: list[dict[str, Any]],
+    total_sectors: int,
+    sector_size: int = 512,
+    disk_guid: str | None = None,
+) -> None:
+    """
+    Write a GPT for 'layout' to a block device or image file.
+    Everything before the first partition (protective MBR, header, entries and old signatures in the
+    alignment gap) is replaced in a single write, the backup entries + header in a second one.
+    """
+    import uuid
+    import zlib
+
+    geometry: dict[str, int] = get_gpt_geometry(total_sectors, sector_size)
+    disk_guid_bytes: bytes = uuid.UUID(disk_guid or str(uuid.uuid4())).bytes_le
+
+    entries: bytes = pack_gpt_entries(layout)
+    entries_crc: int = zlib.crc32(entries)
+    entries_padded: bytes = entries.ljust(geometry['entries_sectors'] * sector_size, b'\x00')
+
+    first_part_lba: int = min([part_entry['start'] for part_entry in layout] + [2048 * 512 // sector_size])
+    primary_region: bytearray = bytearray(first_part_lba * sector_size)
+    primary_region[0:sector_size] = pack_protective_mbr(total_sectors, sector_size)
+    primary_region[sector_size:sector_size + 92] = pack_gpt_header(geometry, disk_guid_bytes, entries_crc)
+    primary_region[2 * sector_size:2 * sector_size + len(entries_padded)] = entries_padded
+
+    backup_header: bytes = pack_gpt_header(geometry, disk_guid_bytes, entries_crc, is_backup=True).ljust(sector_size, b'\x00')
+    backup_region: bytes = entries_padded + backup_header
+
+    device_fd: int = os.open(device_path, os.O_RDWR)
+    try:
+        os.pwrite(device_fd, bytes(primary_region), 0)
+        os.pwrite(device_fd, backup_region, geometry['backup_entries'] * sector_size)
+        os.fsync(device_fd)
+        if stat.S_ISBLK(os.fstat(device_fd).st_mode):
+            reread_partition_table(device_fd, device_path)
+    finally:
+        os.close(device_fd)
+
+
+def reread_partition_table(
+    device_fd: int,
+    device_path: str,
+) -> None:
+    """
+    Make the kernel pick up a natively written table (sfdisk does this itself) -> BLKRRPART on the device,
+    'partx -u' (per partition BLKPG updates) when partitions of the device are still in use.
+    """
+    import errno
+    import fcntl
+
+    BLKRRPART: int = 0x125f
+    try:
+        fcntl.ioctl(device_fd, BLKRRPART)
+    except OSError as e:
+        if e.errno != errno.EBUSY:
+            # EINVAL -> loop device without partition scanning ('losetup -P'), nothing to update
+            print(f"Kernel did not re-read the partition table of {device_path}: {e}")
+            return
+        print(f"Partitions of {device_path} are in use -> updating the kernel partition table with partx")
+        run_cmd(f"sudo partx -u '{device_path}'")
+
+
+def read_gpt_table(
+    device_path: str,
+    sector_size: int = 512,
+) -> dict[str, Any]:
+    """
+    Read and verify (signature + CRC32s) the primary GPT of a block device or image file.
+    """
+    import uuid
+    import zlib
+
+    device_fd: int = os.open(device_path, os.O_RDONLY)
+    try:
+        header_bytes: bytes = os.pread(device_fd, 92, sector_size)
+        header_fields: list[Any] = list(struct.unpack(gpt_header_format, header_bytes))
+        if header_fields[0] != b'EFI PART':
+            raise ValueError(f"No GPT signature found on '{device_path}'")
+
+        header_crc: int = header_fields[3]
+        header_fields[3] = 0
+        if zlib.crc32(struct.pack(gpt_header_format, *header_fields)) != header_crc:
+            raise ValueError(f"GPT header CRC32 mismatch on '{device_path}'")
+
+        entries_lba, entry_count, entry_size, entries_crc = header_fields[10:14]
+        entries: bytes = os.pread(device_fd, entry_count * entry_size, entries_lba * sector_size)
+        if zlib.crc32(entries) != entries_crc:
+            raise ValueError(f"GPT partition entries CRC32 mismatch on '{device_path}'")
+    finally:
+        os.close(device_fd)
+
+    partitions: list[dict[str, Any]] = []
+    for index in range(entry_count):
+        type_guid, part_guid, start_lba, end_lba, attributes, name = struct.unpack(gpt_entry_format, entries[index * entry_size:index * entry_size + gpt_entry_size])
+        if type_guid == bytes(16):
+            continue
+        partitions.append({
+            'number': index + 1,
+            'type_guid': str(uuid.UUID(bytes_le=type_guid)).upper(),
+            'part_guid': str(uuid.UUID(bytes_le=part_guid)).upper(),
+            'start': start_lba,
+            'end': end_lba,
+            'size': end_lba - start_lba + 1,
+            'attributes': attributes,
+            'name': name.decode('utf-16-le').rstrip('\x00'),
+        })
+
+    return {
+        'disk_guid': str(uuid.UUID(bytes_le=header_fields[9])).upper(),
+        'first_usable': header_fields[7],
+        'last_usable': header_fields[8],
+        'partitions': partitions,
+    }
+
+
+def install_native_gpt(
+    target_device: str,
+    part_definitions: dict[str, Any],
+    variables: dict[str, Any] = {},
+) -> list[dict[str, Any]]:
+    sector_size: int = int(variables.get('sector_size', None) or get_device_sector_size(target_device))
+    total_sectors: int = get_device_total_sectors(target_device, sector_size=sector_size)
+
+    layout: list[dict[str, Any]] = build_gpt_layout(part_definitions, total_sectors, sector_size=sector_size)
+    for part_entry in layout:
+        print(f"GPT entry '{part_entry['key']}': {part_entry['start']}-{part_entry['end']} ({part_entry['end'] - part_entry['start'] + 1} sectors), Type: {part_entry['type_guid']}")
+
+    write_gpt_table(target_device, layout, total_sectors, sector_size=sector_size)
+
+    written_table: dict[str, Any] = read_gpt_table(target_device, sector_size=sector_size)
+    if len(written_table['partitions']) != len(layout):
+        raise ValueError(f"Verifying GPT on '{target_device}' failed -> expected {len(layout)} partitions, found {len(written_table['partitions'])}")
+    return layout
+
+
 def generate_partition_scheme(
     part_scheme_path: str = '/tmp/partitions.sh',
     part_definitions: dict[str, Any] = {},
@@ -552,52 +1817,55 @@ def generate_partition_scheme(
     part_scheme: str = variables.get('scheme', 'gpt')
 
     configured_to_end: bool = False
-    with open(part_scheme_path, 'w+') as part_script:
-        # part_script.write("#! /bin/bash\n")
-        part_script.write(f"label: {part_scheme}\n")
-        part_script.write(f"unit: sectors\n")
+    script_lines: list[str] = []
+    # script_lines.append("#! /bin/bash")
+    script_lines.append(f"label: {part_scheme}")
+    script_lines.append(f"unit: sectors")
+
+    sector_size: str = variables.get('sector_size', None)
+    if sector_size:
+        script_lines.append(f"sector-size: {sector_size}")
 
-        sector_size: str = variables.get('sector_size', None)
-        if sector_size:
-            part_script.write(f"sector-size: {sector_size}\n")
+    for part_key, part_info in part_definitions.items():
 
-        for part_key, part_info in part_definitions.items():
+        line_parts: list[str] = []
 
-            line_parts: list[str] = []
+        start_sector: str = part_info.get('start', None)
+        if start_sector:
+            start_sector_str: str = f"start={start_sector}"
+            line_parts.append(start_sector_str)
 
-            start_sector: str = part_info.get('start', None)
-            if start_sector:
-                start_sector_str: str = f"start={start_sector}"
-                line_parts.append(start_sector_str)
+        part_size: str = part_info.get('size', None)
+        if not part_size and configured_to_end:
+            raise ValueError(f"Partition '{part_key}' is configured to end of disk, but the disk is already filled with previous partitions.")
 
-            part_size: str = part_info.get('size', None)
-            if not part_size and configured_to_end:
-                raise ValueError(f"Partition '{part_key}' is configured to end of disk, but the disk is already filled with previous partitions.")
+        if not part_size:
+            configured_to_end = True
+        else:
+            line_parts.append(f"size={part_size}")
 
-            if not part_size:
-                configured_to_end = True
-            else:
-                line_parts.append(f"size={part_size}")
+        part_type: str = part_info.get('type', None)
+        if not part_type:
+            raise ValueError(f"Partition '{part_key}' is not configured with a type -> is required -> exiting")
 
-            part_type: str = part_info.get('type', None)
-            if not part_type:
-                raise ValueError(f"Partition '{part_key}' is not configured with a type -> is required -> exiting")
+        mapped_part_type = validate_part_type_code(part_type)
+        line_parts.append(f"type={mapped_part_type}")
 
-            mapped_part_type = validate_part_type_code(part_type)
-            line_parts.append(f"type={mapped_part_type}")
+        partition_line: str = '; '.join(line_parts)
+        if not partition_line.strip():
+            raise ValueError(f"Partition '{part_key}' is not configured properly -> skipping partition")
 
-            partition_line: str = '; '.join(line_parts)
-            if not partition_line.strip():
-                raise ValueError(f"Partition '{part_key}' is not configured properly -> skipping partition")
+        print("Adding entry for partition with: ")
+        print(f"Start: {start_sector}, Size: {part_size}, Type: {part_type} -> {mapped_part_type}")
 
-            print("Adding entry for partition with: ")
-            print(f"Start: {start_sector}, Size: {part_size}, Type: {part_type} -> {mapped_part_type}")
+        script_lines.append(partition_line)
 
-            part_script.write(f"{partition_line}\n")
+    part_script_text: str = '\n'.join(script_lines) + '\n'
+    with open(part_scheme_path, 'w+') as part_script:
+        part_script.write(part_script_text)
 
     print(f"GENERATED: ----------- {part_scheme_path} --------------------:")
-    with open(part_scheme_path, 'r') as part_script_fd:
-        print(part_script_fd.read().strip())
+    print(part_script_text.strip())
     print(f"----------------------------------------------------:")
 
     return part_scheme_path
@@ -607,7 +1875,10 @@ def intall_partitions(
     part_scheme_path: str,
     # variables: dict[str, Any] = {},
     config: dict[str, Any] = {},
-    output_script: str | None = None
+    output_script: str | None = None,
+    expected_parts: int | None = None,
+    part_definitions: dict[str, Any] | None = None,
+    variables: dict[str, Any] = {}
 ) -> list[str]:
     target_device: str = config.get('target_device', None)
     if not target_device:
@@ -642,17 +1913,44 @@ def intall_partitions(
         print(f"This will wipe the partition table on device {target_device}:")
         continue_guard()
 
-    run_cmd(f"sudo sfdisk --label gpt --wipe always '{target_device}' < {part_scheme_path}", fd_path=output_script)
+    # Native writer needs direct write access (root or image file), script output always goes through sfdisk
+    use_native_gpt: bool = (
+        config.get('partition_backend', 'native') == 'native'
+        and variables.get('scheme', 'gpt') == 'gpt'
+        and bool(part_definitions)
+        and not output_script
+        and os.access(target_device, os.W_OK)
+    )
+    if is_planning() and part_definitions:
+        run_cmd(f"sudo sfdisk --label gpt --wipe always '{target_device}' < {part_scheme_path}", fd_path=output_script)
+        run_cmd(f"sudo partprobe {target_device}", fd_path=output_script)
+        part_devices: list[str] = plan_partition_model(target_device, part_definitions, variables=variables, config=config)
+        print(f"Planned partitions: {', '.join(part_devices)} @ {target_device}")
+        return part_devices
+
+    if use_native_gpt:
+        print_write(f"Writing GPT partition table natively to '{target_device}'", fd_path=output_script)
+        install_native_gpt(target_device, part_definitions, variables=variables)
+        invalidate_block_topology()
+    else:
+        run_cmd(f"sudo sfdisk --label gpt --wipe always '{target_device}' < {part_scheme_path}", fd_path=output_script)
 
     if shutil.which('partprobe'):
         print(f"Running partprobe on {target_device} to update partition table")
         run_cmd(f"sudo partprobe {target_device}", fd_path=output_script)
 
+    if expected_parts and not output_script:
+        wait_for_partition_nodes(
+            target_device,
+            expected_parts,
+            timeout=float(config.get('settle_timeout', 10))
+        )
+
     # Target device has partitions on it
     # command_produces_output_guard(f"sudo sfdisk -l {target_device} | grep -E \"^/dev/\"")
 
     list_part_devices_cmd: str = f"sudo sfdisk -l '{target_device}' -o Device 2> /dev/null | grep \"^/dev\""
-    part_devices_out = os.popen(list_part_devices_cmd).read().strip()
+    part_devices_out = exec_output(list_part_devices_cmd)
     if not part_devices_out:
         raise ValueError(f"No partitions found on target device '{target_device}' after running partition script -> exiting")
     part_devices: list[str] = part_devices_out.splitlines()
@@ -673,29 +1971,138 @@ command_set: dict[str, str] = {
             'fat32': '-n {part_label}',
             'ntfs': '--label {part_label}',
             'swap': ''
+        },
+        # Device class flags (see 'mkfs_device_profiles') or the partitions 'mkfs_options'
+        'profile_opt': {
+            'btrfs': '{mkfs_profile_args}',
+            'ext4': '{mkfs_profile_args}',
+            'vfat': '{mkfs_profile_args}',
+            'fat32': '{mkfs_profile_args}',
+            'ntfs': '{mkfs_profile_args}',
+            'swap': '{mkfs_profile_args}'
+        },
+        # Only set for 'mkfs.btrfs', when the subvolume layout is created while formatting
+        'rootdir_opt': {
+            'btrfs': '{mkfs_rootdir_args}',
+            'ext4': '',
+            'vfat': '',
+            'fat32': '',
+            'ntfs': '',
+            'swap': ''
         }
     },
     'cmd': {
-        'btrfs': 'mkfs.btrfs {part_label_opt} {part_device}',
-        'ext4': 'mkfs.ext4 {part_label_opt} -F {part_device}',
-        'vfat': 'mkfs.vfat {part_label_opt} -F32 {part_device}',
-        'fat32': 'mkfs.vfat {part_label_opt} -F32 {part_device}',
-        'ntfs': 'mkfs.ntfs --fast {part_label_opt} {part_device}',
-        'swap': 'mkswap {part_device}'
+        'btrfs': 'mkfs.btrfs {part_label_opt} {profile_opt} {rootdir_opt} {part_device}',
+        'ext4': 'mkfs.ext4 {part_label_opt} {profile_opt} -F {part_device}',
+        'vfat': 'mkfs.vfat {part_label_opt} {profile_opt} -F32 {part_device}',
+        'fat32': 'mkfs.vfat {part_label_opt} {profile_opt} -F32 {part_device}',
+        'ntfs': 'mkfs.ntfs --fast {part_label_opt} {profile_opt} {part_device}',
+        'swap': 'mkswap {profile_opt} {part_device}'
         # 'xfs': 'mkfs.xfs -f {part_device}',
     }
 }
 
 
-def check_fs_type(
-    part_device: str,
-) -> str | None:
-    check_fs_type_template: str = "lsblk --noheadings -o FSTYPE {part_device}"
-    check_fs_cmd: str = check_fs_type_template.format(part_device=part_device)
-    fs_type: str = os.popen(check_fs_cmd).read().strip()
-    # print(f"Partition {part_device} already has a filesystem of type {fs_type}")
-    if not fs_type:
-        print(f"Partition {part_device} does not have a filesystem -> returning None")
+# ------------------------ Device class mkfs profiles -------------------------
+# Extra mkfs flags per device class, detected from /sys/block/<disk>/queue/{rotational,discard_max_bytes}:
+# 'image' loop devices: no TRIM (punches holes through the whole backing file), lazy inode table and journal init
+# 'hdd': no TRIM, lazy init as zeroing the inode tables of multi-TB disks takes minutes
+# 'flash' without TRIM support (usb sticks, sd cards): lazy inode table init, no discard attempt
+# 'ssd': discard the whole device once, so the FTL starts with only free blocks
+mkfs_device_profiles: dict[str, dict[str, str]] = {
+    'image': {
+        'ext4': '-E lazy_itable_init=1,lazy_journal_init=1,nodiscard',
+        'btrfs': '--nodiscard',
+    },
+    'hdd': {
+        'ext4': '-E lazy_itable_init=1,lazy_journal_init=1,nodiscard',
+        'btrfs': '--nodiscard',
+    },
+    'flash': {
+        'ext4': '-E lazy_itable_init=1,nodiscard',
+        'btrfs': '--nodiscard',
+    },
+    'ssd': {
+        'ext4': '-E discard',
+    },
+}
+
+
+def get_backing_disk(kname: str) -> str:
+    """
+    Whole disk below a partition and/or device mapper stack (first slave), 'kname' itself for disks.
+    """
+    sys_block_path: str = f"/sys/class/block/{kname}"
+    if os.path.exists(f"{sys_block_path}/partition"):
+        return get_backing_disk(os.path.basename(os.path.dirname(os.path.realpath(sys_block_path))))
+
+    slaves_path: str = f"{sys_block_path}/slaves"
+    slaves: list[str] = sorted(os.listdir(slaves_path)) if os.path.isdir(slaves_path) else []
+    if slaves:
+        return get_backing_disk(slaves[0])
+    return kname
+
+
+def get_device_class(device_path: str) -> str | None:
+    kname: str = os.path.basename(os.path.realpath(device_path))
+    if not kname or not os.path.isdir(f"/sys/class/block/{kname}"):
+        return None
+
+    disk_kname: str = get_backing_disk(kname)
+    if disk_kname.startswith('loop') or read_sys_block_attribute(disk_kname, 'loop/backing_file'):
+        return 'image'
+    if read_sys_block_attribute(disk_kname, 'queue/rotational') == '1':
+        return 'hdd'
+
+    # discards of the written device count, dm-crypt only passes them on with 'allow_discards'
+    discard_max_bytes: str | None = read_sys_block_attribute(kname, 'queue/discard_max_bytes')
+    if discard_max_bytes is None:
+        discard_max_bytes = read_sys_block_attribute(disk_kname, 'queue/discard_max_bytes')
+    if int(discard_max_bytes or 0) > 0:
+        return 'ssd'
+    return 'flash'
+
+
+def get_mkfs_profile_args(
+    part_device: str,
+    filesystem: str,
+    part_info: dict[str, Any],
+    config: dict[str, Any] = {},
+) -> str:
+    if 'mkfs_options' in part_info:
+        return str(part_info['mkfs_options'] or '')
+
+    profile: str | None = part_info.get('mkfs_profile', None) or config.get('mkfs_profile', None) or 'auto'
+    if profile == 'none':
+        return ''
+
+    if profile == 'auto':
+        # While planning (or before partitioning) the partition does not exist yet -> class of the target device
+        profile = get_device_class(part_device) or get_device_class(config.get('target_device', None) or '')
+        if not profile and config.get('simulate', None):
+            profile = 'image'
+        if not profile:
+            return ''
+
+    if profile not in mkfs_device_profiles:
+        raise ValueError(f"Unknown mkfs profile '{profile}' for {part_device} -> expected auto, none or one of {', '.join(mkfs_device_profiles)} -> exiting")
+
+    profile_args: str = mkfs_device_profiles[profile].get(filesystem, '')
+    print(f"Using mkfs profile '{profile}' for {part_device} ({filesystem}) -> '{profile_args}'")
+    return profile_args
+
+
+def check_fs_type(
+    part_device: str,
+    quiet: bool = False,
+    refresh: bool = False,
+) -> str | None:
+    block_device: dict[str, Any] | None = get_block_topology(refresh=refresh).get(part_device)
+    fs_type: str | None = block_device.get('fstype', None) if block_device else None
+    # print(f"Partition {part_device} already has a filesystem of type {fs_type}")
+    if not fs_type:
+        if not quiet:
+            print(f"Partition {part_device} does not have a filesystem -> returning None")
         return None
 
     return fs_type
@@ -705,13 +2112,17 @@ def create_filesystem_on(
     part_device: str,
     filesystem: str,
     part_info: dict[str, Any],
-    config: dict[str, Any] = {}
+    config: dict[str, Any] = {},
+    settle: bool = True,
+    mkfs_variables: dict[str, Any] = {}
 ) -> str:
     mkfs_command: str = inflate_command_set_item(
         filesystem,
         {
             'part_label': part_info.get('name'),
-            'part_device': part_device
+            'part_device': part_device,
+            'mkfs_profile_args': get_mkfs_profile_args(part_device, filesystem, part_info, config),
+            **mkfs_variables
         },
         command_set=command_set
     )
@@ -725,13 +2136,18 @@ def create_filesystem_on(
 
     run_cmd(f"sudo {mkfs_command} || exit", fd_path=output_script)
 
+    # Settling and verifying is deferred to one combined pass (see 'settle_formatted_partitions')
+    if not settle or (output_script and not is_planning()):
+        return filesystem
+
     # Make sure fs changes are synced to prevent check failure
     if shutil.which('partprobe'):
         run_cmd(f"sudo partprobe {part_device}", fd_path=output_script)
-    # needs some time to sync on slow devices
-    time.sleep(1)
-
-    fs_type = check_fs_type(part_device)
+    # needs some time to sync on slow devices -> wait until udev picked up the new signature
+    fs_type = wait_for_fs_signatures(
+        [part_device],
+        timeout=float(config.get('settle_timeout', 10))
+    ).get(part_device)
 
     if not fs_type:
         raise ValueError(f"Failed to create filesystem on {part_device} -> exiting")
@@ -739,16 +2155,158 @@ def create_filesystem_on(
     return fs_type
 
 
+def format_partition(
+    part_device_path: str,
+    part_filesystem: str,
+    part_info: dict[str, Any],
+    config: dict[str, Any] = {},
+    settle: bool = True
+) -> str:
+    part_device_path = prepare_luks_partitions(
+        part_device_path,
+        part_info,
+        config=config
+    )
+
+    return format_filesystem(part_device_path, part_filesystem, part_info, config=config, settle=settle)
+
+
+def format_filesystem(
+    part_device_path: str,
+    part_filesystem: str,
+    part_info: dict[str, Any],
+    config: dict[str, Any] = {},
+    settle: bool = True
+) -> str:
+    """
+    Create the filesystem (and btrfs subvolumes) on an already prepared device, e.g. an opened LUKS container.
+    """
+    output_script: str | None = config.get('output_script', None)
+    subvolumes_info: dict[str, Any] = part_info.get('subvolumes', None)
+    # Separate temporary paths per partition, as several btrfs partitions could be formatted at once
+    part_device_name: str = os.path.basename(part_device_path)
+
+    mkfs_variables: dict[str, Any] = {}
+    created_offline: bool = part_filesystem == 'btrfs' and bool(subvolumes_info) and use_offline_btrfs_subvolumes(part_info, config)
+    if created_offline:
+        rootdir_path: str = f"/tmp/btrfs_rootdir_{part_device_name}"
+        mkfs_variables['mkfs_rootdir_args'] = prepare_btrfs_rootdir(rootdir_path, subvolumes_info, output_script=output_script)
+
+    part_device_fs: str = create_filesystem_on(
+        part_device_path,
+        part_filesystem,
+        part_info,
+        config=config,
+        settle=settle,
+        mkfs_variables=mkfs_variables
+    )
+
+    if created_offline:
+        run_cmd(f"sudo rm -rf '{rootdir_path}'", fd_path=output_script)
+
+    if (part_device_fs != 'btrfs') or not subvolumes_info:
+        return part_device_path
+
+    install_btrfs_subvolumes(
+        part_device_path,
+        subvolumes_info,
+        output_script=output_script,
+        output_requirements=config.get('force_output_requirements', False),
+        config=config,
+        temp_subvol_path=f"/tmp/btrfs_subvolumes_{part_device_name}",
+        created_offline=created_offline
+    )
+    return part_device_path
+
+
+def settle_formatted_partitions(
+    formatted_devices: dict[str, str],
+    config: dict[str, Any] = {},
+) -> None:
+    output_script: str | None = config.get('output_script', None)
+
+    # Make sure fs changes are synced to prevent check failure
+    target_device: str | None = config.get('target_device', None)
+    if shutil.which('partprobe') and target_device:
+        run_cmd(f"sudo partprobe {target_device}", fd_path=output_script)
+    # needs some time to sync on slow devices -> wait until udev picked up all new signatures
+    fs_types: dict[str, str | None] = wait_for_fs_signatures(
+        list(formatted_devices.keys()),
+        timeout=float(config.get('settle_timeout', 10))
+    )
+
+    failed_devices: list[str] = []
+    for part_device, filesystem in formatted_devices.items():
+        if not fs_types.get(part_device):
+            failed_devices.append(f"{part_device} ({filesystem})")
+
+    if failed_devices:
+        raise ValueError(f"Failed to create filesystem on {', '.join(failed_devices)} -> exiting")
+
+
+def resolve_luks_passphrase(
+    part_device: str,
+    part_info: dict[str, Any],
+) -> dict[str, Any]:
+    luks_part_info: dict[str, Any] = part_info.get('luks', None)
+    if not luks_part_info or luks_part_info.get('luks_passphrase', None):
+        return part_info
+
+    luks_passphrase: str = get_luks_passphrase(part_device, luks_part_info)
+
+    return {**part_info, 'luks': {**luks_part_info, 'luks_passphrase': luks_passphrase}}
+
+
+def format_partitions_parallel(
+    format_jobs: list[tuple[str, str, dict[str, Any]]],
+    config: dict[str, Any] = {},
+) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Prompt for missing passphrases up front, input() from worker threads would interleave
+    format_jobs = [
+        (part_device_path, part_filesystem, resolve_luks_passphrase(part_device_path, part_info))
+        for part_device_path, part_filesystem, part_info in format_jobs
+    ]
+
+    max_workers: int = int(config.get('format_jobs', 0) or len(format_jobs))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='format') as executor:
+        format_futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                format_partition,
+                part_device_path,
+                part_filesystem,
+                part_info,
+                config=config,
+                settle=False
+            ): part_filesystem
+            for part_device_path, part_filesystem, part_info in format_jobs
+        }
+        formatted_devices: dict[str, str] = {future.result(): filesystem for future, filesystem in format_futures.items()}
+
+    settle_formatted_partitions(formatted_devices, config=config)
+
+
 def format_partitions(
     part_devices: list[str],
     part_definitions: dict[str, Any] = {},
     # variables: dict[str, Any] = {},
-    config: dict[str, Any] = {}
+    config: dict[str, Any] = {},
+    table_hash: str | None = None
 ) -> None:
     if not part_devices:
         raise ValueError("No partition devices provided to format")
 
-    output_script: str | None = config.get('output_script', None)
+    journal: StageJournal | None = config.get('journal', None)
+
+    parallel_format: bool = config.get('parallel_format', False)
+    if parallel_format and config.get('interactive'):
+        print("Interactive mode is enabled -> formatting partitions one after another")
+        parallel_format = False
+
+    format_jobs: list[tuple[str, str, dict[str, Any]]] = []
+    format_steps: list[tuple[str, str]] = []
 
     index: int = 0
     for part_key, part_info in part_definitions.items():
@@ -761,7 +2319,7 @@ def format_partitions(
             continue
 
         part_device_path: str = part_devices[index]
-        if not os.path.exists(part_device_path):
+        if not os.path.exists(part_device_path) and not is_planning():
             print(f"Partition device {part_device_path} does not exist -> skipping filesystem creation")
             index += 1
             continue
@@ -774,66 +2332,272 @@ def format_partitions(
                 index += 1
                 continue
 
-        part_device_path = prepare_luks_partitions(
-            part_device_path,
-            part_info,
-            config=config
-        )
+        step_key: str = f"partitions/format/{part_key}"
+        step_hash: str = hash_step_inputs(table_hash, part_key, part_info)
+        if parallel_format:
+            if journal and journal.is_done(step_key, step_hash):
+                print(f"Step '{step_key}' completed in a previous run with unchanged inputs -> skipping (resume)")
+            else:
+                format_jobs.append((part_device_path, part_filesystem, part_info))
+                format_steps.append((step_key, step_hash))
+        else:
+            run_journaled_step(
+                step_key,
+                step_hash,
+                format_partition,
+                part_device_path,
+                part_filesystem,
+                part_info,
+                journal=journal,
+                config=config
+            )
 
-        part_device_fs: str = create_filesystem_on(
-            part_device_path,
-            part_filesystem,
-            part_info,
-            config=config
-        )
+        index += 1
 
-        if (part_device_fs != 'btrfs'):
-            index += 1
-            continue
+    if format_jobs:
+        # Concurrent steps are only journaled once all of them succeeded
+        for step_key, _ in format_steps:
+            if journal:
+                journal.begin(step_key)
+        format_partitions_parallel(format_jobs, config=config)
+        for step_key, step_hash in format_steps:
+            if journal:
+                journal.complete(step_key, step_hash)
 
-        subvolumes_info: dict[str, Any] = part_info.get('subvolumes', None)
-        if not subvolumes_info:
-            index += 1
+
+# ------------------------ Handling LUKS disk encryption -------------------------
+# https://www.redhat.com/en/blog/disk-encryption-luks
+
+
+# Per partition tuning under 'luks' in the config, format options are written to the LUKS header,
+# the dm-crypt performance flags are stored in the LUKS2 header with '--persistent' on the first open
+
+luks_format_option_flags: dict[str, str] = {
+    'cipher': '--cipher',
+    'key_size': '--key-size',
+    'sector_size': '--sector-size',
+    'hash': '--hash',
+    'pbkdf': '--pbkdf',
+    'pbkdf_memory': '--pbkdf-memory',  # KiB
+    'pbkdf_parallel': '--pbkdf-parallel',
+    'pbkdf_time': '--iter-time',  # ms
+}
+luks_open_option_flags: dict[str, str] = {
+    'no_read_workqueue': '--perf-no_read_workqueue',
+    'no_write_workqueue': '--perf-no_write_workqueue',
+    'same_cpu_crypt': '--perf-same_cpu_crypt',
+    'submit_from_crypt_cpus': '--perf-submit_from_crypt_cpus',
+    'allow_discards': '--allow-discards',
+}
+
+
+def get_host_key() -> str:
+    cpu_model: str = ''
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo', 'r') as cpuinfo_fd:
+            cpu_model = next((line.split(':', 1)[1].strip() for line in cpuinfo_fd if line.startswith('model name')), '')
+    return f"{os.uname().nodename}|{os.uname().machine}|{cpu_model}"
+
+
+def parse_cryptsetup_benchmark(benchmark_output: str) -> list[dict[str, Any]]:
+    """
+    Parse the cipher lines of 'cryptsetup benchmark' ('aes-xts  512b  2345.6 MiB/s  2456.7 MiB/s').
+    """
+    results: list[dict[str, Any]] = []
+    for line in benchmark_output.splitlines():
+        fields: list[str] = line.split()
+        if len(fields) != 6 or not fields[1].endswith('b') or fields[3] != 'MiB/s' or fields[5] != 'MiB/s':
             continue
+        results.append({
+            'algorithm': fields[0],
+            'key_size': int(fields[1].removesuffix('b')),
+            'encryption': float(fields[2]),
+            'decryption': float(fields[4]),
+        })
+    return results
 
-        install_btrfs_subvolumes(
-            part_device_path,
-            subvolumes_info,
-            output_script=output_script,
-            output_requirements=config.get('force_output_requirements', False),
-            config=config
-        )
 
-        index += 1
+def select_benchmark_cipher(
+    config: dict[str, Any] = {},
+    min_key_size: int = 512,
+) -> dict[str, Any]:
+    """
+    Fastest XTS cipher (slower of encryption/decryption) from 'cryptsetup benchmark', cached per host.
+    Only key sizes >= 'min_key_size' (512b xts -> 256 bit cipher keys) are considered.
+    """
+    import json
+
+    cache_path: str = os.path.join(get_cache_dir(), 'cryptsetup_benchmark.json')
+    host_key: str = get_host_key()
+    benchmark_cache: dict[str, Any] = {}
+    if os.path.exists(cache_path) and not config.get('rebenchmark_luks', False):
+        with open(cache_path, 'r') as cache_fd:
+            benchmark_cache = json.load(cache_fd)
+
+    if host_key not in benchmark_cache:
+        print("Running 'cryptsetup benchmark' to select the fastest LUKS cipher (cached per host)")
+        benchmark_output: str = exec_output(['cryptsetup', 'benchmark'])
+        benchmark_cache[host_key] = parse_cryptsetup_benchmark(benchmark_output)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as cache_fd:
+            json.dump(benchmark_cache, cache_fd, indent=2)
+
+    candidates: list[dict[str, Any]] = [
+        result for result in benchmark_cache[host_key]
+        if result['algorithm'].endswith('-xts') and result['key_size'] >= min_key_size
+    ]
+    if not candidates:
+        # Benchmark not available -> cryptsetup default
+        return {'cipher': 'aes-xts-plain64', 'key_size': 512}
+
+    fastest: dict[str, Any] = max(candidates, key=lambda result: min(result['encryption'], result['decryption']))
+    print(f"Selected LUKS cipher {fastest['algorithm']}-plain64 ({fastest['key_size']}b) -> {fastest['encryption']:.0f}/{fastest['decryption']:.0f} MiB/s")
+    return {'cipher': f"{fastest['algorithm']}-plain64", 'key_size': fastest['key_size']}
+
+
+def get_luks_format_options(
+    luks_info: dict[str, Any],
+    config: dict[str, Any] = {},
+) -> list[str]:
+    format_options: dict[str, Any] = {key: luks_info[key] for key in luks_format_option_flags if luks_info.get(key, None) is not None}
+    if format_options.get('cipher', None) == 'auto':
+        selected_cipher: dict[str, Any] = select_benchmark_cipher(config)
+        format_options['cipher'] = selected_cipher['cipher']
+        format_options.setdefault('key_size', selected_cipher['key_size'])
 
+    option_args: list[str] = []
+    for key, value in format_options.items():
+        option_args.extend([luks_format_option_flags[key], str(value)])
+    return option_args
 
-# ------------------------ Handling LUKS disk encryption -------------------------
-# https://www.redhat.com/en/blog/disk-encryption-luks
+
+def get_luks_open_options(luks_info: dict[str, Any]) -> list[str]:
+    return [flag for key, flag in luks_open_option_flags.items() if luks_info.get(key, False)]
+
+
+# Passphrases are asked once per LUKS mapping name and kept in memory for the run (partitions -> chroot stage).
+# They reach cryptsetup only through its stdin, never through a shell command line ('echo ... |')
+
+luks_passphrase_cache: dict[str, str] = {}
+luks_passphrase_lock = threading.Lock()
+# Mapping name of LUKS partitions without 'luks_device_name' (all stages) -> also the passphrase cache key
+default_luks_device_name: str = 'luks'
+
+
+def get_luks_device_name(luks_info: dict[str, Any]) -> str:
+    return luks_info.get('luks_device_name', None) or default_luks_device_name
+
+
+def get_luks_passphrase(
+    part_device: str,
+    luks_info: dict[str, Any],
+) -> str:
+    if is_planning():
+        # Never write passphrases to the plan (not even configured ones) -> taken from the environment when running the script
+        return plan_luks_passphrase
+    configured_passphrase: str | None = luks_info.get('luks_passphrase', None)
+    if configured_passphrase:
+        return configured_passphrase
+
+    cache_key: str = get_luks_device_name(luks_info)
+    # Lock also serializes prompts of concurrent unlocks
+    with luks_passphrase_lock:
+        if cache_key not in luks_passphrase_cache:
+            luks_passphrase: str = input(f"Please enter the passphrase for the LUKS partition {part_device}: ").strip()
+            if not luks_passphrase:
+                raise ValueError("LUKS passphrase is required but not provided -> exiting")
+            luks_passphrase_cache[cache_key] = luks_passphrase
+        return luks_passphrase_cache[cache_key]
+
+
+def run_with_passphrase(
+    cmd: list[str],
+    luks_passphrase: str,
+) -> None:
+    if is_planning():
+        import shlex
+        # Only the environment placeholder is expanded by the shell, literal values are quoted
+        passphrase_arg: str = f"\"{luks_passphrase}\"" if luks_passphrase == plan_luks_passphrase else shlex.quote(luks_passphrase)
+        run_cmd(f"echo -n {passphrase_arg} | {' '.join(cmd)}")
+        return
+
+    print(' '.join(cmd))
+    exec_cmd(cmd, capture=False, check=True, input_text=luks_passphrase)
+
+
+def get_open_luks_backing(luks_device_name: str) -> list[str] | None:
+    """
+    Kernel names of the devices an open dm-crypt mapping 'luks_device_name' is backed by, None if not open.
+    """
+    for kname in os.listdir('/sys/class/block'):
+        if not kname.startswith('dm-'):
+            continue
+        if read_sys_block_attribute(kname, 'dm/name') != luks_device_name:
+            continue
+        if not (read_sys_block_attribute(kname, 'dm/uuid') or '').startswith('CRYPT-'):
+            continue
+        return os.listdir(f"/sys/class/block/{kname}/slaves")
+    return None
 
 
 def unlock_luks_partition(
     part_device: str,
-    luks_device_name: str = 'bootsluks',
+    luks_device_name: str = default_luks_device_name,
     luks_passphrase: str | None = None,
+    open_options: list[str] | None = None,
 ) -> str:
     output_script = None
 
     luks_device_path: str = f"/dev/mapper/{luks_device_name}"
-    if os.path.exists(luks_device_path):
-        print(f"LUKS device {luks_device_name} at path {luks_device_path} already exists -> closing before reopening")
+    open_backing: list[str] | None = get_open_luks_backing(luks_device_name)
+    if open_backing is not None:
+        # Each open costs a full key derivation (argon2) -> reuse a mapping which is already open on the right device
+        if os.path.basename(os.path.realpath(part_device)) in open_backing:
+            print(f"LUKS device {luks_device_name} is already open on {part_device} -> reusing {luks_device_path}")
+            return luks_device_path
+
+        print(f"LUKS device {luks_device_name} at path {luks_device_path} is open on {', '.join(open_backing)} -> closing before reopening")
         run_cmd(f"sudo cryptsetup luksClose {luks_device_name}")
 
     if not luks_passphrase:
-        luks_passphrase = input(f"Please enter the passphrase for the LUKS partition {part_device}: ").strip()
-        if not luks_passphrase:
-            raise ValueError("LUKS passphrase is required but not provided -> exiting")
+        luks_passphrase = get_luks_passphrase(part_device, {'luks_device_name': luks_device_name})
 
     print_write(f"Opening LUKS partition {part_device} with name {luks_device_name}", fd_path=output_script)
-    luks_open_cmd: str = f"echo -n \"{luks_passphrase}\" | sudo cryptsetup luksOpen '{part_device}' {luks_device_name} --key-file -"
-    print(luks_open_cmd)
-    run_cmd(luks_open_cmd, fd_path=output_script)
+    run_with_passphrase(['sudo', 'cryptsetup', 'luksOpen', part_device, luks_device_name, '--key-file', '-', *(open_options or [])], luks_passphrase)
+
+    return luks_device_path
 
-    return "/dev/mapper/" + luks_device_name
+
+def unlock_luks_partitions(
+    luks_jobs: list[tuple[str, str, dict[str, Any]]],
+    max_workers: int = 4,
+) -> dict[str, str]:
+    """
+    Unlock several LUKS containers concurrently -> {part_key: mapped device path}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not luks_jobs:
+        return {}
+
+    # Prompt for all passphrases up front, before the key derivations run in parallel
+    unlock_args: list[tuple[str, str, str, str, list[str]]] = [
+        (part_key, part_device, get_luks_device_name(luks_info), get_luks_passphrase(part_device, luks_info), get_luks_open_options(luks_info))
+        for part_key, part_device, luks_info in luks_jobs
+    ]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='luks') as executor:
+        unlock_futures = {
+            part_key: executor.submit(
+                contextvars.copy_context().run,
+                unlock_luks_partition,
+                part_device,
+                luks_device_name=luks_device_name,
+                luks_passphrase=luks_passphrase,
+                open_options=open_options
+            )
+            for part_key, part_device, luks_device_name, luks_passphrase, open_options in unlock_args
+        }
+        return {part_key: future.result() for part_key, future in unlock_futures.items()}
 
 
 def install_luks_partition(
@@ -843,12 +2607,8 @@ def install_luks_partition(
     output_requirements: bool = False,
     config: dict[str, Any] = {}
 ) -> None:
-    luks_device_name: str = luks_part_info.get('luks_device_name', 'luks')
-    luks_passphrase: str = luks_part_info.get('luks_passphrase', None)
-    if not luks_passphrase:
-        luks_passphrase = input(f"Please enter the passphrase for the LUKS partition {part_device}: ").strip()
-        if not luks_passphrase:
-            raise ValueError("LUKS passphrase is required but not provided -> exiting")
+    luks_device_name: str = get_luks_device_name(luks_part_info)
+    luks_passphrase: str = get_luks_passphrase(part_device, luks_part_info)
 
     ensure_requirements(
         'cryptsetup',
@@ -858,19 +2618,25 @@ def install_luks_partition(
         output_requirements=output_requirements
     )
 
-    luks_format_cmd: str = f"echo -n \"{luks_passphrase}\" | sudo cryptsetup luksFormat \"{part_device}\" --batch-mode --type luks2 --key-file -"
     # --batch-mode --> non interactive
+    luks_format_cmd: list[str] = [
+        'sudo', 'cryptsetup', 'luksFormat', part_device, '--batch-mode', '--type', 'luks2', '--key-file', '-',
+        *get_luks_format_options(luks_part_info, config=config)
+    ]
 
-    print(f"Running LUKS format command: {luks_format_cmd}")
+    print(f"Running LUKS format command: {' '.join(luks_format_cmd)}")
     if config.get('interactive'):
         continue_guard()
 
-    run_cmd(luks_format_cmd, fd_path=output_script)
+    run_with_passphrase(luks_format_cmd, luks_passphrase)
 
+    # First open stores the performance flags in the LUKS2 header -> applied on every later open
+    open_options: list[str] = get_luks_open_options(luks_part_info)
     return unlock_luks_partition(
         part_device,
         luks_device_name=luks_device_name,
-        luks_passphrase=luks_passphrase
+        luks_passphrase=luks_passphrase,
+        open_options=[*open_options, '--persistent'] if open_options else None
     )
 
 
@@ -899,12 +2665,164 @@ def prepare_luks_partitions(
 # https://btrfs.readthedocs.io/en/latest/btrfs-property.html#man-property-set
 
 
+# 'mkfs.btrfs --rootdir <dir> --subvol [ro:]<dir>' (btrfs-progs >= 6.7, flags >= 6.11) creates the subvolume layout while
+# formatting and 'btrfs filesystem mkswapfile' (>= 6.1) the swapfile in one process -> detected once per run
+btrfs_capabilities: dict[str, bool] | None = None
+btrfs_capabilities_lock = threading.Lock()
+
+# linux/fs.h
+fs_ioc_getflags: int = 0x80086601
+fs_ioc_setflags: int = 0x40086602
+fs_nocow_fl: int = 0x00800000
+
+
+def get_btrfs_capabilities() -> dict[str, bool]:
+    global btrfs_capabilities
+    with btrfs_capabilities_lock:
+        if btrfs_capabilities is None:
+            mkfs_help_result: CommandResult = exec_cmd(['mkfs.btrfs', '--help'])
+            mkfs_help: str = mkfs_help_result['stdout'] + mkfs_help_result['stderr']
+            btrfs_capabilities = {
+                'mkfs_subvol': '--subvol' in mkfs_help,
+                'mkfs_subvol_flags': 'TYPE:SUBDIR' in mkfs_help,
+                'mkswapfile': exec_cmd(['btrfs', 'filesystem', 'mkswapfile', '--help'])['returncode'] == 0,
+            }
+        return btrfs_capabilities
+
+
+def use_offline_btrfs_subvolumes(
+    part_info: dict[str, Any],
+    config: dict[str, Any] = {},
+) -> bool:
+    if not part_info.get('offline_subvolumes', config.get('offline_btrfs_subvolumes', False)):
+        return False
+
+    if not get_btrfs_capabilities()['mkfs_subvol']:
+        print(f"mkfs.btrfs does not support '--subvol' (btrfs-progs < 6.7) -> creating subvolumes of {part_info.get('name')} on a mounted filesystem")
+        return False
+    return True
+
+
+def is_btrfs_swap_subvolume(
+    subvol_key: str,
+    subvol_info: dict[str, Any],
+) -> bool:
+    return bool(subvol_info.get('swap', False)) or subvol_key == 'swap'
+
+
+def get_btrfs_mounted_setup_steps(
+    subvol_key: str,
+    subvol_info: dict[str, Any],
+) -> list[str]:
+    """
+    Subvolume setup steps which can only be applied on the mounted filesystem.
+    """
+    steps: list[str] = []
+    if get_first_defined_key(subvol_info, ['compression', 'compress'], None):
+        steps.append('compression')
+    if subvol_info.get('nocow', False):
+        steps.append('nocow')
+    if is_btrfs_swap_subvolume(subvol_key, subvol_info):
+        steps.append('swap')
+    return steps
+
+
+def is_offline_read_only(
+    subvol_key: str,
+    subvol_info: dict[str, Any],
+) -> bool:
+    # A read-only subvolume can not be changed afterwards -> only flag it at mkfs time when nothing follows
+    return (
+        bool(subvol_info.get('read_only', False))
+        and get_btrfs_capabilities()['mkfs_subvol_flags']
+        and not get_btrfs_mounted_setup_steps(subvol_key, subvol_info)
+    )
+
+
+def prepare_btrfs_rootdir(
+    rootdir_path: str,
+    subvolumes_info: dict[str, Any],
+    output_script: str | None = None,
+) -> str:
+    """
+    Create an empty directory tree for the subvolumes and return the matching 'mkfs.btrfs' arguments.
+    Directories are created through sudo, as mkfs copies their owner and mode to the subvolume roots.
+    """
+    subvol_names: list[str] = []
+    subvol_args: list[str] = []
+    for subvol_key, subvol_info in subvolumes_info.items():
+        subvol_name: str = subvol_info.get('name', subvol_key)
+        subvol_names.append(subvol_name)
+        subvol_type: str = 'ro:' if is_offline_read_only(subvol_key, subvol_info) else ''
+        subvol_args.append(f"--subvol '{subvol_type}{subvol_name}'")
+
+    subvol_dirs: str = ' '.join(f"'{os.path.join(rootdir_path, subvol_name)}'" for subvol_name in subvol_names)
+    print_write(f"Creating subvolume layout {', '.join(subvol_names)} for mkfs.btrfs in {rootdir_path}", fd_path=output_script)
+    run_cmd(f"sudo rm -rf '{rootdir_path}' && sudo mkdir -p {subvol_dirs}", fd_path=output_script)
+
+    return f"--rootdir '{rootdir_path}' {' '.join(subvol_args)}"
+
+
+def get_btrfs_swap_size(subvol_info: dict[str, Any]) -> str:
+    swap_size: str | None = subvol_info.get('size', None)
+    if swap_size is not None:
+        return str(swap_size)
+
+    with open('/proc/meminfo', 'r') as fd:
+        for line in fd:
+            if line.startswith('MemTotal:'):
+                # value is in KiB
+                return f"{line.split()[1]}K"
+
+    raise ValueError("Swap size is not defined in the subvolume info and could not be determined from /proc/meminfo -> exiting")
+
+
+def create_nocow_file(
+    file_path: str,
+    size_bytes: int,
+) -> None:
+    import fcntl
+    fd: int = os.open(file_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+    try:
+        # the nocow flag is only honoured while the file is still empty
+        flags: int = struct.unpack('i', fcntl.ioctl(fd, fs_ioc_getflags, struct.pack('i', 0)))[0]
+        fcntl.ioctl(fd, fs_ioc_setflags, struct.pack('i', flags | fs_nocow_fl))
+        os.posix_fallocate(fd, 0, size_bytes)
+        os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+
+
+def create_btrfs_swapfile(
+    swap_file: str,
+    swap_size: str,
+    output_script: str | None = None,
+) -> None:
+    print_write(f"Creating swapfile {swap_file} with size {swap_size}", fd_path=output_script)
+    if get_btrfs_capabilities()['mkswapfile']:
+        run_cmd(f"sudo btrfs filesystem mkswapfile --size {swap_size} '{swap_file}'", fd_path=output_script)
+        return
+
+    if not output_script and os.geteuid() == 0:
+        create_nocow_file(swap_file, parse_sector_count(swap_size, sector_size=1))
+        run_cmd(f"mkswap '{swap_file}'", fd_path=output_script)
+        return
+
+    run_cmd(
+        f"sudo truncate -s 0 '{swap_file}' && sudo chattr +C '{swap_file}' && sudo fallocate -l {swap_size} '{swap_file}'"
+        f" && sudo chmod 600 '{swap_file}' && sudo mkswap '{swap_file}'",
+        fd_path=output_script
+    )
+
+
 def install_btrfs_subvolumes(
     part_device: str,
     subvolumes_info: dict[str, Any],
     output_script: str | None = None,
     output_requirements: bool = False,
-    config: dict[str, Any] = {}
+    config: dict[str, Any] = {},
+    temp_subvol_path: str = '/tmp/btrfs_subvolumes',
+    created_offline: bool = False
 ) -> None:
 
     ensure_requirements(
@@ -915,7 +2833,18 @@ def install_btrfs_subvolumes(
         output_requirements=output_requirements
     )
 
-    temp_subvol_path: str = '/tmp/btrfs_subvolumes'
+    # Subvolumes created by mkfs.btrfs only need a mount for properties, nocow and swapfiles
+    pending_subvolumes: dict[str, Any] = subvolumes_info
+    if created_offline:
+        pending_subvolumes = {
+            subvol_key: subvol_info for subvol_key, subvol_info in subvolumes_info.items()
+            if get_btrfs_mounted_setup_steps(subvol_key, subvol_info)
+            or (subvol_info.get('read_only', False) and not is_offline_read_only(subvol_key, subvol_info))
+        }
+        if not pending_subvolumes:
+            print_write(f"Subvolumes of {part_device} were created by mkfs.btrfs -> skipping mount", fd_path=output_script)
+            return
+
     if not os.path.exists(temp_subvol_path):
 
         if not output_script:
@@ -923,16 +2852,17 @@ def install_btrfs_subvolumes(
         else:
             append_cmd(f"mkdir -p '{temp_subvol_path}'", fd_path=output_script)
 
-    run_cmd(f"sudo mount '{part_device}' '{temp_subvol_path}'", fd_path=output_script)
+    mount_device(part_device, temp_subvol_path, fd_path=output_script, fstype='btrfs')
 
-    for subvol_key, subvol_info in subvolumes_info.items():
+    for subvol_key, subvol_info in pending_subvolumes.items():
         subvol_name: str = subvol_info.get('name', subvol_key)
 
         subvol_path: str = os.path.join(temp_subvol_path, subvol_name)
-        subvol_cmd: str = f"sudo btrfs subvolume create '{subvol_path}'"
+        if not created_offline:
+            subvol_cmd: str = f"sudo btrfs subvolume create '{subvol_path}'"
 
-        print_write(f"Creating Btrfs subvolume {subvol_name} at {subvol_path} with command: {subvol_cmd}", fd_path=output_script)
-        run_cmd(subvol_cmd, fd_path=output_script)
+            print_write(f"Creating Btrfs subvolume {subvol_name} at {subvol_path} with command: {subvol_cmd}", fd_path=output_script)
+            run_cmd(subvol_cmd, fd_path=output_script)
 
         compression_option: str = get_first_defined_key(subvol_info, ['compression', 'compress'], None)
         if compression_option:
@@ -946,54 +2876,39 @@ def install_btrfs_subvolumes(
             print(f"Setting compression for subvolume {subvol_name} with command: {set_compression_cmd}")
             run_cmd(set_compression_cmd, fd_path=output_script)
 
-        read_only_option: bool = subvol_info.get('read_only', False)
-        if read_only_option:
-            set_read_only_cmd: str = f"sudo btrfs property set '{subvol_path}' ro true"
-            print(f"Setting subvolume {subvol_name} to read-only with command: {set_read_only_cmd}")
-            run_cmd(set_read_only_cmd, fd_path=output_script)
-
         no_cow_option: bool = subvol_info.get('nocow', False)
         if no_cow_option:
             # recursively set nocow to all files in the subvolume dir
             set_nocow_cmd: str = f"chattr -R +C '{subvol_path}'"
             run_cmd(set_nocow_cmd, fd_path=output_script)
 
-        is_swap: str = subvol_info.get('swap', False)
-        if is_swap or subvol_key == 'swap':
-            swap_size: str = subvol_info.get('size', None)
-            if swap_size is None:
-                get_memory_size_cmd: str = "grep MemTotal /proc/meminfo | tr -s ' ' | cut -d ' ' -f2"
-                swap_size = os.popen(get_memory_size_cmd).read().strip()
-                if not swap_size:
-                    raise ValueError("Swap size is not defined in the subvolume info and could not be determined from /proc/meminfo -> exiting")
-
-            run_cmd(f"sudo mount '{part_device}' -o 'defaults,nodatacow,nodatasum,noatime,compress=no,subvol={subvol_name}' '{subvol_path}'")
-
-            swap_file = f"{subvol_path}/swapfile"
-            run_cmd(f"sudo truncate -s 0 '{swap_file}'", fd_path=output_script)
-            run_cmd(f"chattr +C '{swap_file}'", fd_path=output_script)
-            run_cmd(f"sudo fallocate -l '{swap_size}' '{swap_file}'", fd_path=output_script)
-            run_cmd(f"sudo chmod 600 '{swap_file}'", fd_path=output_script)
-            run_cmd(f"sudo mkswap '{swap_file}'", fd_path=output_script)
-
-            run_cmd(f"sudo umount '{subvol_path}'")
+        if is_btrfs_swap_subvolume(subvol_key, subvol_info):
+            # nocow is set on the swapfile itself -> no separate 'nodatacow' mount of the subvolume required
+            create_btrfs_swapfile(f"{subvol_path}/swapfile", get_btrfs_swap_size(subvol_info), output_script=output_script)
 
             # should be done in running system
             # run_cmd(f"sudo swapon '{swap_file}'", fd_path=output_script)
 
+        # last, as a read-only subvolume rejects the changes above
+        read_only_option: bool = subvol_info.get('read_only', False)
+        if read_only_option:
+            set_read_only_cmd: str = f"sudo btrfs property set '{subvol_path}' ro true"
+            print(f"Setting subvolume {subvol_name} to read-only with command: {set_read_only_cmd}")
+            run_cmd(set_read_only_cmd, fd_path=output_script)
+
     # sudo btrfs subvolume list /tmp/btrfs_subvolumes
-    run_cmd(f"sudo umount '{temp_subvol_path}'", fd_path=output_script)
+    umount_path(temp_subvol_path, fd_path=output_script)
 
     if output_script:
         return
 
     # check_anything_mounted_cmd: str = f"findmnt --noheadings {temp_subvol_path}"
-    check_anything_mounted_cmd: str = f"mount | grep -o '{temp_subvol_path}'"
-    mounted_info: str = os.popen(check_anything_mounted_cmd).read().strip()
+    temp_subvol_real_path: str = os.path.realpath(temp_subvol_path)
+    mounted_info: list[str] = [mount['mount_point'] for mount in read_mountinfo() if mount['mount_point'].startswith(temp_subvol_real_path)]
     if mounted_info:
         print(f"Warning: Something under {temp_subvol_path} is still mounted after unmounting -> skipping remove -> please check manually")
     else:
-        command_output = os.popen(f"ls '{temp_subvol_path}' | wc -l").read().strip()
+        command_output = len(os.listdir(temp_subvol_path))
         print(f"Removing temporary subvolume mount directory {temp_subvol_path} containing {command_output} entries?")
         if config.get('interactive'):
             continue_guard()
@@ -1028,14 +2943,17 @@ def setup_loopback_device(
     else:
         print_write(f"Using existing simulation image at {image_path}")
 
-    if not is_mountable_image(image_path):
+    if not is_planning() and not is_mountable_image(image_path):
         raise ValueError(f"Simulation path '{image_path}' is not a valid mountable image file -> valid extensions:"
                          f" {', '.join(default_valid_img_extensions)} -> exiting")
 
     if os.path.exists(target_device_path):
         if os.path.islink(target_device_path):
             print_write(f"Removing existing symlink {target_device_path} to recreate it")
-            os.remove(target_device_path)
+            if is_planning():
+                run_cmd(f"sudo rm -f '{target_device_path}'")
+            else:
+                os.remove(target_device_path)
         else:
             raise ValueError(f"Simulation loop device {target_device_path} already exists and is not a symlink -> please remove it manually or use a different name")
 
@@ -1043,6 +2961,8 @@ def setup_loopback_device(
 
     # setup loop device to image and create symlink to it at specified path, as loop device numbers are not guaranteed to stay the same
     run_cmd(f"sudo ln -s \"$(sudo losetup --partscan --find --show '{image_path}')\" {target_device_path} || exit 1")
+    if is_planning():
+        return target_device_path
     if not os.path.exists(target_device_path):
         raise ValueError(f"Simulation loop device {target_device_path} does not exist after 'losetup' -> please run the script with root privileges or create the device manually")
 
@@ -1135,8 +3055,220 @@ def is_mountable_image(
     return False
 
 
+# ------------------------ Simulation image store -------------------------
+# Keeps partitioned + formatted base images keyed by their partition definitions,
+# new simulation runs clone them (reflink -> copy_file_range -> sparse copy) instead of re-partitioning
+# Note: clones share filesystem, LUKS and GPT UUIDs with the base image -> never attach several clones at once (batch mode)
+
+FICLONE: int = 0x40049409
+
+
+def copy_file_extents(
+    source_fd: int,
+    target_fd: int,
+    offset: int,
+    length: int,
+) -> None:
+    copied: int = 0
+    while copied < length:
+        try:
+            chunk_copied: int = os.copy_file_range(source_fd, target_fd, length - copied, offset + copied, offset + copied)
+        except (AttributeError, OSError):
+            chunk: bytes = os.pread(source_fd, min(length - copied, 8 * 1024 * 1024), offset + copied)
+            chunk_copied = os.pwrite(target_fd, chunk, offset + copied)
+        if chunk_copied <= 0:
+            raise ValueError(f"Copying image data stopped at offset {offset + copied} -> exiting")
+        copied += chunk_copied
+
+
+def clone_image_file(
+    source_path: str,
+    target_path: str,
+) -> str:
+    """
+    Clone an image file, returns the method used: 'reflink', or 'sparse' (only data extents are copied).
+    """
+    import fcntl
+
+    source_fd: int = os.open(source_path, os.O_RDONLY)
+    try:
+        target_fd: int = os.open(target_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            try:
+                fcntl.ioctl(target_fd, FICLONE, source_fd)
+                return 'reflink'
+            except OSError:
+                pass
+
+            image_size: int = os.fstat(source_fd).st_size
+            os.ftruncate(target_fd, image_size)
+
+            offset: int = 0
+            while offset < image_size:
+                try:
+                    data_start: int = os.lseek(source_fd, offset, os.SEEK_DATA)
+                except OSError:
+                    # No more data after offset -> rest of the file is a hole
+                    break
+                data_end: int = os.lseek(source_fd, data_start, os.SEEK_HOLE)
+                copy_file_extents(source_fd, target_fd, data_start, data_end - data_start)
+                offset = data_end
+
+            os.fsync(target_fd)
+            return 'sparse'
+        finally:
+            os.close(target_fd)
+    finally:
+        os.close(source_fd)
+
+
+def get_image_store_salt(image_store: str) -> bytes:
+    # Random per store, only readable by its owner -> passphrase digests in file names can not be looked up
+    salt_path: str = os.path.join(image_store, '.passphrase_salt')
+    os.makedirs(image_store, exist_ok=True)
+    try:
+        salt_fd: int = os.open(salt_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(salt_path, 'rb') as salt_file:
+            return salt_file.read()
+
+    salt: bytes = os.urandom(16)
+    try:
+        os.write(salt_fd, salt)
+    finally:
+        os.close(salt_fd)
+    return salt
+
+
+def get_luks_passphrase_digests(
+    part_definitions: dict[str, Any],
+    image_store: str,
+) -> dict[str, str]:
+    """
+    Salted digests of the LUKS passphrases per partition -> a changed passphrase selects another base image.
+    """
+    import hashlib
+
+    passphrase_digests: dict[str, str] = {}
+    for part_key, part_info in part_definitions.items():
+        luks_info: dict[str, Any] | None = part_info.get('luks', None) if isinstance(part_info, dict) else None
+        if not isinstance(luks_info, dict):
+            continue
+        # Same cache key as formatting -> asked only once
+        luks_passphrase: str = get_luks_passphrase(part_key, luks_info)
+        passphrase_digests[part_key] = hashlib.pbkdf2_hmac('sha256', luks_passphrase.encode(), get_image_store_salt(image_store), 100_000).hex()[:16]
+    return passphrase_digests
+
+
+def get_base_image_path(
+    part_definitions: dict[str, Any],
+    variables: dict[str, Any] = {},
+    config: dict[str, Any] = {},
+    declared_variable_keys: list[str] = [],
+) -> str:
+    import hashlib
+    import json
+
+    image_store: str = os.path.expanduser(config.get('image_store', None) or '/var/tmp/bootstrap_image_store')
+    # Everything which changes the formatted image, not only the partition table
+    base_image_inputs: dict[str, Any] = {
+        'parts': part_definitions,
+        'variables': {key: variables.get(key, None) for key in declared_variable_keys if 'passphrase' not in key},
+        'scheme': variables.get('scheme', 'gpt'),
+        'sector_size': variables.get('sector_size', None),
+        'sim_size': config.get('sim_size', None),
+        'partition_backend': config.get('partition_backend', None),
+        'mkfs_profile': config.get('mkfs_profile', None),
+        'offline_btrfs_subvolumes': bool(config.get('offline_btrfs_subvolumes', False)) and get_btrfs_capabilities()['mkfs_subvol'],
+        'luks_passphrases': get_luks_passphrase_digests(part_definitions, image_store),
+    }
+    base_image_key: str = hashlib.sha256(json.dumps(base_image_inputs, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return os.path.join(image_store, f"base-{base_image_key}.img")
+
+
+def store_base_image(
+    image_path: str,
+    base_image_path: str,
+) -> None:
+    # Flush loop device and filesystem buffers before copying the backing file
+    exec_cmd(['sync'])
+    os.makedirs(os.path.dirname(base_image_path), exist_ok=True)
+    # Unique temp name, concurrent batch runs could store the same base image
+    temp_base_image_path: str = f"{base_image_path}.{os.getpid()}-{threading.get_ident()}.partial"
+    clone_method: str = clone_image_file(image_path, temp_base_image_path)
+    os.replace(temp_base_image_path, base_image_path)
+    print_write(f"Stored base image {base_image_path} ({clone_method} copy of {image_path})")
+
+
+def get_image_loop_devices(image_path: str) -> list[str]:
+    image_real_path: str = os.path.realpath(image_path)
+    loop_devices: list[str] = []
+    for kname in sorted(os.listdir('/sys/block')):
+        backing_file: str | None = read_sys_block_attribute(kname, 'loop/backing_file') if kname.startswith('loop') else None
+        if backing_file and os.path.realpath(backing_file.removesuffix(' (deleted)')) == image_real_path:
+            loop_devices.append(f"/dev/{kname}")
+    return loop_devices
+
+
+def restore_base_image(
+    base_image_path: str,
+    image_path: str,
+) -> bool:
+    if not os.path.exists(base_image_path):
+        return False
+
+    # Truncating an image which is still attached (previous run) would corrupt everything mounted from it
+    for loop_device in get_image_loop_devices(image_path):
+        print_write(f"Simulation image {image_path} is still attached to {loop_device} -> detaching it before restoring")
+        cleanup_device_resources(loop_device)
+    attached_loop_devices: list[str] = get_image_loop_devices(image_path)
+    if attached_loop_devices:
+        raise ValueError(f"Simulation image {image_path} is still attached to {', '.join(attached_loop_devices)} -> can not restore the base image -> exiting")
+
+    clone_method: str = clone_image_file(base_image_path, image_path)
+    print_write(f"Restored simulation image {image_path} from base image {base_image_path} ({clone_method} copy)")
+    return True
+
+
+# Devices to tear down on exit -> drained by one atexit hook, batch images (un)register concurrently
+exit_cleanup_devices: list[str] = []
+exit_cleanup_lock = threading.Lock()
+exit_cleanup_registered: bool = False
+
+
+def register_device_cleanup(target_device: str) -> None:
+    global exit_cleanup_registered
+    with exit_cleanup_lock:
+        if target_device not in exit_cleanup_devices:
+            exit_cleanup_devices.append(target_device)
+        if not exit_cleanup_registered:
+            atexit.register(cleanup_registered_devices_at_exit)
+            exit_cleanup_registered = True
+
+
+def unregister_device_cleanup(device_path: str) -> None:
+    real_device_path: str = os.path.realpath(device_path)
+    with exit_cleanup_lock:
+        exit_cleanup_devices[:] = [
+            target_device for target_device in exit_cleanup_devices
+            if target_device != device_path and os.path.realpath(target_device) != real_device_path
+        ]
+
+
+def cleanup_registered_devices_at_exit() -> None:
+    with exit_cleanup_lock:
+        pending_devices: list[str] = list(reversed(exit_cleanup_devices))
+    for target_device in pending_devices:
+        # One failing device must not leak the resources of the others
+        try:
+            cleanup_resources_at_exit(target_device)
+        except Exception as e:
+            print(f"Cleanup of {target_device} on exit failed: {e}")
+
+
 def cleanup_resources_at_exit(target_device: str) -> None:
-    cleanup_device_resources(target_device)
+    session_writer.flush()
+    cleanup_device_resources(target_device, max_workers=1)
 
     if os.path.islink(target_device) and target_device.startswith('/dev/'):
         print(f"Removing symlink {target_device} on exit")
@@ -1151,8 +3283,9 @@ def setup_device_node_cleanup(
         print("No target device defined in the configuration under 'target_device' -> skipping cleanup setup")
         return
 
-    if not disable_close_cleanup:
-        atexit.register(cleanup_resources_at_exit, target_device=target_device)
+    # Nothing was attached or mounted while planning
+    if not disable_close_cleanup and not is_planning():
+        register_device_cleanup(target_device)
 
 
 def find_target_device(
@@ -1176,7 +3309,7 @@ def find_target_device(
     if target_device.startswith('/dev/'):
         raise ValueError(f"Target device '{target_device}' does not exist in the system -> exiting")
 
-    lsblk_json_output: dict[str, Any] = lsblk_json()
+    lsblk_json_output: list[dict[str, Any]] = lsblk_json()
 
     for block_device in lsblk_json_output:
         if block_device.get('label') == target_device or block_device.get('name') == target_device:
@@ -1191,11 +3324,13 @@ def find_target_device(
 
                 return resolved_device
 
-    find_by_id_cmd = f"ls /dev/disk/by-id | grep {target_device} | grep --invert-match '\\-part'"
-    target_device_id: str = os.popen(find_by_id_cmd).read().strip()
-    if target_device_id:
-        if len(target_device_id.splitlines()) > 1:
+    by_id_dir: str = '/dev/disk/by-id'
+    device_ids: list[str] = os.listdir(by_id_dir) if os.path.isdir(by_id_dir) else []
+    matched_device_ids: list[str] = [device_id for device_id in device_ids if target_device in device_id and '-part' not in device_id]
+    if matched_device_ids:
+        if len(matched_device_ids) > 1:
             raise ValueError(f"Multiple devices found with ID '{target_device}' -> please specify a unique device name or ID")
+        target_device_id: str = matched_device_ids[0]
         device_path: str = f"/dev/disk/by-id/{target_device_id}"
         if not os.path.exists(device_path):
             raise ValueError(f"Target device ID '{target_device_id}' does not exist in the system -> exiting")
@@ -1217,6 +3352,9 @@ def prepare_target_device_lifecycle(
     use_existing=False,
     disable_close_cleanup: bool = False
 ) -> None:
+    # Batch runs bind every image to its own loop device symlink
+    loop_device_path = config.get('loop_device', None) or loop_device_path
+
     sim_path: str = config.get('simulate', None)
     if sim_path:
         target_device = setup_simulation_environment(
@@ -1271,43 +3409,107 @@ def exec_partitions_installer(
     system_type: str = 'debian',
     output_script: str | None = None
 ) -> None:
+    # 'get_variables' merges the whole config into the variables -> remember which ones the stage declares
+    declared_variable_keys: list[str] = list(stage_cfg.get('variables', None) or {})
     variables: dict[str, Any] = get_variables(stage_cfg, config=config)
     config.update(variables)
-
-    prepare_target_device_lifecycle(
-        config,
-        use_existing=False
-    )
+    output_script = output_script or config.get('output', None)
 
     parts: dict[str, Any] = get_first_defined_key(
         stage_cfg,
         ['partitions', 'parts'],
         {}
     )
+
+    sim_path: str | None = config.get('simulate', None)
+    base_image_path: str | None = None
+    # Restoring/storing copies real files -> never while planning or writing a script
+    if sim_path and parts and config.get('reuse_base_image') and not is_planning() and not output_script:
+        sim_path = os.path.realpath(sim_path)
+        base_image_path = get_base_image_path(parts, variables=variables, config=config, declared_variable_keys=declared_variable_keys)
+        if restore_base_image(base_image_path, sim_path):
+            # Image was just created from the store -> attach it as it is
+            config['overwrite_sim'] = True
+            prepare_target_device_lifecycle(
+                config,
+                use_existing=True
+            )
+            return wait_for_partition_nodes(
+                config['target_device'],
+                len(parts),
+                timeout=float(config.get('settle_timeout', 10))
+            )
+
+    incremental: bool = bool(config.get('incremental', False))
+    if incremental and sim_path and os.path.exists(os.path.realpath(sim_path)):
+        # Update the existing image in place instead of recreating it
+        config['overwrite_sim'] = True
+
+    journal: StageJournal | None = config.get('journal', None)
+    table_hash: str = hash_step_inputs(
+        parts,
+        {key: variables.get(key, None) for key in declared_variable_keys},
+        sim_path or config.get('target_device', None)
+    )
+    resume_table: bool = bool(journal) and journal.is_done('partitions/table', table_hash)
+    if resume_table:
+        print("Step 'partitions/table' completed in a previous run with unchanged inputs -> skipping (resume)")
+        # Attach the existing image/device as it is
+        config['overwrite_sim'] = True
+
+    prepare_target_device_lifecycle(
+        config,
+        use_existing=incremental or resume_table
+    )
+
     if not parts:
         print_write("Part table not defined in the configuration -> skipping 'partitions' stage", output_script)
         return
 
-    part_scheme_path: str = generate_partition_scheme(
-        part_scheme_path='/tmp/partitions.sh',
-        part_definitions=parts,
-        variables=variables
-    )
+    if incremental:
+        target_device: str = os.path.realpath(config['target_device'])
+        partition_plan: dict[str, Any] = plan_partition_changes(target_device, parts, variables=variables)
+        return apply_partition_plan(partition_plan, target_device, parts, config=config, output_script=output_script)
 
-    part_devices: list[str] = intall_partitions(
-        part_scheme_path=part_scheme_path,
-        # variables=variables,
-        config=config,
-        output_script=output_script
-    )
+    if resume_table:
+        part_devices: list[str] = wait_for_partition_nodes(
+            config['target_device'],
+            len(parts),
+            timeout=float(config.get('settle_timeout', 10))
+        )
+    else:
+        if journal:
+            journal.begin('partitions/table')
+
+        part_scheme_path: str = generate_partition_scheme(
+            part_scheme_path=config.get('part_scheme_path', None) or '/tmp/partitions.sh',
+            part_definitions=parts,
+            variables=variables
+        )
+
+        part_devices = intall_partitions(
+            part_scheme_path=part_scheme_path,
+            # variables=variables,
+            config=config,
+            output_script=output_script,
+            expected_parts=len(parts),
+            part_definitions=parts,
+            variables=variables
+        )
+        if journal:
+            journal.complete('partitions/table', table_hash)
 
     format_partitions(
         part_devices=part_devices,
         part_definitions=parts,
         # variables=variables,
-        config=config
+        config=config,
+        table_hash=table_hash
     )
 
+    if base_image_path:
+        store_base_image(sim_path, base_image_path)
+
     return part_devices
 
     # target_device: str = variables.get('target_device', None)
@@ -1320,33 +3522,23 @@ def exec_partitions_installer(
 def lsblk_json(
     device: str = None,
     ignore_parent: bool = False,
-) -> dict[str, Any]:
+) -> list[dict[str, Any]] | None:
     """
-    Get JSON output of lsblk command for the specified device.
+    Get the lsblk device tree for the specified device (from the cached block topology).
     """
+    topology: BlockTopology = get_block_topology()
 
-    if device:
-        cmd: str = f"lsblk -f '{device}' --json"
-    else:
-        cmd: str = "lsblk -f --json"
-
-    output: str = os.popen(cmd).read().strip()
-    if not output:
-        raise ValueError(f"No output from lsblk command for device {device} -> exiting")
-
-    lsblk_output = json.loads(output)
-    if not lsblk_output:
-        return None
+    if not device:
+        return topology.block_devices or None
 
-    if not lsblk_output.get('blockdevices', None):
+    block_device: dict[str, Any] | None = topology.get(device)
+    if not block_device:
         return None
 
-    out_block_devices = lsblk_output['blockdevices']
-
     if ignore_parent:
-        out_block_devices = out_block_devices[0].get('children', [])
+        return block_device.get('children', [])
 
-    return out_block_devices
+    return [block_device]
 
 
 def sfdisk_json(
@@ -1356,11 +3548,11 @@ def sfdisk_json(
     """
     Get JSON output of sfdisk command for the specified device.
     """
-    cmd: str = f"sudo sfdisk -l '{device}' --json"
-    output: str = os.popen(cmd).read().strip()
+    output: str = exec_output(['sudo', 'sfdisk', '-l', device, '--json'])
     if not output:
         raise ValueError(f"No output from sfdisk command for device {device} -> exiting")
 
+    import json
     sfdisk_output = json.loads(output)
     table = sfdisk_output['partitiontable']
     if not ignore_parent:
@@ -1369,6 +3561,305 @@ def sfdisk_json(
     return table.get('partitions', [])
 
 
+def parse_btrfs_subvolume_list(
+    subvolumes_list_str: str,
+) -> list[str]:
+    # ID 256 gen 9 top level 5 path @arch -> @arch
+    return [line.split(' ')[-1] for line in subvolumes_list_str.splitlines() if line.strip()]
+
+
+def list_btrfs_subvolumes(
+    part_device: str,
+) -> list[str]:
+    temp_btrfs_root: str = os.path.join('/tmp/temp_btrfs_roots', f"list_{os.path.basename(part_device)}")
+    os.makedirs(temp_btrfs_root, exist_ok=True)
+    run_cmd(f"sudo mount -o ro '{part_device}' '{temp_btrfs_root}'")
+    try:
+        return parse_btrfs_subvolume_list(exec_output(['sudo', 'btrfs', 'subvolume', 'list', temp_btrfs_root]))
+    finally:
+        run_cmd(f"sudo umount '{temp_btrfs_root}'")
+        os.rmdir(temp_btrfs_root)
+
+
+# ------------------------ Incremental partitioning -------------------------
+# Compare the live partition table + filesystems with the 'parts' definitions and only apply the delta:
+# missing partitions are appended, the last partition can grow, missing filesystems/subvolumes are created.
+# Anything else (moved/shrunk partitions, different types or filesystems) needs a full run without '--incremental'
+
+expected_fs_types: dict[str, str] = {
+    'fat32': 'vfat',
+    'vfat': 'vfat',
+    'luks': 'crypto_LUKS',
+}
+
+
+def read_partition_table(
+    target_device: str,
+    sector_size: int = 512,
+) -> list[dict[str, Any]]:
+    if os.access(target_device, os.R_OK):
+        try:
+            return read_gpt_table(target_device, sector_size=sector_size)['partitions']
+        except ValueError as e:
+            print(f"No valid GPT found on '{target_device}' ({e}) -> treating the disk as empty")
+            return []
+
+    table: dict[str, Any] = sfdisk_json(target_device)
+    table_sector_size: int = int(table.get('sectorsize', sector_size))
+    partitions: list[dict[str, Any]] = []
+    for number, partition in enumerate(table.get('partitions', []), start=1):
+        start: int = partition['start'] * table_sector_size // sector_size
+        size: int = partition['size'] * table_sector_size // sector_size
+        partitions.append({
+            'number': number,
+            'type_guid': partition.get('type', '').upper(),
+            'part_guid': partition.get('uuid', None),
+            'start': start,
+            'end': start + size - 1,
+            'size': size,
+            'name': partition.get('name', ''),
+        })
+    return partitions
+
+
+def get_existing_fs_state(
+    part_device: str,
+    part_info: dict[str, Any],
+) -> tuple[str | None, str]:
+    """
+    Returns the filesystem type found on the partition (inside the LUKS container if one is defined)
+    and the device path the filesystem lives on.
+    """
+    fs_type: str | None = check_fs_type(part_device, quiet=True)
+    luks_info: dict[str, Any] | None = part_info.get('luks', None)
+    if not luks_info or fs_type != 'crypto_LUKS':
+        return fs_type, part_device
+
+    luks_device: str = unlock_luks_partition(
+        part_device,
+        luks_device_name=get_luks_device_name(luks_info),
+        luks_passphrase=get_luks_passphrase(part_device, luks_info)
+    )
+    return check_fs_type(luks_device, quiet=True, refresh=True), luks_device
+
+
+def plan_partition_changes(
+    target_device: str,
+    part_definitions: dict[str, Any],
+    variables: dict[str, Any] = {},
+) -> dict[str, Any]:
+    sector_size: int = int(variables.get('sector_size', None) or get_device_sector_size(target_device))
+    total_sectors: int = get_device_total_sectors(target_device, sector_size=sector_size)
+
+    layout: list[dict[str, Any]] = build_gpt_layout(part_definitions, total_sectors, sector_size=sector_size)
+    existing_partitions: list[dict[str, Any]] = read_partition_table(target_device, sector_size=sector_size)
+    part_nodes: dict[int, str] = get_sys_partition_numbers(target_device)
+
+    actions: list[dict[str, Any]] = []
+    conflicts: list[str] = []
+    for index, part_entry in enumerate(layout):
+        part_key: str = part_entry['key']
+        part_info: dict[str, Any] = part_definitions[part_key]
+        action: dict[str, Any] = {'key': part_key, 'number': index + 1, 'table': 'keep', 'format': False, 'subvolumes': []}
+        actions.append(action)
+
+        if index >= len(existing_partitions):
+            action['table'] = 'create'
+            action['format'] = bool(get_first_defined_key(part_info, ['filesystem', 'fs'], None))
+            continue
+
+        existing_partition: dict[str, Any] = existing_partitions[index]
+        part_entry['part_guid'] = existing_partition.get('part_guid', None)
+        if existing_partition['start'] != part_entry['start'] or existing_partition['type_guid'] != part_entry['type_guid'].upper():
+            conflicts.append(f"'{part_key}' differs in start or type from existing partition {existing_partition['number']}")
+            continue
+        if existing_partition['end'] > part_entry['end']:
+            conflicts.append(f"'{part_key}' would shrink existing partition {existing_partition['number']}")
+            continue
+        if existing_partition['end'] < part_entry['end']:
+            if index != len(existing_partitions) - 1:
+                conflicts.append(f"'{part_key}' can only grow if it is the last existing partition")
+                continue
+            action['table'] = 'grow'
+
+        part_filesystem: str | None = get_first_defined_key(part_info, ['filesystem', 'fs'], None)
+        part_device: str | None = part_nodes.get(index + 1, None)
+        if not part_filesystem or not part_device:
+            continue
+
+        existing_fs, fs_device = get_existing_fs_state(part_device, part_info)
+        action['device'] = fs_device
+        if not existing_fs:
+            action['format'] = True
+            continue
+        if existing_fs != expected_fs_types.get(part_filesystem, part_filesystem):
+            conflicts.append(f"'{part_key}' has filesystem '{existing_fs}' instead of '{part_filesystem}'")
+            continue
+
+        subvolumes_info: dict[str, Any] = part_info.get('subvolumes', None) or {}
+        if existing_fs == 'btrfs' and subvolumes_info:
+            existing_subvolumes: list[str] = list_btrfs_subvolumes(fs_device)
+            action['subvolumes'] = [
+                subvol_key for subvol_key, subvol_info in subvolumes_info.items()
+                if subvol_info.get('name', subvol_key) not in existing_subvolumes
+            ]
+
+    if len(existing_partitions) > len(layout):
+        conflicts.append(f"{len(existing_partitions) - len(layout)} existing partitions are not defined in the configuration")
+
+    return {
+        'layout': layout,
+        'actions': actions,
+        'conflicts': conflicts,
+        'total_sectors': total_sectors,
+        'sector_size': sector_size,
+    }
+
+
+def grow_filesystem(
+    fs_device: str,
+    fs_type: str,
+) -> None:
+    if fs_type == 'ext4':
+        run_cmd(f"sudo resize2fs '{fs_device}'")
+    elif fs_type == 'btrfs':
+        temp_btrfs_root: str = os.path.join('/tmp/temp_btrfs_roots', f"grow_{os.path.basename(fs_device)}")
+        os.makedirs(temp_btrfs_root, exist_ok=True)
+        run_cmd(f"sudo mount '{fs_device}' '{temp_btrfs_root}'")
+        run_cmd(f"sudo btrfs filesystem resize max '{temp_btrfs_root}'")
+        run_cmd(f"sudo umount '{temp_btrfs_root}'")
+        os.rmdir(temp_btrfs_root)
+    else:
+        print(f"Growing filesystem '{fs_type}' on {fs_device} is not supported -> only the partition was grown")
+
+
+def get_sfdisk_partition_line(part_entry: dict[str, Any]) -> str:
+    line_parts: list[str] = [
+        f"start={part_entry['start']}",
+        f"size={part_entry['end'] - part_entry['start'] + 1}",
+        f"type={part_entry['type_guid']}",
+    ]
+    if part_entry.get('part_guid', None):
+        line_parts.append(f"uuid={part_entry['part_guid']}")
+    if part_entry.get('name', None):
+        line_parts.append(f"name=\"{part_entry['name']}\"")
+    return ', '.join(line_parts)
+
+
+def write_partition_changes_sfdisk(
+    target_device: str,
+    partition_plan: dict[str, Any],
+    output_script: str | None = None,
+) -> None:
+    """
+    Apply the table changes of the plan with sfdisk: '--append' for new partitions, '-N <number>' to grow one.
+    Kept entries are never rewritten.
+    """
+    for action in partition_plan['actions']:
+        part_entry: dict[str, Any] = partition_plan['layout'][action['number'] - 1]
+        if action['table'] == 'grow':
+            run_cmd(f"echo 'size={part_entry['end'] - part_entry['start'] + 1}' | sudo sfdisk --no-reread -N {action['number']} '{target_device}'", fd_path=output_script)
+        elif action['table'] == 'create':
+            run_cmd(f"echo '{get_sfdisk_partition_line(part_entry)}' | sudo sfdisk --no-reread --append '{target_device}'", fd_path=output_script)
+
+
+def apply_partition_plan(
+    partition_plan: dict[str, Any],
+    target_device: str,
+    part_definitions: dict[str, Any],
+    config: dict[str, Any] = {},
+    output_script: str | None = None,
+) -> list[str]:
+    actions: list[dict[str, Any]] = partition_plan['actions']
+    for action in actions:
+        subvolumes_str: str = f", missing subvolumes: {', '.join(action['subvolumes'])}" if action['subvolumes'] else ''
+        print(f"Partition {action['number']} '{action['key']}': table -> {action['table']}, format -> {action['format']}{subvolumes_str}")
+
+    if partition_plan['conflicts']:
+        raise ValueError("Existing partitions can not be updated incrementally -> run without '--incremental' to recreate the table:\n"
+                         + '\n'.join(partition_plan['conflicts']))
+
+    if config.get('interactive') and any(action['table'] != 'keep' or action['format'] for action in actions):
+        continue_guard()
+
+    if any(action['table'] != 'keep' for action in actions):
+        # Same backend selection as 'intall_partitions' -> script output always goes through sfdisk
+        use_native_gpt: bool = (
+            config.get('partition_backend', 'native') == 'native'
+            and not output_script
+            and os.access(target_device, os.W_OK)
+        )
+        if use_native_gpt:
+            # Keep disk and partition GUIDs of the existing entries -> PARTUUIDs stay stable
+            existing_disk_guid: str | None = None
+            try:
+                existing_disk_guid = read_gpt_table(target_device, sector_size=partition_plan['sector_size'])['disk_guid']
+            except ValueError:
+                pass
+            write_gpt_table(
+                target_device,
+                partition_plan['layout'],
+                partition_plan['total_sectors'],
+                sector_size=partition_plan['sector_size'],
+                disk_guid=existing_disk_guid
+            )
+        else:
+            write_partition_changes_sfdisk(target_device, partition_plan, output_script=output_script)
+        invalidate_block_topology()
+        if shutil.which('partprobe'):
+            run_cmd(f"sudo partprobe {target_device}", fd_path=output_script)
+
+    if output_script:
+        # Nodes of new partitions only appear when the script runs
+        part_devices: list[str] = [get_partition_device_path(target_device, action['number']) for action in actions]
+    else:
+        part_devices = wait_for_partition_nodes(
+            target_device,
+            len(actions),
+            timeout=float(config.get('settle_timeout', 10))
+        )
+
+    for action in actions:
+        part_info: dict[str, Any] = part_definitions[action['key']]
+        part_device: str = part_devices[action['number'] - 1]
+
+        if action['table'] == 'grow':
+            luks_info: dict[str, Any] | None = part_info.get('luks', None)
+            fs_device: str = action.get('device', part_device)
+            if luks_info and fs_device != part_device:
+                # LUKS2 volumes can ask for the passphrase on resize (key not in the kernel keyring)
+                run_with_passphrase(
+                    ['sudo', 'cryptsetup', 'resize', get_luks_device_name(luks_info), '--key-file', '-'],
+                    get_luks_passphrase(part_device, luks_info)
+                )
+            fs_type: str | None = check_fs_type(fs_device, quiet=True, refresh=True)
+            if fs_type and not action['format']:
+                grow_filesystem(fs_device, fs_type)
+
+        if action['format']:
+            # Kept LUKS container (opened while planning) -> only the filesystem inside is missing
+            format_fn = format_filesystem if action.get('device', part_device) != part_device else format_partition
+            format_fn(
+                action.get('device', part_device),
+                get_first_defined_key(part_info, ['filesystem', 'fs'], None),
+                part_info,
+                config=config
+            )
+            continue
+
+        if action['subvolumes']:
+            subvolumes_info: dict[str, Any] = part_info.get('subvolumes', {})
+            install_btrfs_subvolumes(
+                action.get('device', part_device),
+                {subvol_key: subvolumes_info[subvol_key] for subvol_key in action['subvolumes']},
+                output_requirements=config.get('force_output_requirements', False),
+                config=config,
+                temp_subvol_path=f"/tmp/btrfs_subvolumes_{os.path.basename(action.get('device', part_device))}"
+            )
+
+    return part_devices
+
+
 # def get_extended_parts_info(
 #     parent_device: str,
 # ) -> dict[str, Any]:
@@ -1396,7 +3887,7 @@ def select_part_device(
 
         block_infos: list[dict[str, Any]] = lsblk_json(source_device, ignore_parent=True)
         for block_info in block_infos:
-            if block_info.get('fstype', '').startswith(identify_matcher):
+            if (block_info.get('fstype') or '').startswith(identify_matcher):
                 return f"/dev/{block_info['name']}"
             if identify_matcher == block_info.get('label', ''):
                 return f"/dev/{block_info['name']}"
@@ -1413,25 +3904,6 @@ def select_part_device(
     raise ValueError(f"No partition device found matching the identify matcher '{identify_matcher}' -> exiting")
 
 
-def unlock_if_luks_defined(
-    part_device: str,
-    part_info: dict[str, Any],
-) -> str:
-    luks_info: dict[str, Any] = part_info.get('luks', None)
-    if not luks_info:
-        return part_device
-
-    luks_device_name: str = luks_info.get('luks_device_name', 'bootsluks')
-    luks_passphrase: str = luks_info.get('luks_passphrase', None)
-    # part_device: str = f"/dev/mapper/{luks_device_name}"
-    part_device = unlock_luks_partition(
-        part_device,
-        luks_device_name=luks_device_name,
-        luks_passphrase=luks_passphrase
-    )
-    return part_device
-
-
 def add_dict_mount_option(
     option_value: str | None,
     mount_options_dict: dict[str, Any],
@@ -1447,10 +3919,10 @@ def add_dict_mount_option(
         mount_options_dict[option_value] = True
         return
 
-    key_value: list[str] = option_value.split('=')
+    key_value: list[str] = option_value.split('=', 1)
 
     if key_value[0] in mount_options_dict:
-        del mount_options_dict[option_value]
+        del mount_options_dict[key_value[0]]
 
     mount_options_dict[key_value[0]] = key_value[1]
 
@@ -1471,31 +3943,259 @@ def get_mount_options_str(
     return ','.join(mount_options)
 
 
-def mount_defined_partition(
+# ------------------------ Kernel mount backend -------------------------
+# When running as root, mounts are done with mount(2)/umount2(2) through ctypes instead of 'sudo mount' processes.
+# Options are passed as dict (see 'add_dict_mount_option'), failures raise OSError with the errno of the syscall
+
+# https://man7.org/linux/man-pages/man2/mount.2.html
+mount_flag_bits: dict[str, int] = {
+    'ro': 1,  # MS_RDONLY
+    'nosuid': 2,
+    'nodev': 4,
+    'noexec': 8,
+    'sync': 16,
+    'remount': 32,
+    'mand': 64,
+    'dirsync': 128,
+    'noatime': 1024,
+    'nodiratime': 2048,
+    'bind': 4096,
+    'rbind': 4096 | 16384,  # MS_BIND | MS_REC
+    'silent': 32768,
+    'relatime': 1 << 21,
+    'iversion': 1 << 23,
+    'strictatime': 1 << 24,
+    'lazytime': 1 << 25,
+}
+# Negative forms of mount(8) -> clear the flag again (later options win, as with mount(8))
+mount_clear_flag_bits: dict[str, int] = {
+    'rw': mount_flag_bits['ro'],
+    'suid': mount_flag_bits['nosuid'],
+    'dev': mount_flag_bits['nodev'],
+    'exec': mount_flag_bits['noexec'],
+    'async': mount_flag_bits['sync'],
+    'nomand': mount_flag_bits['mand'],
+    'atime': mount_flag_bits['noatime'],
+    'diratime': mount_flag_bits['nodiratime'],
+    'loud': mount_flag_bits['silent'],
+    'norelatime': mount_flag_bits['relatime'],
+    'noiversion': mount_flag_bits['iversion'],
+    'nostrictatime': mount_flag_bits['strictatime'],
+    'nolazytime': mount_flag_bits['lazytime'],
+}
+# Options of mount(8)/fstab without kernel meaning (prefixes for 'x-*' and 'comment=')
+mount_ignored_options: tuple[str, ...] = ('defaults', 'auto', 'noauto', 'user', 'nouser', 'users', 'owner', 'group', 'nofail', '_netdev')
+mount_ignored_option_prefixes: tuple[str, ...] = ('x-', 'X-', 'comment')
+# Handled by mount(8) itself (loop setup, helpers, propagation) -> never passed to mount(2)
+mount_helper_options: tuple[str, ...] = (
+    'loop', 'offset', 'sizelimit', 'encryption', 'helper', 'move', 'rmove',
+    'shared', 'rshared', 'slave', 'rslave', 'private', 'rprivate', 'unbindable', 'runbindable',
+)
+umount_detach_flag: int = 2  # MNT_DETACH
+
+kernel_mount_enabled: bool = False
+libc_handle = None
+
+
+def set_mount_backend(backend: str = 'auto') -> bool:
+    global kernel_mount_enabled
+    if backend == 'kernel' and os.geteuid() != 0:
+        raise ValueError("Mount backend 'kernel' requires running as root -> exiting")
+
+    kernel_mount_enabled = (backend == 'kernel' or (backend == 'auto' and os.geteuid() == 0)) and not is_planning()
+    return kernel_mount_enabled
+
+
+def get_libc():
+    global libc_handle
+    if libc_handle is None:
+        import ctypes
+        import ctypes.util
+        libc_handle = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+    return libc_handle
+
+
+def requires_mount_helper(mount_options: dict[str, Any] | None) -> bool:
+    return any(option in mount_helper_options for option in (mount_options or {}))
+
+
+def split_mount_options(mount_options: dict[str, Any]) -> tuple[int, str]:
+    """
+    Split mount(8) style options into mount(2) flags and the filesystem specific data string.
+    """
+    flags: int = 0
+    data_options: dict[str, Any] = {}
+    for option, value in (mount_options or {}).items():
+        if value is True and option in mount_flag_bits:
+            flags |= mount_flag_bits[option]
+        elif value is True and option in mount_clear_flag_bits:
+            flags &= ~mount_clear_flag_bits[option]
+        elif option in mount_ignored_options or option.startswith(mount_ignored_option_prefixes):
+            continue
+        else:
+            data_options[option] = value
+    return flags, get_mount_options_str(data_options)
+
+
+def resolve_mount_fstype(source: str) -> str | None:
+    # mount(8) probes with blkid, mount(2) needs the type -> cached topology, only refreshed (lsblk) on a miss
+    return check_fs_type(source, quiet=True) or check_fs_type(source, quiet=True, refresh=True)
+
+
+def kernel_mount(
+    source: str,
+    target: str,
+    fstype: str | None = None,
+    mount_options: dict[str, Any] | None = None,
+) -> None:
+    import ctypes
+
+    flags, data = split_mount_options(mount_options or {})
+    if not fstype and not flags & mount_flag_bits['bind']:
+        fstype = resolve_mount_fstype(source)
+
+    start_time: float = time.monotonic()
+    result: int = get_libc().mount(
+        source.encode(),
+        target.encode(),
+        fstype.encode() if fstype else None,
+        ctypes.c_ulong(flags),
+        data.encode() if data else None,
+    )
+    session_writer.write_record('mount', source=source, target=target, fstype=fstype, flags=flags, data=data, returncode=result, duration=time.monotonic() - start_time)
+    if result != 0:
+        errno_value: int = ctypes.get_errno()
+        raise OSError(errno_value, f"mount({source}, {target}, {fstype}, {flags:#x}, '{data}') failed: {os.strerror(errno_value)}", target)
+    invalidate_block_topology()
+
+
+def kernel_umount(
+    target: str,
+    lazy: bool = False,
+) -> None:
+    import ctypes
+
+    result: int = get_libc().umount2(target.encode(), umount_detach_flag if lazy else 0)
+    session_writer.write_record('umount', target=target, lazy=lazy, returncode=result)
+    if result != 0:
+        errno_value: int = ctypes.get_errno()
+        raise OSError(errno_value, f"umount2({target}) failed: {os.strerror(errno_value)}", target)
+    invalidate_block_topology()
+
+
+def parse_mount_options(mount_options_str: str | None) -> dict[str, Any]:
+    mount_options_dict: dict[str, Any] = {}
+    for mount_option in (mount_options_str or '').split(','):
+        if mount_option:
+            add_dict_mount_option(mount_option, mount_options_dict)
+    return mount_options_dict
+
+
+def mount_device(
+    source: str,
+    target: str,
+    mount_options: dict[str, Any] | None = None,
+    fd_path: str | None = None,
+    fstype: str | None = None,
+) -> None:
+    use_kernel_mount: bool = kernel_mount_enabled and not requires_mount_helper(mount_options)
+    is_bind_mount: bool = 'bind' in (mount_options or {}) or 'rbind' in (mount_options or {})
+    if use_kernel_mount and not fstype and not is_bind_mount:
+        fstype = resolve_mount_fstype(source)
+        # Type unknown to the topology (no udev) -> mount(8) probes it with blkid
+        use_kernel_mount = bool(fstype)
+
+    if use_kernel_mount:
+        print(f"mount({source}, {target}, {get_mount_options_str(mount_options) or 'defaults'})")
+        try:
+            return kernel_mount(source, target, fstype=fstype, mount_options=mount_options)
+        except OSError as e:
+            import errno
+            # Options unknown to the kernel/filesystem (but handled by mount(8)) -> let mount(8) sort them out
+            if e.errno != errno.EINVAL or not split_mount_options(mount_options or {})[1]:
+                raise
+            print(f"mount(2) rejected the options of {source} -> retrying with mount(8)")
+
+    mount_options_str: str = get_mount_options_str(mount_options)
+    options_arg: str = f" -o '{mount_options_str}'" if mount_options_str else ''
+    run_cmd(f"sudo mount{options_arg} '{source}' '{target}'", fd_path=fd_path)
+
+
+def umount_path(
+    target: str,
+    fd_path: str | None = None,
+) -> None:
+    if kernel_mount_enabled:
+        print(f"umount2({target})")
+        return kernel_umount(target)
+
+    run_cmd(f"sudo umount '{target}'", fd_path=fd_path)
+
+
+def make_mount_point(mount_point: str) -> None:
+    if kernel_mount_enabled:
+        os.makedirs(mount_point, exist_ok=True)
+        return
+    run_cmd(f"sudo mkdir -p '{mount_point}'")
+
+
+def read_mountinfo(pid: str = 'self') -> list[dict[str, Any]]:
+    """
+    Parse /proc/<pid>/mountinfo (one read, no 'mount' process) -> [{mount_point, root, source, fstype, options}].
+    """
+    def unescape(value: str) -> str:
+        # Spaces, tabs, newlines and backslashes are octal escaped ('\\040')
+        return value.encode('utf-8').decode('unicode_escape').encode('latin-1').decode('utf-8') if '\\' in value else value
+
+    mounts: list[dict[str, Any]] = []
+    with open(f"/proc/{pid}/mountinfo", 'r') as mountinfo_fd:
+        for line in mountinfo_fd:
+            fields: list[str] = line.split()
+            separator_index: int = fields.index('-')
+            mounts.append({
+                'mount_id': int(fields[0]),
+                'parent_id': int(fields[1]),
+                'device_number': fields[2],
+                'root': unescape(fields[3]),
+                'mount_point': unescape(fields[4]),
+                'options': fields[5],
+                'fstype': fields[separator_index + 1],
+                'source': unescape(fields[separator_index + 2]),
+                'super_options': fields[separator_index + 3] if len(fields) > separator_index + 3 else '',
+            })
+    return mounts
+
+
+def get_mounted_at(mounts: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    # Last entry wins -> the mount visible at the mount point when stacked
+    return {mount['mount_point']: mount for mount in mounts}
+
+
+def get_mount_entry_fstype(
+    part_info: dict[str, Any],
+    mount_options_dict: dict[str, Any],
+) -> str | None:
+    part_filesystem: str | None = get_first_defined_key(part_info, ['filesystem', 'fs'], None)
+    if part_filesystem:
+        return expected_fs_types.get(part_filesystem, part_filesystem)
+    return 'btrfs' if 'subvol' in mount_options_dict else None
+
+
+def build_mount_entry(
     part_info: dict[str, Any],
     source_device: str,
     target_root: str = '/mnt/device_parts',
     addon_mount_options: str | None = None,
-) -> None:
+) -> dict[str, Any] | None:
     relative_mount: str | None = part_info.get('mount', None)
 
     if not relative_mount:
         # print_write(f"Partition for {source_device} does not have a mount point defined -> skipping mount", fd_path=None)
-        return
+        return None
 
     mount_point = os.path.join(target_root, relative_mount.lstrip('/'))
-    if not os.path.exists(mount_point):
-        print_write(f"Creating mount point directory {mount_point}")
-        run_cmd(f"sudo mkdir -p '{mount_point}'")
-
-    mount_point = os.path.realpath(mount_point)
 
-    mount_options_str: str = part_info.get('mount_options', '')
-    mount_options: list[str] | None = mount_options_str.split(',')
-
-    mount_options_dict: dict[str, Any] = {}
-    for mount_option in mount_options:
-        add_dict_mount_option(mount_option, mount_options_dict)
+    mount_options_dict: dict[str, Any] = parse_mount_options(part_info.get('mount_options', ''))
 
     ssd_option: str | None = part_info.get('ssd', False)
     if ssd_option:
@@ -1522,43 +4222,114 @@ def mount_defined_partition(
     if not result_mount_options_str:
         result_mount_options_str = 'defaults'
 
-    run_cmd(f"sudo mount -o {result_mount_options_str} '{source_device}' '{mount_point}'")
+    return {
+        'source': source_device,
+        'mount_point': mount_point,
+        'options': result_mount_options_str,
+        'options_dict': mount_options_dict or {'defaults': True},
+        'subvol': mount_options_dict.get('subvol', None),
+        # Saves the type lookup of the mount(2) backend
+        'fstype': get_mount_entry_fstype(part_info, mount_options_dict),
+    }
+
+
+def mount_entry(entry: dict[str, Any]) -> None:
+    # Directory is created after the parent mount is in place -> it lives in the mounted filesystem
+    mount_point: str = entry['mount_point']
+    if not os.path.exists(mount_point):
+        print_write(f"Creating mount point directory {mount_point}")
+        make_mount_point(mount_point)
+
+    mount_point = os.path.realpath(mount_point)
+    mount_device(entry['source'], mount_point, entry['options_dict'], fstype=entry.get('fstype', None))
+
+
+def verify_mount_entries(entries: list[dict[str, Any]]) -> None:
+    """
+    Verify all mounts (device and subvolume) in one pass against /proc/self/mountinfo.
+    """
+    if is_planning() or not entries:
+        return
+
+    mounted_at: dict[str, dict[str, Any]] = get_mounted_at(read_mountinfo())
+    for entry in entries:
+        mount_point: str = os.path.realpath(entry['mount_point'])
+        mounted: dict[str, Any] | None = mounted_at.get(mount_point, None)
+        if not mounted:
+            raise ValueError(f"Failed to mount partition {entry['source']} to {mount_point} with options '{entry['options']}' -> exiting")
+        if os.path.realpath(mounted['source']) != os.path.realpath(entry['source']):
+            raise ValueError(f"Mounted device {mounted['source']} does not match source device {entry['source']} -> exiting")
+        if entry['subvol'] and mounted['root'].strip('/') != entry['subvol'].strip('/'):
+            raise ValueError(f"Mounted subvolume {mounted['root']} at {mount_point} does not match subvolume {entry['subvol']} -> exiting")
+
+
+def mount_entries_parallel(
+    entries: list[dict[str, Any]],
+    max_workers: int = 4,
+) -> None:
+    """
+    Mount the entries as a tree ordered by path depth: an entry waits for all entries mounted above it,
+    independent siblings are mounted concurrently.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def is_below(mount_point: str, parent_mount_point: str) -> bool:
+        return mount_point != parent_mount_point and mount_point.startswith(parent_mount_point.rstrip('/') + '/')
+
+    pending_entries: list[dict[str, Any]] = sorted(entries, key=lambda entry: os.path.normpath(entry['mount_point']).count('/'))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='mount') as executor:
+        while pending_entries:
+            # Wave: every entry without a pending entry above it
+            wave: list[dict[str, Any]] = [
+                entry for entry in pending_entries
+                if not any(is_below(os.path.normpath(entry['mount_point']), os.path.normpath(other['mount_point'])) for other in pending_entries)
+            ]
+            futures = [executor.submit(contextvars.copy_context().run, mount_entry, entry) for entry in wave]
+            for future in futures:
+                future.result()
+            pending_entries = [entry for entry in pending_entries if entry not in wave]
+
+
+def mount_defined_partition(
+    part_info: dict[str, Any],
+    source_device: str,
+    target_root: str = '/mnt/device_parts',
+    addon_mount_options: str | None = None,
+) -> None:
+    entry: dict[str, Any] | None = build_mount_entry(part_info, source_device, target_root, addon_mount_options)
+    if not entry:
+        return
 
-    verify_correct_mount_cmd: str = f"sudo mount | grep '{mount_point}' | grep -Eo '^/dev/[a-zA-Z0-9\\-\\_\\/\\@]+'"
-    mounted_device: str = os.popen(verify_correct_mount_cmd).read().strip()
-    if not mounted_device:
-        raise ValueError(f"Failed to mount partition {source_device} to {mount_point} with options '{result_mount_options_str}' -> exiting")
-    if mounted_device != source_device:
-        raise ValueError(f"Mounted device {mounted_device} does not match source device {source_device} -> exiting")
+    mount_entry(entry)
+    verify_mount_entries([entry])
 
 
-def mount_subvol_parts(
+def get_subvol_mount_entries(
     source_device: str,
     subvol_part_infos: dict[str, Any],
     target_root: str = '/mnt/device_parts',
-) -> None:
+) -> list[dict[str, Any]]:
     if not subvol_part_infos:
         # print_write("No subvolume partition infos provided -> skipping subvolume mount", fd_path=None)
-        return
+        return []
 
     target_mount_name: str = os.path.basename(target_root)
     temp_btrfs_root: str = os.path.join('/tmp/temp_btrfs_roots', target_mount_name)
     os.makedirs(temp_btrfs_root, exist_ok=True)
-    run_cmd(f"sudo mount -o defaults '{source_device}' '{temp_btrfs_root}'")
+    mount_device(source_device, temp_btrfs_root, {'defaults': True}, fstype='btrfs')
     print_write(f"Mounted BTRFS partition {source_device} to temporary root {temp_btrfs_root}", fd_path=None)
     list_btrfs_subvolumes_cmd: str = f"sudo btrfs subvolume list '{temp_btrfs_root}'"
-    subvolumes_list_str: str = os.popen(list_btrfs_subvolumes_cmd).read().strip()
+    if is_planning():
+        subvolumes_list_str: str = '\n'.join(f"path {subvol_name}" for subvol_name in active_plan.subvolumes.get(source_device, []))
+    else:
+        subvolumes_list_str = exec_output(list_btrfs_subvolumes_cmd)
     if not subvolumes_list_str:
         print_write(f"No subvolumes found in BTRFS partition {source_device} -> skipping subvolume mount", fd_path=None)
-        run_cmd(f"sudo umount '{temp_btrfs_root}'")
-        return
-    subvolumes_list_lines: list[str] = subvolumes_list_str.splitlines()
-    subvolumes_list: list[str] = []
-    for line in subvolumes_list_lines:
-        parts = line.split(' ')
-        subvol_name = parts[-1]
-        subvolumes_list.append(subvol_name)
+        umount_path(temp_btrfs_root)
+        return []
+    subvolumes_list: list[str] = parse_btrfs_subvolume_list(subvolumes_list_str)
 
+    subvol_entries: list[dict[str, Any]] = []
     for subvol_key, subvol_info in subvol_part_infos.items():
         subvol_name: str = subvol_info.get('name', subvol_key)
         if not subvol_name:
@@ -1567,37 +4338,57 @@ def mount_subvol_parts(
             print(f"Subvolume {subvol_name} not found in BTRFS partition at {source_device}, available: {','.join(subvolumes_list)} -> skipping mount")
             continue
 
-        mount_defined_partition(
+        subvol_entry: dict[str, Any] | None = build_mount_entry(
             part_info=subvol_info,
             source_device=source_device,
             target_root=target_root,
             addon_mount_options='subvol=' + subvol_name,
         )
+        if subvol_entry:
+            subvol_entries.append(subvol_entry)
+    return subvol_entries
+
+
+def print_mounted_entries(entries: list[dict[str, Any]]) -> None:
+    print("Mounted partitions and subvolumes list:")
+    for entry in sorted(entries, key=lambda entry: entry['mount_point']):
+        subvol_str: str = f" [{entry['subvol']}]" if entry['subvol'] else ''
+        print(f"{entry['source']}{subvol_str} on {entry['mount_point']} ({entry['options']})")
+
+
+def mount_subvol_parts(
+    source_device: str,
+    subvol_part_infos: dict[str, Any],
+    target_root: str = '/mnt/device_parts',
+    max_workers: int = 4,
+) -> None:
+    subvol_entries: list[dict[str, Any]] = get_subvol_mount_entries(source_device, subvol_part_infos, target_root)
+    if not subvol_entries:
+        return
 
-    print("Mounted subvolumes list:")
-    # run_cmd(f"sudo mount | grep '{part_device}'")
-    run_cmd(f"sudo mount | grep '{target_root}'")
-    print("Existing subvolumes or chroot mount:")
-    run_cmd(f"sudo btrfs subvolume list '{target_root}'")
+    mount_entries_parallel(subvol_entries, max_workers=max_workers)
+    verify_mount_entries(subvol_entries)
+    print_mounted_entries(subvol_entries)
 
 
 def mount_device_parts(
     source_device: str,
     system_parts: dict[str, Any],
     target_root: str = '/mnt/device_parts',
+    max_workers: int = 4,
 ) -> None:
     if not source_device:
         raise ValueError("Source device must be defined to mount its partitions -> exiting")
-    if not os.path.exists(source_device):
+    if not os.path.exists(source_device) and not is_planning():
         raise FileNotFoundError(f"Source device '{source_device}' does not exist in the system -> exiting")
     if not os.path.exists(target_root):
         print_write(f"Creating target root directory {target_root} for mounting partitions", fd_path=None)
         run_cmd(f"sudo mkdir -p '{target_root}'")
 
-    target_device_parts_cmd: str = f"lsblk -f --list -o NAME {source_device} | tail -n +3"
-    target_device_parts: str = os.popen(target_device_parts_cmd).read().strip()
-    target_device_parts = target_device_parts.splitlines()
+    target_device_parts: list[str] = [block_device['name'] for block_device in get_block_topology().descendants(source_device)]
 
+    part_devices: dict[str, str] = {}
+    luks_jobs: list[tuple[str, str, dict[str, Any]]] = []
     for part_key, part_info in system_parts.items():
 
         identify_matcher: str = str(part_info.get('identify', None))
@@ -1605,28 +4396,35 @@ def mount_device_parts(
             if not identify_matcher:
                 raise ValueError(f"Partition '{part_key}' does not have an identify matcher or name defined -> exiting")
 
-        part_device: str = select_part_device(
+        part_devices[part_key] = select_part_device(
             identify_matcher=identify_matcher,
             part_devices=target_device_parts,
             source_device=source_device
         )
-        part_device = unlock_if_luks_defined(
-            part_device=part_device,
-            part_info=part_info,
-        )
+        if part_info.get('luks', None):
+            luks_jobs.append((part_key, part_devices[part_key], part_info['luks']))
+
+    # All LUKS containers are unlocked at once before mounting
+    part_devices.update(unlock_luks_partitions(luks_jobs, max_workers=max_workers))
+
+    # One tree over all partitions -> e.g. /efi and /boot wait for the root subvolume of another partition
+    mount_entries: list[dict[str, Any]] = []
+    for part_key, part_info in system_parts.items():
+        part_device: str = part_devices[part_key]
 
-        subvolumes: dict[str, Any] = part_info.get('subvolumes', None)
-        mount_subvol_parts(
+        mount_entries.extend(get_subvol_mount_entries(
             source_device=part_device,
-            subvol_part_infos=subvolumes,
+            subvol_part_infos=part_info.get('subvolumes', None),
             target_root=target_root,
-        )
+        ))
 
-        mount_defined_partition(
-            part_info=part_info,
-            source_device=part_device,
-            target_root=target_root
-        )
+        part_entry: dict[str, Any] | None = build_mount_entry(part_info, part_device, target_root)
+        if part_entry:
+            mount_entries.append(part_entry)
+
+    mount_entries_parallel(mount_entries, max_workers=max_workers)
+    verify_mount_entries(mount_entries)
+    print_mounted_entries(mount_entries)
 
 
 def mount_system_root(
@@ -1655,15 +4453,16 @@ def mount_system_root(
         target_device = real_target_device
 
     if not target_device.startswith('/dev/'):
-        find_part_command = f"lsblk -f --list -o NAME,LABEL,UUID | grep \"{target_device}\" | grep -Eo \"^[a-z0-9]+\""
-        found_target_part = os.popen(find_part_command).read().strip()
+        topology: BlockTopology = get_block_topology()
+        found_target_part: dict[str, Any] | None = topology.find(target_device)
         if not found_target_part:
             raise ValueError(f"Target device with '{target_device}' not found in the system -> exiting")
 
-        map_device_cmd = f"lsblk -ndo pkname '/dev/{found_target_part}'"
-        target_device = os.popen(map_device_cmd).read().strip()
+        # A matched partition maps to its disk, a matched whole disk ('sdb') is the target itself
+        parent_device: dict[str, Any] | None = topology.parent(found_target_part['name'])
+        target_device = f"/dev/{(parent_device or found_target_part)['name']}"
 
-    if not os.path.exists(target_device):
+    if not os.path.exists(target_device) and not is_planning():
         raise ValueError(f"Target device '{target_device}' does not exist in the system -> exiting")
 
     target_device_name: str = os.path.basename(target_device)
@@ -1689,9 +4488,62 @@ def mount_system_root(
         source_device=target_device,
         system_parts=system_parts,
         target_root=chroot_mount,
+        max_workers=int(config.get('mount_jobs', None) or 4),
     )
 
 
+def resolve_clean_patterns(
+    patterns: list[str],
+    topology: BlockTopology,
+) -> list[str]:
+    """
+    Resolve device paths, globs ('/dev/bootstrap_loop*') and 'backing:<dir or glob>' (loop devices backed by image
+    files under a directory) to the device paths of the independent top level device trees.
+    """
+    import fnmatch
+    import glob
+
+    loop_backing_files: dict[str, str] = {}
+    for block_device in topology.block_devices:
+        if block_device.get('type') == 'loop':
+            kname: str = block_device.get('kname') or block_device.get('name')
+            backing_file: str | None = read_sys_block_attribute(kname, 'loop/backing_file')
+            if backing_file:
+                loop_backing_files[kname] = backing_file
+
+    device_paths: list[str] = []
+    for pattern in patterns:
+        if pattern.startswith('backing:'):
+            backing_pattern: str = os.path.abspath(os.path.expanduser(pattern.removeprefix('backing:')))
+            for kname, backing_file in loop_backing_files.items():
+                if fnmatch.fnmatch(backing_file, backing_pattern) or backing_file.startswith(backing_pattern.rstrip('/') + '/'):
+                    device_paths.append(f"/dev/{kname}")
+            continue
+
+        if glob.has_magic(pattern):
+            device_paths.extend(glob.glob(pattern))
+            continue
+
+        if not os.path.exists(pattern):
+            print(f"Target device {pattern} does not exist -> skipping cleaning")
+            continue
+        device_paths.append(pattern)
+
+    # realpath -> also resolves relative and chained symlinks, unlike readlink
+    root_device_paths: list[str] = []
+    for device_path in device_paths:
+        kname: str = os.path.basename(os.path.realpath(device_path))
+        # Partitions/mappings are cleaned as part of their disk
+        while topology.parent(kname):
+            parent_device: dict[str, Any] = topology.parent(kname)
+            kname = parent_device.get('kname') or parent_device.get('name')
+        root_device_path: str = f"/dev/{kname}"
+        if root_device_path not in root_device_paths:
+            root_device_paths.append(root_device_path)
+
+    return root_device_paths
+
+
 def clean_devices(
     stage_cfg: dict[str, Any],
     set_config: dict[str, Any] = {},
@@ -1699,23 +4551,49 @@ def clean_devices(
 ) -> None:
     # Note if any program is open with the parititions -> unmounting and cleaning could fail
     # --> can cause problems if the same encrpted luks device is mounted in multiple places, through those side effects
+    from concurrent.futures import ThreadPoolExecutor
+
     output_script: str | None = config.get('output', None)
-    target_devices: list[str] = config.get('clean_devices', [])
+    clean_patterns: list[str] = config.get('clean_devices', None) or stage_cfg.get('devices', None) or []
+    if isinstance(clean_patterns, str):
+        clean_patterns = [clean_patterns]
 
-    if not target_devices:
+    if not clean_patterns:
         print_write("No target devices defined in the configuration under 'target_devices' or 'clean_devices' -> skipping 'clean' stage", fd_path=output_script)
         return
 
-    for target_device in target_devices:
-        if not os.path.exists(target_device):
-            print_write(f"Target device {target_device} does not exist -> skipping cleaning", fd_path=output_script)
-            continue
-
-        if os.path.islink(target_device):
-            target_device = os.readlink(target_device)
-            print_write(f"Resolved symlink {target_device} to real target device", fd_path=output_script)
+    topology: BlockTopology = get_block_topology(refresh=True)
+    target_devices: list[str] = resolve_clean_patterns(clean_patterns, topology)
+    if not target_devices:
+        print_write(f"No devices matched {', '.join(clean_patterns)} -> skipping 'clean' stage", fd_path=output_script)
+        return
 
-        cleanup_device_resources(target_device)
+    print_write(f"Cleaning {len(target_devices)} devices: {', '.join(target_devices)}", fd_path=output_script)
+    max_workers: int = int(config.get('clean_jobs', None) or 4)
+    # Device trees are independent -> cleaned concurrently, each one tears down its own mounts/mappings in order
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='clean') as executor:
+        cleanup_futures = {
+            target_device: executor.submit(contextvars.copy_context().run, cleanup_device_resources, target_device)
+            for target_device in target_devices
+        }
+        summaries: dict[str, dict[str, Any]] = {}
+        for target_device, future in cleanup_futures.items():
+            try:
+                summaries[target_device] = future.result()
+            except Exception as e:
+                summaries[target_device] = {'device': target_device, 'error': str(e)}
+
+    print("Clean summary:")
+    for target_device, summary in summaries.items():
+        if summary.get('error'):
+            print(f"  {target_device}: failed -> {summary['error']}")
+            continue
+        status: str = 'ok' if not summary['busy'] and not summary['failed'] else 'incomplete'
+        print(
+            f"  {target_device}: {status} -> unmounted {len(summary['unmounted'])}, closed {', '.join(summary['closed']) or '-'}"
+            + (f", busy {', '.join(summary['busy'])}" if summary['busy'] else '')
+            + (f", still open {', '.join(summary['failed'])}" if summary['failed'] else '')
+        )
 
 
 def run_ensure_dependency_stages(
@@ -1731,6 +4609,10 @@ def run_ensure_dependency_stages(
     for depends_stage in depends_stages:
         if depends_stage in processed_stages:
             continue
+        # Walk nested 'depends' of the dependency before running it
+        run_ensure_dependency_stages(set_config.get(depends_stage, {}), set_config, config)
+        if depends_stage in config.get('processed_stages', []):
+            continue
         run_stage(depends_stage, set_config, config)
 
 
@@ -1785,6 +4667,142 @@ def run_file_in_chroot(
     )
 
 
+# ------------------------ Package cache -------------------------
+# Downloaded packages are kept in a host side cache shared by all installs:
+# pacstrap -> cache bind mounted over '<chroot>/var/cache/pacman/pkg', debootstrap -> '--cache-dir'.
+# Least recently used packages are evicted once the cache exceeds '--package_cache_size'
+
+
+def get_package_cache_dir(
+    config: dict[str, Any] = {},
+    *sub_dirs: str,
+) -> str | None:
+    if config.get('no_package_cache', False):
+        return None
+
+    cache_root: str = os.path.expanduser(config.get('package_cache', None) or '/var/tmp/bootstrap_package_cache')
+    cache_dir: str = os.path.abspath(os.path.join(cache_root, *sub_dirs))
+    if not is_planning():
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def evict_package_cache(
+    cache_dir: str,
+    max_size: str | int = '20G',
+) -> list[str]:
+    """
+    Remove the least recently used files (access or modification time) until 'cache_dir' fits into 'max_size'.
+    """
+    max_bytes: int = parse_sector_count(max_size, 1)
+
+    cached_files: list[tuple[float, int, str]] = []
+    for dir_path, _, file_names in os.walk(cache_dir):
+        for file_name in file_names:
+            file_path: str = os.path.join(dir_path, file_name)
+            file_stat: os.stat_result = os.lstat(file_path)
+            if stat.S_ISREG(file_stat.st_mode):
+                cached_files.append((max(file_stat.st_atime, file_stat.st_mtime), file_stat.st_size, file_path))
+
+    total_bytes: int = sum(file_size for _, file_size, _ in cached_files)
+    removed_files: list[str] = []
+    for _, file_size, file_path in sorted(cached_files):
+        if total_bytes <= max_bytes:
+            break
+        os.remove(file_path)
+        total_bytes -= file_size
+        removed_files.append(file_path)
+
+    if removed_files:
+        print(f"Evicted {len(removed_files)} packages from cache {cache_dir} -> {total_bytes / 1024 ** 3:.2f} GiB remaining")
+    return removed_files
+
+
+# ------------------------ Base rootfs store -------------------------
+# The installed base system is archived (zstd compressed tar, multithreaded) keyed by the install inputs.
+# Later installs with identical inputs unpack the archive into the mounted chroot instead of bootstrapping
+
+rootfs_archive_excludes: tuple[str, ...] = ('./proc/*', './sys/*', './dev/*', './run/*', './tmp/*', './var/cache/pacman/pkg/*')
+
+
+def get_nested_mount_paths(chroot_mount_point: str) -> list[str]:
+    """
+    Mount points below the chroot (other subvolumes, /efi, /boot, swap) as tar member names ('./home').
+    Only the root filesystem is archived -> user data, swapfiles and vfat partitions stay out of the archive.
+    """
+    root_path: str = os.path.realpath(chroot_mount_point)
+    return sorted({
+        './' + os.path.relpath(mount['mount_point'], root_path)
+        for mount in read_mountinfo() if mount['mount_point'].startswith(root_path + '/')
+    })
+
+
+def get_rootfs_archive_path(
+    program_binary: str,
+    target_system_type: str | None,
+    bootstrap_options: dict[str, Any] | None,
+    config: dict[str, Any] = {},
+    nested_mount_paths: list[str] = [],
+) -> str:
+    import hashlib
+    import json
+
+    rootfs_store: str = os.path.expanduser(config.get('rootfs_store', None) or '/var/tmp/bootstrap_rootfs_store')
+    rootfs_inputs: dict[str, Any] = {
+        'program': os.path.basename(program_binary),
+        'type': target_system_type,
+        # release, packages, arch, components, source
+        'options': bootstrap_options,
+        # the archived tree differs with the mount layout
+        'excluded_mounts': nested_mount_paths,
+    }
+    rootfs_key: str = hashlib.sha256(json.dumps(rootfs_inputs, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return os.path.join(rootfs_store, f"rootfs-{target_system_type or 'custom'}-{rootfs_key}.tar.zst")
+
+
+def store_rootfs_archive(
+    chroot_mount_point: str,
+    rootfs_archive_path: str,
+    nested_mount_paths: list[str] = [],
+) -> None:
+    if not is_planning():
+        os.makedirs(os.path.dirname(rootfs_archive_path), exist_ok=True)
+
+    # Unique temp name + rename -> an interrupted or concurrent capture never leaves a partial archive behind
+    temp_archive_path: str = f"{rootfs_archive_path}.{os.getpid()}-{threading.get_ident()}.partial"
+    # Empty mount point directories are kept, their content excluded ('--one-file-system' misses bind mounts of the same fs)
+    exclude_patterns: list[str] = [*rootfs_archive_excludes, *(f"{mount_path}/*" for mount_path in nested_mount_paths)]
+    exclude_options: str = ' '.join(f"--exclude='{exclude_pattern}'" for exclude_pattern in exclude_patterns)
+    run_cmd(
+        f"sudo tar --create --file='{temp_archive_path}' --use-compress-program='zstd -T0 -3' --one-file-system "
+        f"--xattrs --xattrs-include='*' --acls --numeric-owner {exclude_options} -C '{chroot_mount_point}' .",
+        check=True
+    )
+    run_cmd(f"sudo mv '{temp_archive_path}' '{rootfs_archive_path}'", check=True)
+    print_write(f"Stored base rootfs of {chroot_mount_point} at {rootfs_archive_path}")
+
+
+def restore_rootfs_archive(
+    rootfs_archive_path: str,
+    chroot_mount_point: str,
+    nested_mount_paths: list[str] = [],
+) -> bool:
+    if not os.path.exists(rootfs_archive_path):
+        return False
+
+    # Mounted mount point directories are skipped entirely -> no owner/xattr/acl changes on the mounted (vfat) roots
+    exclude_options: str = ' '.join(
+        f"--exclude='{mount_path}' --exclude='{mount_path}/*'" for mount_path in nested_mount_paths
+    )
+    print_write(f"Restoring base rootfs from {rootfs_archive_path} to {chroot_mount_point} -> skipping bootstrap")
+    run_cmd(
+        f"sudo tar --extract --file='{rootfs_archive_path}' --use-compress-program='zstd -T0' "
+        f"--xattrs --xattrs-include='*' --acls --numeric-owner --preserve-permissions {exclude_options} -C '{chroot_mount_point}'",
+        check=True
+    )
+    return True
+
+
 def install_system(
     stage_cfg: dict[str, Any],
     set_config: dict[str, Any] = {},
@@ -1811,7 +4829,9 @@ def install_system(
 
     program_binary = os.path.expanduser(program_binary)
     program_path: str | None = shutil.which(program_binary)
-    if not program_path or not os.path.exists(program_path):
+    if not program_path and is_planning():
+        program_path = program_binary
+    elif not program_path or not os.path.exists(program_path):
         raise ValueError(f"Installation program '{program_binary}' not found in the system PATH -> exiting")
 
     chroot_mount_point: str | None = set_config.get('chroot_mount', None)
@@ -1825,7 +4845,7 @@ def install_system(
         chroot_mount_point = config.get('mount', '/tmp/bootstrap_mount')
 
     chroot_mount_point = get_variable_value('chroot_mount', chroot_mount_point)
-    if not os.path.exists(chroot_mount_point):
+    if not os.path.exists(chroot_mount_point) and not is_planning():
         raise ValueError(f"Chroot mount point '{chroot_mount_point}' does not exist in the system -> exiting")
 
     print_write(f"Using installation program '{program_binary}' found at '{program_path}'")
@@ -1833,6 +4853,9 @@ def install_system(
     bootstrap_options = None
 
     cmd: str | None = None
+    package_cache_dir: str | None = None
+    # Target path the package cache is bind mounted to (pacman), debootstrap takes the cache as option
+    package_cache_mount: str | None = None
     source_url: str | None = stage_cfg.get('source', None)
 
     # https://packages.debian.org/stable/debootstrap - https://salsa.debian.org/installer-team/debootstrap
@@ -1845,6 +4868,7 @@ def install_system(
         release: str = bootstrap_options.get('release', 'stable')
 
         cmd = f"sudo {program_path} --arch={target_system_arch} --components={components} {release} '{chroot_mount_point}' '{source_url}'"
+        package_cache_dir = get_package_cache_dir(config, 'debootstrap', f"{release}-{target_system_arch}")
 
     elif target_system_type == 'ubuntu':
         bootstrap_options = stage_cfg.get('deb', {})
@@ -1856,6 +4880,7 @@ def install_system(
 
         cmd = f"sudo {program_path} --arch={target_system_arch} --components={components} {release} '{chroot_mount_point}' '{source_url}'"
         # "debootstrap noble /mnt http://de.archive.ubuntu.com/ubuntu"
+        package_cache_dir = get_package_cache_dir(config, 'debootstrap', f"{release}-{target_system_arch}")
 
     # apparently when using debian host https://packages.debian.org/search?searchon=sourcenames&keywords=arch-install-scripts
     # in the bullseye package the pacstrap script is missing
@@ -1864,23 +4889,406 @@ def install_system(
     elif target_system_type == 'arch' or target_system_type == 'manjaro':
         bootstrap_options = stage_cfg.get('arch', {})
         # source_url = bootstrap_options.get('source', "https://mirrors.kernel.org/archlinux/")
-        packages: str = bootstrap_options.get('packages', 'base linux linux-firmware sudo')
+        packages: str | list[str] = bootstrap_options.get('packages', 'base linux linux-firmware sudo')
+        if isinstance(packages, list):
+            packages = ' '.join(packages)
         # -M option to not copy the host's /etc/pacman.d/mirrorlist
         # -G avoids copying the host's pacman keyring to the target
         # -K Initialize an empty pacman keyring in the target
         cmd = f"sudo {program_path} -M -G -K '{chroot_mount_point}' {packages}"
+        package_cache_dir = get_package_cache_dir(config, 'pacman')
+        if package_cache_dir:
+            package_cache_mount = os.path.join(chroot_mount_point, 'var/cache/pacman/pkg')
 
         # cmd = f"sudo {program_path} -C '{source_url}' -G -M '{chroot_mount_point}' {packages}"
 
-    os.system(cmd)
+    install_estimate: dict[str, float] | None = None
+    if is_planning():
+        install_packages: str | list[str] | None = bootstrap_options.get('packages', None) if bootstrap_options else None
+        install_estimate = active_plan.estimate_download(estimate_install_download_bytes(program_binary, install_packages))
+
+    rootfs_archive_path: str | None = None
+    nested_mount_paths: list[str] = []
+    if config.get('reuse_rootfs', False):
+        nested_mount_paths = get_nested_mount_paths(chroot_mount_point)
+        rootfs_archive_path = get_rootfs_archive_path(program_binary, target_system_type, bootstrap_options, config=config, nested_mount_paths=nested_mount_paths)
+        if restore_rootfs_archive(rootfs_archive_path, chroot_mount_point, nested_mount_paths):
+            return
+
+    if package_cache_dir and not package_cache_mount:
+        cmd = cmd.replace(f"sudo {program_path} ", f"sudo {program_path} --cache-dir='{package_cache_dir}' ", 1)
+    if package_cache_mount:
+        print_write(f"Using package cache {package_cache_dir} -> bind mounted to {package_cache_mount}")
+        run_cmd(f"sudo mkdir -p '{package_cache_mount}'")
+        run_cmd(f"sudo mount --bind '{package_cache_dir}' '{package_cache_mount}'", check=True)
+
+    try:
+        run_cmd(cmd, check=True, estimate=install_estimate)
+    finally:
+        if package_cache_mount:
+            run_cmd(f"sudo umount '{package_cache_mount}'")
+
+    if package_cache_dir and not is_planning():
+        # Eviction over the whole cache (all releases/package managers)
+        evict_package_cache(get_package_cache_dir(config), config.get('package_cache_size', None) or '20G')
+
+    if rootfs_archive_path:
+        store_rootfs_archive(chroot_mount_point, rootfs_archive_path, nested_mount_paths)
+
+
+# ------------------------ Filesystem benchmark -------------------------
+# 'bench' stage: sequential and random read/write throughput of every partition/subvolume mounted below the system root.
+# O_DIRECT with page aligned (mmap) buffers, 'queue depth' threads issuing synchronous pread/pwrite concurrently.
+# Written data is random, so compressed subvolumes are not measured with trivially compressible blocks
+
+bench_random_block_size: int = 4096
+bench_file_name: str = '.bootstrap_bench'
+
+
+def get_bench_settings(
+    stage_cfg: dict[str, Any],
+    config: dict[str, Any] = {},
+) -> dict[str, Any]:
+    block_size: int = parse_sector_count(stage_cfg.get('block_size', None) or config.get('bench_block_size', None) or '1M', sector_size=1)
+    size: int = parse_sector_count(stage_cfg.get('size', None) or config.get('bench_size', None) or '256M', sector_size=1)
+    if block_size % bench_random_block_size or size < block_size:
+        raise ValueError(f"Benchmark block size {block_size} must be a multiple of {bench_random_block_size} and not larger than the size {size} -> exiting")
+
+    return {
+        # whole blocks only, O_DIRECT transfers have to stay aligned
+        'size': size - size % block_size,
+        'block_size': block_size,
+        'random_block_size': bench_random_block_size,
+        'queue_depth': max(1, int(stage_cfg.get('queue_depth', None) or config.get('bench_queue_depth', None) or 4)),
+        'runtime': float(stage_cfg.get('runtime', None) or config.get('bench_runtime', None) or 5),
+    }
+
+
+def get_bench_output_path(config: dict[str, Any] = {}) -> str:
+    if config.get('bench_output', None):
+        return config['bench_output']
+
+    label_suffix: str = f".{config['batch_label']}" if config.get('batch_label') else ''
+    records_log: str | None = config.get('records_log', None)
+    if records_log:
+        # next to the run log: run.jsonl -> run.bench.json
+        return f"{os.path.splitext(records_log)[0]}{label_suffix}.bench.json"
+
+    return os.path.join(get_cache_dir(), 'bench', f"bench-{time.strftime('%Y%m%d-%H%M%S')}{label_suffix}.json")
+
+
+def get_bench_mounts(
+    bench_root: str,
+    paths: list[str] | None = None,
+) -> list[dict[str, Any]]:
+    mounted_at: dict[str, dict[str, Any]] = get_mounted_at(read_mountinfo())
+    if paths:
+        return [mounted_at.get(os.path.realpath(path), {'mount_point': os.path.realpath(path), 'source': '', 'fstype': '', 'options': ''}) for path in paths]
+
+    root_path: str = os.path.realpath(bench_root)
+    return [
+        mount for mount_point, mount in sorted(mounted_at.items())
+        if (mount_point == root_path or mount_point.startswith(root_path + '/')) and mount['source'].startswith('/dev/')
+    ]
+
+
+def open_bench_file(file_path: str) -> tuple[int, bool]:
+    """
+    Open the benchmark file with O_DIRECT -> (fd, direct), buffered if the filesystem does not support it (tmpfs).
+    """
+    import errno
+    flags: int = os.O_RDWR | os.O_CREAT | os.O_TRUNC
+    try:
+        return os.open(file_path, flags | os.O_DIRECT, 0o600), True
+    except OSError as e:
+        if e.errno != errno.EINVAL:
+            raise
+    return os.open(file_path, flags, 0o600), False
+
+
+def run_bench_phase(
+    fd: int,
+    write: bool,
+    block_size: int,
+    file_size: int,
+    queue_depth: int,
+    pattern_buffer: Any,
+    runtime: float | None = None,
+) -> dict[str, Any]:
+    """
+    Sequential pass over the whole file (runtime None) or random aligned blocks until 'runtime' seconds passed.
+    """
+    import mmap
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    block_count: int = file_size // block_size
+    deadline: float = 0.0
+
+    def worker(worker_index: int) -> list[float]:
+        # mmap memory is page aligned, as required by O_DIRECT
+        buffer: Any = pattern_buffer if write else mmap.mmap(-1, block_size)
+        buffer_view: memoryview = memoryview(buffer)[:block_size]
+        latencies: list[float] = []
+        if runtime is None:
+            block_indexes = range(worker_index, block_count, queue_depth)
+        else:
+            rng = random.Random(worker_index)
+            block_indexes = iter(lambda: rng.randrange(block_count), None)
+
+        try:
+            for block_index in block_indexes:
+                if runtime is not None and time.monotonic() >= deadline:
+                    break
+                op_start: float = time.perf_counter()
+                if write:
+                    os.pwrite(fd, buffer_view, block_index * block_size)
+                else:
+                    os.preadv(fd, [buffer_view], block_index * block_size)
+                latencies.append(time.perf_counter() - op_start)
+        finally:
+            buffer_view.release()
+            if not write:
+                buffer.close()
+        return latencies
+
+    phase_start: float = time.monotonic()
+    deadline = phase_start + (runtime or 0)
+    with ThreadPoolExecutor(max_workers=queue_depth, thread_name_prefix='bench') as executor:
+        latencies: list[float] = sorted(
+            latency for worker_latencies in executor.map(worker, range(queue_depth)) for latency in worker_latencies
+        )
+    if write:
+        os.fsync(fd)
+    duration: float = time.monotonic() - phase_start
+
+    op_count: int = len(latencies)
+    return {
+        'ops': op_count,
+        'bytes': op_count * block_size,
+        'seconds': round(duration, 4),
+        'mib_s': round(op_count * block_size / duration / (1024 ** 2), 2) if duration else 0.0,
+        'iops': round(op_count / duration, 1) if duration else 0.0,
+        'lat_avg_ms': round(sum(latencies) / op_count * 1000, 3) if op_count else 0.0,
+        'lat_p99_ms': round(latencies[min(op_count - 1, int(op_count * 0.99))] * 1000, 3) if op_count else 0.0,
+    }
+
+
+def bench_mount_point(
+    mount: dict[str, Any],
+    settings: dict[str, Any],
+) -> dict[str, Any]:
+    import mmap
+    mount_point: str = mount['mount_point']
+    result: dict[str, Any] = {
+        'mount_point': mount_point,
+        'source': mount.get('source', ''),
+        'fstype': mount.get('fstype', ''),
+        'options': mount.get('options', ''),
+    }
+
+    if 'ro' in mount.get('options', '').split(','):
+        return {**result, 'skipped': 'read-only mount'}
+    if not os.access(mount_point, os.W_OK):
+        return {**result, 'skipped': 'not writable (requires root)'}
+    fs_stat = os.statvfs(mount_point)
+    if fs_stat.f_bavail * fs_stat.f_frsize < settings['size'] * 1.1:
+        return {**result, 'skipped': f"less than {settings['size'] * 1.1 / (1024 ** 2):.0f} MiB free"}
+
+    bench_file: str = os.path.join(mount_point, f"{bench_file_name}.{os.getpid()}")
+    pattern_buffer = mmap.mmap(-1, settings['block_size'])
+    pattern_buffer.write(os.urandom(settings['block_size']))
+    fd, direct = open_bench_file(bench_file)
+    try:
+        phases: dict[str, dict[str, Any]] = {}
+        phase_args: dict[str, Any] = {'file_size': settings['size'], 'queue_depth': settings['queue_depth'], 'pattern_buffer': pattern_buffer}
+        phases['seq_write'] = run_bench_phase(fd, True, settings['block_size'], **phase_args)
+        if not direct:
+            # buffered fallback -> reads must not be served from the page cache
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        phases['seq_read'] = run_bench_phase(fd, False, settings['block_size'], **phase_args)
+        phases['rand_read'] = run_bench_phase(fd, False, settings['random_block_size'], runtime=settings['runtime'], **phase_args)
+        phases['rand_write'] = run_bench_phase(fd, True, settings['random_block_size'], runtime=settings['runtime'], **phase_args)
+    finally:
+        os.close(fd)
+        os.unlink(bench_file)
+        pattern_buffer.close()
+
+    return {**result, 'direct': direct, 'phases': phases}
+
+
+def bench_filesystems(
+    stage_cfg: dict[str, Any],
+    set_config: dict[str, Any] = {},
+    config: dict[str, Any] = {},
+) -> None:
+    stage_cfg = stage_cfg or {}
+    bench_root: str = config.get('chroot_mount', None) or config.get('mount', None) or '/tmp/bootstrap_mount'
+    settings: dict[str, Any] = get_bench_settings(stage_cfg, config)
+
+    if is_planning():
+        print_write(f"Benchmarking the filesystems mounted below {bench_root} -> skipped while planning")
+        return
+
+    bench_mounts: list[dict[str, Any]] = get_bench_mounts(bench_root, stage_cfg.get('paths', None))
+    if not bench_mounts:
+        print(f"Nothing mounted below {bench_root} -> run the 'chroot' stage first -> skipping benchmark")
+        return
+
+    print(f"Benchmarking {len(bench_mounts)} filesystems below {bench_root} -> {settings['size'] // (1024 ** 2)} MiB file, queue depth {settings['queue_depth']}")
+    # One mount point after another, concurrent runs on the same disk would measure each other
+    results: list[dict[str, Any]] = []
+    for mount in bench_mounts:
+        result: dict[str, Any] = bench_mount_point(mount, settings)
+        results.append(result)
+        session_writer.write_record('bench', **result)
+
+        if result.get('skipped'):
+            print(f"{result['mount_point']}: skipped -> {result['skipped']}")
+            continue
+        phases: dict[str, dict[str, Any]] = result['phases']
+        print(
+            f"{result['mount_point']} ({result['fstype']}{'' if result['direct'] else ', buffered'}): "
+            f"seq write {phases['seq_write']['mib_s']} MiB/s, seq read {phases['seq_read']['mib_s']} MiB/s, "
+            f"rand read {phases['rand_read']['iops']} IOPS, rand write {phases['rand_write']['iops']} IOPS"
+        )
+
+    import json
+    output_path: str = get_bench_output_path(config)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as output_fd:
+        json.dump({
+            'time': time.time(),
+            'host': get_host_key(),
+            'label': config.get('batch_label', None),
+            'settings': settings,
+            'results': results,
+        }, output_fd, indent=2)
+    print(f"Wrote benchmark results to {output_path}")
+
+
+# ------------------------ Stage checkpoint journal -------------------------
+# Completed stages and partition steps are recorded on disk with a hash of their inputs.
+# With '--resume' unchanged steps are skipped, running a step again invalidates everything completed after it
+
+# Mounts, loop devices and open LUKS mappings do not survive a crash/reboot -> these stages always run (and benchmarks measure every run)
+unjournaled_stages: tuple[str, ...] = ('chroot', 'clean', 'bench')
+
+
+def hash_step_inputs(*inputs: Any) -> str:
+    import hashlib
+    import json
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_stage_hash_inputs(stage_config: dict[str, Any]) -> dict[str, Any]:
+    # 'variables' are merged with the whole config by 'get_variables' (self referencing) -> only the primitive values
+    variables: dict[str, Any] = stage_config.get('variables', None) or {}
+    return {
+        **{key: value for key, value in stage_config.items() if key != 'variables'},
+        'variables': {key: value for key, value in variables.items() if value is None or isinstance(value, (str, int, float, bool))},
+    }
+
+
+class StageJournal:
+
+    def __init__(self, journal_path: str, resume: bool = False):
+        self.journal_path: str = journal_path
+        self.resume: bool = resume
+        self.lock = threading.RLock()
+        # Insertion order == completion order
+        self.steps: dict[str, dict[str, Any]] = {}
+
+        if resume and os.path.exists(journal_path):
+            import json
+            with open(journal_path, 'r') as journal_fd:
+                self.steps = json.load(journal_fd).get('steps', {})
+            print(f"Resuming from journal {journal_path} -> completed steps: {', '.join(self.steps) or '-'}")
+
+    def is_done(self, step_key: str, input_hash: str) -> bool:
+        with self.lock:
+            step: dict[str, Any] | None = self.steps.get(step_key, None)
+            return self.resume and bool(step) and step.get('input_hash') == input_hash
+
+    def begin(self, step_key: str) -> None:
+        with self.lock:
+            if step_key not in self.steps:
+                return
+            step_keys: list[str] = list(self.steps)
+            for invalid_key in step_keys[step_keys.index(step_key):]:
+                del self.steps[invalid_key]
+            self.save()
+
+    def complete(self, step_key: str, input_hash: str, **info: Any) -> None:
+        with self.lock:
+            self.steps.pop(step_key, None)
+            self.steps[step_key] = {'input_hash': input_hash, 'completed': time.time(), **info}
+            self.save()
+
+    def save(self) -> None:
+        import json
+
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        temp_path: str = f"{self.journal_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as journal_fd:
+            json.dump({'steps': self.steps}, journal_fd, indent=2)
+            journal_fd.flush()
+            os.fsync(journal_fd.fileno())
+        # Atomic -> a crash leaves either the previous or the new journal
+        os.replace(temp_path, self.journal_path)
+
+
+def open_stage_journal(config: dict[str, Any] = {}) -> StageJournal | None:
+    if is_planning():
+        return None
+
+    state_dir: str = config.get('state_dir', None) or os.path.join(get_cache_dir(), 'journal')
+    target_key: str = hash_step_inputs(
+        config.get('source_path', None),
+        config.get('set', None),
+        os.path.realpath(config['simulate']) if config.get('simulate') else config.get('target_device', None),
+    )
+    journal_path: str = os.path.join(os.path.expanduser(state_dir), f"{target_key[:16]}.json")
+    return StageJournal(journal_path, resume=bool(config.get('resume', False)))
+
+
+def run_journaled_step(
+    step_key: str,
+    input_hash: str,
+    step_fn: Any,
+    *args: Any,
+    journal: StageJournal | None = None,
+    **kwargs: Any,
+) -> bool:
+    """
+    Run 'step_fn' unless it completed with the same inputs in a resumed run -> returns whether it ran.
+    """
+    if not journal:
+        step_fn(*args, **kwargs)
+        return True
+
+    if journal.is_done(step_key, input_hash):
+        print(f"Step '{step_key}' completed in a previous run with unchanged inputs -> skipping (resume)")
+        return False
+
+    journal.begin(step_key)
+    step_fn(*args, **kwargs)
+    journal.complete(step_key, input_hash)
+    return True
 
 
 # ------------------------ Invoking stages/main functions -------------------------
+# Guards 'processed_stages' when independent stages run concurrently
+stage_state_lock = threading.Lock()
+# Wall time per executed stage -> reported in 'print_command_timing_summary'
+stage_durations: dict[str, float] = {}
+
 default_stage_exec_map = {
     'partitions': exec_partitions_installer,
     'chroot': mount_system_root,
     'clean': clean_devices,
     'install': install_system,
+    'bench': bench_filesystems,
 }
 
 
@@ -1914,20 +5322,187 @@ def run_stage(
         return None
 
     if callable(stage_exec_fn):
-        stage_exec_fn(
-            stage_config,
-            set_config=set_config,
-            config=config
-        )
-
-        if 'processed_stages' not in config:
-            config['processed_stages'] = []
-        config['processed_stages'].append(stage_key)
+        stage_label: str = f"{config['batch_label']}/{stage_key}" if config.get('batch_label') else stage_key
+        stage_token = current_stage_key.set(stage_label)
+        stage_start_time: float = time.monotonic()
+        try:
+            if stage_key in unjournaled_stages:
+                stage_exec_fn(
+                    stage_config,
+                    set_config=set_config,
+                    config=config
+                )
+            else:
+                run_journaled_step(
+                    stage_key,
+                    hash_step_inputs(stage_key, get_stage_hash_inputs(stage_config), config.get('simulate', None), config.get('system', None)),
+                    stage_exec_fn,
+                    stage_config,
+                    journal=config.get('journal', None),
+                    set_config=set_config,
+                    config=config
+                )
+        finally:
+            current_stage_key.reset(stage_token)
+            stage_durations[stage_label] = time.monotonic() - stage_start_time
+            session_writer.write_record('stage', stage_key=stage_label, duration=stage_durations[stage_label])
+            session_writer.flush()
+
+        with stage_state_lock:
+            if 'processed_stages' not in config:
+                config['processed_stages'] = []
+            config['processed_stages'].append(stage_key)
 
     else:
         print_write(f"Stage {stage_key} is not a callable function -> skipping stage.", fd_path=output_script)
 
 
+def get_stage_depends(
+    stage_key: str,
+    set_config: dict[str, Any] = {},
+) -> list[str] | None:
+    stage_cfg: dict[str, Any] = set_config.get(stage_key, {}) or {}
+    depends_stages: list[str] | str | None = get_first_defined_key(stage_cfg, ['depend', 'depends'], None)
+    if depends_stages is None:
+        return None
+    if isinstance(depends_stages, str):
+        depends_stages = [depends_stages]
+    return list(depends_stages)
+
+
+def build_stage_graph(
+    stages: list[str],
+    set_config: dict[str, Any] = {},
+) -> dict[str, list[str]]:
+    """
+    Build the stage dependency graph {stage: [stages it waits for]}.
+    Stages which define 'depends' only wait for those (and are pulled in transitively),
+    stages without a 'depends' key keep the CLI order and wait for the previously listed stage.
+    """
+    stage_graph: dict[str, list[str]] = {}
+
+    previous_stage: str | None = None
+    # (stage, previous stage in CLI order of the stage that requires it)
+    pending_stages: list[tuple[str, str | None]] = []
+    for stage_key in stages:
+        depends_stages: list[str] | None = get_stage_depends(stage_key, set_config)
+        if depends_stages is None:
+            depends_stages = [previous_stage] if previous_stage else []
+        else:
+            pending_stages.extend((depends_stage, previous_stage) for depends_stage in depends_stages)
+
+        stage_graph[stage_key] = depends_stages
+        previous_stage = stage_key
+
+    # Pull in dependencies which were not passed as stages
+    while pending_stages:
+        stage_key, previous_stage = pending_stages.pop()
+        if stage_key in stage_graph:
+            continue
+        depends_stages = get_stage_depends(stage_key, set_config)
+        if depends_stages is None:
+            depends_stages = [previous_stage] if previous_stage else []
+        else:
+            pending_stages.extend((depends_stage, previous_stage) for depends_stage in depends_stages)
+        stage_graph[stage_key] = depends_stages
+
+    return stage_graph
+
+
+def detect_stage_cycle(
+    stage_graph: dict[str, list[str]],
+) -> list[str] | None:
+    visiting: list[str] = []
+    visited: set[str] = set()
+
+    def visit(stage_key: str) -> list[str] | None:
+        if stage_key in visiting:
+            return visiting[visiting.index(stage_key):] + [stage_key]
+        if stage_key in visited:
+            return None
+
+        visiting.append(stage_key)
+        for depends_stage in stage_graph.get(stage_key, []):
+            cycle: list[str] | None = visit(depends_stage)
+            if cycle:
+                return cycle
+        visiting.pop()
+        visited.add(stage_key)
+        return None
+
+    for stage_key in stage_graph:
+        cycle = visit(stage_key)
+        if cycle:
+            return cycle
+    return None
+
+
+def order_stage_graph(
+    stage_graph: dict[str, list[str]],
+) -> list[str]:
+    """
+    Dependencies first, otherwise graph order (CLI stages, then pulled in ones) -> sequential run order of an acyclic graph.
+    """
+    ordered_stages: list[str] = []
+
+    def visit(stage_key: str) -> None:
+        if stage_key in ordered_stages:
+            return
+        for depends_stage in stage_graph.get(stage_key, []):
+            visit(depends_stage)
+        ordered_stages.append(stage_key)
+
+    for stage_key in stage_graph:
+        visit(stage_key)
+    return ordered_stages
+
+
+def run_stages_parallel(
+    stage_graph: dict[str, list[str]],
+    set_config: dict[str, Any] = {},
+    config: dict[str, Any] = {},
+    stage_exec_map: dict[str, Any] = default_stage_exec_map,
+    max_workers: int = 2
+) -> None:
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    output_script: str | None = config.get('output', None)
+    processed_stages: list[str] = config.setdefault('processed_stages', [])
+
+    remaining_stages: dict[str, set[str]] = {
+        stage_key: set(depends_stages) - set(processed_stages)
+        for stage_key, depends_stages in stage_graph.items()
+        if stage_key not in processed_stages
+    }
+    running_futures: dict[Any, str] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage') as executor:
+        while remaining_stages or running_futures:
+            ready_stages: list[str] = [stage_key for stage_key, depends_stages in remaining_stages.items() if not depends_stages]
+            for stage_key in ready_stages:
+                del remaining_stages[stage_key]
+                print_write(f"Scheduling Stage '{stage_key}' (waited for: {', '.join(stage_graph[stage_key]) or '-'})", fd_path=output_script)
+                future = executor.submit(
+                    run_stage,
+                    stage_key,
+                    set_config,
+                    config,
+                    stage_exec_map=stage_exec_map
+                )
+                running_futures[future] = stage_key
+
+            if not running_futures:
+                raise ValueError(f"Stages {', '.join(remaining_stages)} can not be scheduled -> unresolved dependencies")
+
+            done_futures, _ = wait(running_futures, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                stage_key = running_futures.pop(future)
+                # Re-raise stage failures -> dependent stages must not run on a half finished device
+                future.result()
+                for depends_stages in remaining_stages.values():
+                    depends_stages.discard(stage_key)
+
+
 def run_stages(
     stages: list[str],
     set_config: dict[str, Any] = {},
@@ -1935,7 +5510,27 @@ def run_stages(
     stage_exec_map: dict[str, Any] = default_stage_exec_map
 ) -> None:
 
-    for stage_key in stages:
+    stage_graph: dict[str, list[str]] = build_stage_graph(stages, set_config)
+    stage_cycle: list[str] | None = detect_stage_cycle(stage_graph)
+    if stage_cycle:
+        raise ValueError(f"Stage dependency cycle detected: {' -> '.join(stage_cycle)} -> exiting")
+
+    max_workers: int = int(config.get('jobs', 1) or 1)
+    if max_workers > 1:
+        run_stages_parallel(
+            stage_graph,
+            set_config,
+            config,
+            stage_exec_map=stage_exec_map,
+            max_workers=max_workers
+        )
+        return
+
+    # Same stages as the parallel scheduler (including pulled in 'depends'), one at a time
+    processed_stages: list[str] = config.setdefault('processed_stages', [])
+    for stage_key in order_stage_graph(stage_graph):
+        if stage_key in processed_stages:
+            continue
         run_stage(
             stage_key,
             set_config,
@@ -1944,6 +5539,214 @@ def run_stages(
         )
 
 
+# ------------------------ Batch image factory -------------------------
+# Bootstrap several simulation images at once, each one gets its own loop device symlink,
+# mount root, partition script and LUKS mapping names so the runs do not collide
+
+
+def get_batch_image_paths(
+    config: dict[str, Any] = {},
+) -> list[str]:
+    batch_images: list[str] = config.get('batch_images', None) or []
+    if batch_images:
+        return [os.path.realpath(image_path) for image_path in batch_images]
+
+    batch_count: int = int(config.get('batch_count', None) or 0)
+    if not batch_count:
+        return []
+
+    batch_template: str = config.get('batch_template', None) or 'bootstrap-{index}.img'
+    if '{index}' not in batch_template:
+        raise ValueError(f"Batch template '{batch_template}' must contain '{{index}}' to create distinct image paths -> exiting")
+
+    return [os.path.realpath(batch_template.format(index=index)) for index in range(batch_count)]
+
+
+def collect_luks_infos(
+    set_config: Any,
+) -> list[dict[str, Any]]:
+    luks_infos: list[dict[str, Any]] = []
+    pending_items: list[Any] = [set_config]
+    while pending_items:
+        item = pending_items.pop()
+        if isinstance(item, dict):
+            if isinstance(item.get('luks', None), dict):
+                luks_infos.append(item['luks'])
+            pending_items.extend(item.values())
+        elif isinstance(item, list):
+            pending_items.extend(item)
+    return luks_infos
+
+
+def resolve_batch_luks_passphrases(
+    set_config: dict[str, Any],
+) -> None:
+    # Prompt once per LUKS mapping before the workers start, input() from worker threads would interleave
+    entered_passphrases: dict[str, str] = {}
+    for luks_info in collect_luks_infos(set_config):
+        if luks_info.get('luks_passphrase', None):
+            continue
+        luks_device_name: str = get_luks_device_name(luks_info)
+        if luks_device_name not in entered_passphrases:
+            entered_passphrases[luks_device_name] = input_variable_value(f"luks_passphrase ({luks_device_name})")
+        luks_info['luks_passphrase'] = entered_passphrases[luks_device_name]
+
+
+def prepare_batch_item_config(
+    image_path: str,
+    index: int,
+    set_config: dict[str, Any] = {},
+    config: dict[str, Any] = {},
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    import copy
+
+    item_set_config: dict[str, Any] = copy.deepcopy(set_config)
+    item_config: dict[str, Any] = copy.deepcopy(config)
+
+    base_mount: str = (
+        config.get('chroot_mount', None)
+        or config.get('mount', None)
+        or set_config.get('chroot', {}).get('variables', {}).get('mount', None)
+        or '/tmp/bootstrap_mount'
+    )
+    item_mount: str = f"{base_mount.rstrip('/')}_{index}"
+
+    item_config.update({
+        'simulate': image_path,
+        'overwrite_sim': config.get('overwrite_sim', False),
+        'loop_device': f"/dev/bootstrap_loop_{index}",
+        'mount': item_mount,
+        'chroot_mount': item_mount,
+        'part_scheme_path': f"/tmp/partitions_{index}.sh",
+        'target_device': None,
+        'processed_stages': [],
+        'batch_label': os.path.basename(image_path),
+    })
+
+    for luks_info in collect_luks_infos(item_set_config):
+        luks_info['luks_device_name'] = f"{get_luks_device_name(luks_info)}_{index}"
+
+    # Journal per image, the shared one (with its lock) is not part of the copied config
+    item_config['journal'] = open_stage_journal(item_config)
+
+    return item_set_config, item_config
+
+
+def run_image_batch(
+    image_paths: list[str],
+    stages: list[str],
+    set_config: dict[str, Any] = {},
+    config: dict[str, Any] = {},
+) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    if config.get('interactive'):
+        raise ValueError("Batch image mode can not be combined with '--interactive' -> exiting")
+    if config.get('reuse_base_image'):
+        # Clones keep the btrfs fsid, LUKS and GPT UUIDs of the base image -> btrfs device scan and by-uuid links would mix them up
+        raise ValueError("Batch image mode can not be combined with '--reuse_base_image', the cloned images would share their UUIDs -> exiting")
+
+    # Same guard as a single simulation image -> fail before any image is touched instead of once per worker
+    if not config.get('overwrite_sim') and not config.get('incremental'):
+        existing_images: list[str] = [image_path for image_path in image_paths if os.path.exists(image_path)]
+        if existing_images:
+            raise ValueError(f"Batch images already exist: {', '.join(existing_images)} -> please delete or use the '--overwrite_sim' option to overwrite them")
+
+    resolve_batch_luks_passphrases(set_config)
+
+    batch_jobs: int = int(config.get('batch_jobs', None) or 2)
+    print(f"Bootstrapping {len(image_paths)} images with up to {batch_jobs} concurrent runs: {', '.join(image_paths)}")
+
+    batch_results: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=batch_jobs, thread_name_prefix='image') as executor:
+        image_futures = {}
+        for index, image_path in enumerate(image_paths):
+            item_set_config, item_config = prepare_batch_item_config(image_path, index, set_config=set_config, config=config)
+            image_futures[executor.submit(
+                contextvars.copy_context().run,
+                run_stages,
+                stages,
+                set_config=item_set_config,
+                config=item_config
+            )] = image_path
+
+        for future, image_path in image_futures.items():
+            try:
+                future.result()
+                batch_results[image_path] = 'ok'
+            except Exception as e:
+                batch_results[image_path] = f"failed: {e}"
+
+    print("---------------------- Batch summary ----------------------")
+    for image_path, image_result in batch_results.items():
+        print(f"{image_path}: {image_result}")
+
+    failed_images: list[str] = [image_path for image_path, image_result in batch_results.items() if image_result != 'ok']
+    if failed_images:
+        raise ValueError(f"{len(failed_images)} of {len(image_paths)} batch images failed -> exiting")
+
+
+def download_config(
+    config_url: str,
+    cache_dir: str | None = None,
+) -> str:
+    """
+    Download a remote config, with a cache dir the last response is kept and re-validated
+    with If-None-Match/If-Modified-Since -> unchanged configs are not downloaded again.
+    """
+    import hashlib
+    import json
+    import requests
+
+    if not cache_dir:
+        response = requests.get(config_url)
+        if response.status_code != 200:
+            raise ValueError(f"Failed to load configuration from URL {config_url} with status code {response.status_code}")
+        config_path: str = '/tmp/bootstrap_config.yml'
+        with open(config_path, 'w') as f:
+            f.write(response.text)
+        return config_path
+
+    url_hash: str = hashlib.sha256(config_url.encode()).hexdigest()[:32]
+    config_path = os.path.join(cache_dir, f"remote-{url_hash}.yml")
+    meta_path: str = os.path.join(cache_dir, f"remote-{url_hash}.json")
+
+    request_headers: dict[str, str] = {}
+    if os.path.exists(config_path) and os.path.exists(meta_path):
+        with open(meta_path, 'r') as meta_fd:
+            cached_meta: dict[str, str] = json.load(meta_fd)
+        if cached_meta.get('etag'):
+            request_headers['If-None-Match'] = cached_meta['etag']
+        if cached_meta.get('last_modified'):
+            request_headers['If-Modified-Since'] = cached_meta['last_modified']
+
+    try:
+        response = requests.get(config_url, headers=request_headers, timeout=30)
+    except requests.RequestException as e:
+        if not os.path.exists(config_path):
+            raise
+        print(f"Could not reach {config_url} ({e}) -> using cached configuration {config_path}")
+        return config_path
+
+    if response.status_code == 304:
+        print(f"Configuration at {config_url} is unchanged -> using cached {config_path}")
+        return config_path
+    if response.status_code != 200:
+        raise ValueError(f"Failed to load configuration from URL {config_url} with status code {response.status_code}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(config_path, 'w') as f:
+        f.write(response.text)
+    with open(meta_path, 'w') as meta_fd:
+        json.dump({
+            'url': config_url,
+            'etag': response.headers.get('ETag', None),
+            'last_modified': response.headers.get('Last-Modified', None),
+        }, meta_fd)
+
+    return config_path
+
+
 def load_config(
     config_path: str,
     args: dict[str, Any] | None = None,
@@ -1965,23 +5768,16 @@ def load_config(
         print(f"Loading configuration from GitHub: {raw_file_path}")
         config_path = raw_file_path
 
+    cache_dir: str | None = None if args.get('no_config_cache') else get_cache_dir()
+
     if config_path.startswith('http://') or config_path.startswith('https://') or config_path.startswith('www.'):
         print(f"Loading configuration from URL: {config_path}")
-        import requests
-        response = requests.get(config_path)
-        if response.status_code != 200:
-            raise ValueError(f"Failed to load configuration from URL {config_path} with status code {response.status_code}")
-        config_path = '/tmp/bootstrap_config.yml'
-        with open(config_path, 'w') as f:
-            f.write(response.text)
+        config_path = download_config(config_path, cache_dir=cache_dir)
 
     if not config_path or not os.path.exists(config_path):
         raise ValueError(f"Configuration file {config_path} does not exist -> exiting")
 
-    source_path: str = args.get('source_path', None)
-    if not source_path:
-        raise ValueError("Source path must be provided in the config")
-    bootstrap_config = load_yml_config(source_path)
+    bootstrap_config = load_yml_config(config_path, cache_dir=cache_dir)
     merge_args_to_config(bootstrap_config, args)
 
     return bootstrap_config
@@ -1989,11 +5785,24 @@ def load_config(
 
 def bootstrap_defined_system(config: dict[str, Any] = {}):
     print('Calling bootstrap_defined_system')
+    load_start_time: float = time.perf_counter()
     bootstrap_config = load_config(
         config_path=config.get('source_path', None),
         args=config
     )
-
+    if config.get('profile_startup'):
+        print(f"Startup profile: config loading {time.perf_counter() - load_start_time:.3f}s")
+
+    plan_path: str | None = bootstrap_config.get('plan', None)
+    if plan_path:
+        global active_plan
+        active_plan = CommandPlan(plan_path, bandwidth_mb_s=float(bootstrap_config.get('plan_bandwidth', None) or 10))
+        # Existing output script branches skip runtime verification of the device state
+        bootstrap_config['output'] = active_plan.plan_path
+        bootstrap_config['output_script'] = active_plan.plan_path
+
+    session_writer.set_records_path(bootstrap_config.get('records_log', None))
+    set_mount_backend(bootstrap_config.get('mount_backend', None) or 'auto')
     init_output_script(bootstrap_config)
     system_type: str = prepare_install_env(bootstrap_config)
 
@@ -2002,11 +5811,28 @@ def bootstrap_defined_system(config: dict[str, Any] = {}):
         raise ValueError("No stages defined in the bootstrap configuration or passed as args -> exiting")
 
     selected_set_config: dict[str, Any] = select_run_set(bootstrap_config)
-    run_stages(
-        run_stage_keys,
-        set_config=selected_set_config,
-        config=bootstrap_config
-    )
+    batch_image_paths: list[str] = get_batch_image_paths(bootstrap_config)
+    try:
+        if batch_image_paths:
+            run_image_batch(
+                batch_image_paths,
+                run_stage_keys,
+                set_config=selected_set_config,
+                config=bootstrap_config
+            )
+        else:
+            bootstrap_config['journal'] = open_stage_journal(bootstrap_config)
+            run_stages(
+                run_stage_keys,
+                set_config=selected_set_config,
+                config=bootstrap_config
+            )
+    finally:
+        if active_plan:
+            active_plan.flush()
+        else:
+            print_command_timing_summary(stage_durations)
+        session_writer.flush()
 
 # ------------------------ Parsing arguments -------------------------
 
@@ -2020,6 +5846,17 @@ def add_simulation_parsing_options(parser: argparse.ArgumentParser):
                         type=str, default=None)
     parser.add_argument('-sims', '--sim_size', help="Size of the simulation image", default='10G')
     parser.add_argument('-osim', '--overwrite_sim', help="Overwrite simulation image even if it exists", action='store_true')
+    parser.add_argument('-rbi', '--reuse_base_image', help="@partitions: Clone the simulation image from a stored base image with the same partition definitions, store one after partitioning if missing (not with batch mode, clones share their UUIDs)", action='store_true')
+    parser.add_argument('-is', '--image_store', help="Directory for stored base images", default='/var/tmp/bootstrap_image_store')
+    parser.add_argument('-pc', '--package_cache', help="@install: Host directory caching the packages downloaded by pacstrap/debootstrap", default='/var/tmp/bootstrap_package_cache')
+    parser.add_argument('-pcs', '--package_cache_size', help="@install: Evict least recently used packages when the cache grows beyond this size", default='20G')
+    parser.add_argument('-rrf', '--reuse_rootfs', help="@install: Unpack a stored base rootfs with identical install inputs instead of bootstrapping, store one after installing", action='store_true')
+    parser.add_argument('-rfs', '--rootfs_store', help="@install: Directory for stored base rootfs archives", default='/var/tmp/bootstrap_rootfs_store')
+    parser.add_argument('-npc', '--no_package_cache', help="@install: Always download packages from the mirrors", action='store_true')
+    parser.add_argument('-bi', '--batch_images', nargs='+', help="Bootstrap several simulation images at once, each with its own loop device and mount root")
+    parser.add_argument('-bc', '--batch_count', help="Number of simulation images to create from '--batch_template'", type=int, default=None)
+    parser.add_argument('-bt', '--batch_template', help="Image path template for '--batch_count', must contain {index}", default='bootstrap-{index}.img')
+    parser.add_argument('-bj', '--batch_jobs', help="How many images are bootstrapped concurrently in batch mode", type=int, default=2)
 
 
 def add_bootstrap_parsing_options(parser: argparse.ArgumentParser):
@@ -2027,19 +5864,42 @@ def add_bootstrap_parsing_options(parser: argparse.ArgumentParser):
 
     parser.add_argument('source_path', help="Path/url or github specifier to .yml file containing part table, fs info and install scripts")
     parser.add_argument('stages', nargs='*', help="Which defined stages to run and setup during the bootstrap process")
-    parser.add_argument('-sys', '--system', help="Target host system to run the bootstrap on", default=identify_system())
+    parser.add_argument('-sys', '--system', help="Target host system to run the bootstrap on (detected from the available package manager if not set)", default=None)
     parser.add_argument('-set', '--set', help="Which defined set to run -> without the stages in 'sets' are executed without a set label")
 
-    parser.add_argument('-cd', '--clean_devices', nargs='+', help="Clean up multiple loop devices with the 'clean' stage, in case not properly closed or removed")
+    parser.add_argument('-cd', '--clean_devices', nargs='+', help="Clean up multiple devices with the 'clean' stage, in case not properly closed or removed -> paths, globs ('/dev/loop*') or 'backing:<dir>' for loop devices backed by images in <dir>")
+    parser.add_argument('-cj', '--clean_jobs', help="@clean: How many device trees are cleaned concurrently", type=int, default=4)
     # parser.add_argument('-s', '--stages', nargs='+', help="Which defined stages to run and setup during the bootstrap process")
     # parser.add_argument('-t', '--target', help="Which defined set to run -> without the stages in 'sets' are executed without a set label")
 
-    # Output script not supported anymore
+    # Output script not supported anymore -> replaced by '--plan'
     # parser.add_argument('-o', '--output', help="Output commands to a script instead of executing them directly")
-
+    parser.add_argument('-p', '--plan', help="Do not touch any device, write the commands of all stages to this script + a .json plan with estimated durations")
+    parser.add_argument('-pbw', '--plan_bandwidth', help="@plan: Assumed package download bandwidth in MB/s for install estimates", type=float, default=10)
+    parser.add_argument('-res', '--resume', help="Skip stages and partition steps which completed in a previous run with unchanged inputs (see '--state_dir')", action='store_true')
+    parser.add_argument('-sd', '--state_dir', help="Directory for the stage checkpoint journals, default ~/.cache/bootstrap_system_disk/journal")
+    parser.add_argument('-rl', '--records_log', help="Append structured JSON-lines records (timestamp, stage, command, exit code, duration) of the run to this file")
+
+    parser.add_argument('-ps', '--profile_startup', '--profile-startup', dest='profile_startup', help="Print module import, argument parsing and config loading times", action='store_true')
+    parser.add_argument('-ncc', '--no_config_cache', help="Always parse/download the configuration instead of using the cache in ~/.cache/bootstrap_system_disk", action='store_true')
     parser.add_argument('-td', '--target_device', help="Manually specify the block device to target for partitioning and formatting")
     parser.add_argument('-m', '--mount', help="@chroot: Mount point for the system root, if not specified will use config.mount or /tmp/bootstrap_mount")
     parser.add_argument('-it', '--interactive', help="Asks whether to continue with certain operations", action='store_true')
+    parser.add_argument('-pf', '--parallel_format', help="@partitions: Format independent partitions concurrently and settle/verify them in one pass at the end", action='store_true')
+    parser.add_argument('-rbl', '--rebenchmark_luks', help="@partitions: Run 'cryptsetup benchmark' again for LUKS 'cipher: auto' instead of using the cached host results", action='store_true')
+    parser.add_argument('-mkp', '--mkfs_profile', help="@partitions: mkfs flags by device class, 'auto' detects it from /sys/block/*/queue, per partition 'mkfs_profile' or 'mkfs_options'", choices=['auto', 'none', *mkfs_device_profiles], default='auto')
+    parser.add_argument('-obs', '--offline_btrfs_subvolumes', help="@partitions: Create btrfs subvolumes in the mkfs.btrfs call ('--rootdir', '--subvol', btrfs-progs >= 6.7) instead of on a mounted filesystem, per partition 'offline_subvolumes'", action='store_true')
+    parser.add_argument('-inc', '--incremental', help="@partitions: Only apply the difference between the existing partitions/filesystems/subvolumes and the configuration", action='store_true')
+    parser.add_argument('-pb', '--partition_backend', help="@partitions: Write the GPT natively ('native', needs write access to the device) or through 'sfdisk'", choices=['native', 'sfdisk'], default='native')
+    parser.add_argument('-st', '--settle_timeout', help="Seconds to wait for partition nodes and filesystem signatures to appear after changing a disk", type=float, default=10)
+    parser.add_argument('-mb', '--mount_backend', help="'kernel': mount(2)/umount2(2) syscalls (requires root), 'shell': sudo mount, 'auto': kernel when running as root", choices=['auto', 'kernel', 'shell'], default='auto')
+    parser.add_argument('-mj', '--mount_jobs', help="@chroot: How many independent btrfs subvolumes are mounted concurrently", type=int, default=4)
+    parser.add_argument('-bns', '--bench_size', help="@bench: Size of the test file written per mounted partition/subvolume", default='256M')
+    parser.add_argument('-bnb', '--bench_block_size', help="@bench: Block size of the sequential read/write tests (random tests use 4K)", default='1M')
+    parser.add_argument('-bnq', '--bench_queue_depth', help="@bench: Concurrent outstanding I/O requests (threads)", type=int, default=4)
+    parser.add_argument('-bnt', '--bench_runtime', help="@bench: Seconds per random read/write test", type=float, default=5)
+    parser.add_argument('-bno', '--bench_output', help="@bench: JSON results file, default next to '--records_log' or in ~/.cache/bootstrap_system_disk/bench")
+    parser.add_argument('-j', '--jobs', help="Run stages without ordering constraints ('depends') concurrently on up to N workers", type=int, default=1)
     add_simulation_parsing_options(parser)
 
 
@@ -2052,9 +5912,12 @@ def main(parser: argparse.ArgumentParser | None = None):
         )
         add_bootstrap_parsing_options(parser)
 
+    parse_start_time: float = time.perf_counter()
     args: argparse.Namespace = parser.parse_args()
 
     config: dict[str, Any] = vars(args)
+    if config.get('profile_startup'):
+        print(f"Startup profile: module import {parse_start_time - module_load_start_time:.3f}s, argument parsing {time.perf_counter() - parse_start_time:.3f}s")
     bootstrap_defined_system(config)
 
 